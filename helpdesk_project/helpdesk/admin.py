@@ -1,10 +1,21 @@
 from django.contrib import admin
-from django.utils.html import format_html
-from .models import Direction, Problem, ProblemFile, Solution, SolutionFile
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from .models import Direction, Problem, ProblemFile, QueuedTask, Solution, SolutionFile
+
+
+def local_date(value, fmt='%d.%m.%Y'):
+    return timezone.localtime(value).strftime(fmt)
 
 
 @admin.register(Direction)
 class DirectionAdmin(admin.ModelAdmin):
+    # Не выполнять второй COUNT(*) по всей таблице ради надписи «из N» при фильтрации
+    show_full_result_count = False
     list_display = ['name', 'display_name', 'problems_count', 'created_problems', 'status_badge']
     list_filter = ['name']
     search_fields = ['name', 'display_name']
@@ -18,8 +29,16 @@ class DirectionAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        recent = Problem.objects.order_by('-created_at').only('id', 'title', 'created_at', 'direction_id')
+        return super().get_queryset(request).annotate(
+            problems_total=Count('problems')
+        ).prefetch_related(
+            Prefetch('problems', queryset=recent[:5], to_attr='recent_problems')
+        )
+
     def problems_count(self, obj):
-        count = obj.problems.count()
+        count = obj.problems_total
         url = f"/admin/helpdesk/problem/?direction__id__exact={obj.id}"
         return format_html(
             '<a href="{}" class="button" style="background: #28a745; color: white; padding: 3px 10px; border-radius: 3px;">{} проблем(ы)</a>',
@@ -27,21 +46,22 @@ class DirectionAdmin(admin.ModelAdmin):
 
     problems_count.short_description = 'Количество проблем'
     problems_count.allow_tags = True
+    problems_count.admin_order_field = 'problems_total'
 
     def created_problems(self, obj):
-        recent_problems = obj.problems.order_by('-created_at')[:5]
+        recent_problems = obj.recent_problems
         if recent_problems:
-            html = '<ul style="margin: 0; padding-left: 20px;">'
-            for problem in recent_problems:
-                html += f'<li><a href="/admin/helpdesk/problem/{problem.id}/change/">{problem.title}</a> <small>({problem.created_at | date:"d.m.Y"})</small></li>'
-            html += '</ul>'
-            return format_html(html)
+            items = format_html_join(
+                '', '<li><a href="/admin/helpdesk/problem/{}/change/">{}</a> <small>({})</small></li>',
+                ((problem.id, problem.title, local_date(problem.created_at)) for problem in recent_problems)
+            )
+            return format_html('<ul style="margin: 0; padding-left: 20px;">{}</ul>', items)
         return format_html('<span style="color: #999;">Нет проблем</span>')
 
     created_problems.short_description = 'Последние проблемы'
 
     def status_badge(self, obj):
-        if obj.problems.exists():
+        if obj.problems_total:
             return format_html(
                 '<span style="background: #28a745; color: white; padding: 3px 10px; border-radius: 3px;">Активно</span>')
         return format_html(
@@ -52,20 +72,20 @@ class DirectionAdmin(admin.ModelAdmin):
     actions = ['duplicate_direction', 'clear_problems']
 
     def duplicate_direction(self, request, queryset):
-        for direction in queryset:
-            direction.pk = None
-            direction.name = f"{direction.name}_copy"
-            direction.display_name = f"{direction.display_name} (копия)"
-            direction.save()
-        self.message_user(request, f"Создано {queryset.count()} копий направлений")
+        copies = [
+            Direction(name=f"{name}_copy", display_name=f"{display_name} (копия)")
+            for name, display_name in queryset.values_list('name', 'display_name')
+        ]
+        # Копию направления, скопированного раньше, второй раз не создаем
+        existing = set(Direction.objects.filter(name__in=[copy.name for copy in copies]).values_list('name', flat=True))
+        created = Direction.objects.bulk_create([copy for copy in copies if copy.name not in existing])
+        self.message_user(request, f"Создано {len(created)} копий направлений")
 
     duplicate_direction.short_description = "Создать копию выбранных направлений"
 
     def clear_problems(self, request, queryset):
-        for direction in queryset:
-            count = direction.problems.count()
-            direction.problems.all().delete()
-            self.message_user(request, f"Удалено {count} проблем из направления {direction.display_name}")
+        count = Problem.objects.filter(direction__in=queryset.values('pk')).bulk_delete()
+        self.message_user(request, f"Удалено {count} проблем из выбранных направлений")
 
     clear_problems.short_description = "Удалить все проблемы в выбранных направлениях"
 
@@ -84,9 +104,10 @@ class ProblemFileInline(admin.TabularInline):
     def file_preview(self, obj):
         if obj.file:
             file_ext = obj.file.name.split('.')[-1].lower()
-            if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+            if obj.is_image():
+                # Маленькая миниатюра вместо полноразмерного оригинала
                 return format_html('<img src="{}" style="max-height: 50px; max-width: 50px; border-radius: 3px;" />',
-                                   obj.file.url)
+                                   obj.thumbnail_url('small'))
             else:
                 return format_html(
                     '<span style="background: #17a2b8; color: white; padding: 2px 8px; border-radius: 3px;">📎 {}</span>',
@@ -96,32 +117,73 @@ class ProblemFileInline(admin.TabularInline):
     file_preview.short_description = 'Предпросмотр'
 
 
+class SolutionInlineFormSet(BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        accepted = [
+            form for form in self.forms
+            if form.cleaned_data.get('is_accepted') and not form.cleaned_data.get('DELETE')
+        ]
+        if len(accepted) > 1:
+            raise ValidationError('Принятым может быть только одно решение')
+        self.accepted = accepted[0].instance if accepted else None
+
+    def save(self, commit=True):
+        # Строки сохраняются по порядку — снимаем прежнюю отметку заранее,
+        # чтобы не нарушить ограничение уникальности принятого решения
+        if self.accepted is not None:
+            Solution.objects.filter(problem=self.instance, is_accepted=True).exclude(
+                pk=self.accepted.pk).update(is_accepted=False)
+        return super().save(commit)
+
+
 class SolutionInline(admin.TabularInline):
     model = Solution
+    formset = SolutionInlineFormSet
     extra = 0
     fields = ['description_short', 'author', 'created_at', 'is_accepted', 'files_count']
     readonly_fields = ['description_short', 'author', 'created_at', 'files_count']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author', 'problem').annotate(files_total=Count('files'))
+
     def description_short(self, obj):
         return obj.description[:100] + '...' if len(obj.description) > 100 else obj.description
 
     description_short.short_description = 'Описание'
 
     def files_count(self, obj):
-        count = obj.files.count()
+        count = obj.files_total
         return format_html(
             '<span style="background: #007bff; color: white; padding: 2px 8px; border-radius: 10px;">{}</span>', count)
 
     files_count.short_description = 'Файлов'
 
 
+class SolvedStatusFilter(admin.SimpleListFilter):
+    title = 'Статус'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return [('solved', 'Решено'), ('unsolved', 'Не решено')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'solved':
+            return queryset.solved()
+        if self.value() == 'unsolved':
+            return queryset.unsolved()
+        return queryset
+
+
 @admin.register(Problem)
 class ProblemAdmin(admin.ModelAdmin):
+    show_full_result_count = False
     list_display = ['title', 'direction', 'author', 'created_at', 'solutions_count', 'has_files', 'status_badge']
-    list_filter = ['direction', 'created_at', 'author']
+    list_filter = ['direction', SolvedStatusFilter, 'created_at', 'author']
     search_fields = ['title', 'description', 'author__username']
     readonly_fields = ['author', 'created_at', 'updated_at', 'solutions_list']
     list_per_page = 25
+    list_select_related = ['direction', 'author']
     date_hierarchy = 'created_at'
 
     fieldsets = (
@@ -142,9 +204,8 @@ class ProblemAdmin(admin.ModelAdmin):
     inlines = [ProblemFileInline, SolutionInline]
 
     def solutions_count(self, obj):
-        count = obj.solutions.count()
-        accepted = obj.solutions.filter(is_accepted=True).count()
-        if accepted > 0:
+        count = obj.solutions_count
+        if obj.is_solved:
             return format_html(
                 '<span style="background: #28a745; color: white; padding: 3px 8px; border-radius: 3px;">{} ✅</span>',
                 count)
@@ -152,9 +213,10 @@ class ProblemAdmin(admin.ModelAdmin):
             '<span style="background: #ffc107; color: black; padding: 3px 8px; border-radius: 3px;">{}</span>', count)
 
     solutions_count.short_description = 'Решения'
+    solutions_count.admin_order_field = 'solutions_count'
 
     def has_files(self, obj):
-        count = obj.files.count()
+        count = obj.files_count
         if count > 0:
             return format_html(
                 '<span style="background: #17a2b8; color: white; padding: 3px 8px; border-radius: 3px;">📎 {}</span>',
@@ -162,66 +224,62 @@ class ProblemAdmin(admin.ModelAdmin):
         return format_html('<span style="color: #999;">Нет</span>')
 
     has_files.short_description = 'Файлы'
+    has_files.admin_order_field = 'files_count'
 
     def status_badge(self, obj):
-        if obj.solutions.filter(is_accepted=True).exists():
+        if obj.is_solved:
             return format_html(
                 '<span style="background: #28a745; color: white; padding: 5px 10px; border-radius: 3px;">Решено</span>')
-        elif obj.solutions.exists():
+        elif obj.solutions_count:
             return format_html(
                 '<span style="background: #ffc107; color: black; padding: 5px 10px; border-radius: 3px;">В работе</span>')
         return format_html(
             '<span style="background: #dc3545; color: white; padding: 5px 10px; border-radius: 3px;">Нет решений</span>')
 
     status_badge.short_description = 'Статус'
+    status_badge.admin_order_field = 'accepted_solution'
 
     def solutions_list(self, obj):
-        solutions = obj.solutions.all()
+        solutions = obj.solutions.select_related('author')
         if not solutions:
             return "Нет решений"
 
-        html = '<table style="width: 100%; border-collapse: collapse;">'
-        html += '<tr style="background: #f8f9fa;"><th>Автор</th><th>Описание</th><th>Дата</th><th>Статус</th></tr>'
-        for solution in solutions:
-            bg_color = '#d4edda' if solution.is_accepted else 'transparent'
-            html += f'<tr style="background: {bg_color};">'
-            html += f'<td style="padding: 5px; border: 1px solid #dee2e6;">{solution.author}</td>'
-            html += f'<td style="padding: 5px; border: 1px solid #dee2e6;">{solution.description[:100]}...</td>'
-            html += f'<td style="padding: 5px; border: 1px solid #dee2e6;">{solution.created_at | date:"d.m.Y H:i"}</td>'
-            html += f'<td style="padding: 5px; border: 1px solid #dee2e6;">{"✅ Принято" if solution.is_accepted else "⏳ Ожидает"}</td>'
-            html += '</tr>'
-        html += '</table>'
-        return format_html(html)
+        cell = '<td style="padding: 5px; border: 1px solid #dee2e6;">{}</td>'
+        rows = format_html_join(
+            '', '<tr style="background: {};">' + cell * 4 + '</tr>',
+            ((
+                '#d4edda' if solution.is_accepted else 'transparent',
+                solution.author,
+                f'{solution.description[:100]}...',
+                local_date(solution.created_at, '%d.%m.%Y %H:%M'),
+                "✅ Принято" if solution.is_accepted else "⏳ Ожидает",
+            ) for solution in solutions)
+        )
+        return format_html(
+            '<table style="width: 100%; border-collapse: collapse;">'
+            '<tr style="background: #f8f9fa;"><th>Автор</th><th>Описание</th><th>Дата</th><th>Статус</th></tr>'
+            '{}</table>', rows)
 
     solutions_list.short_description = 'Список решений'
 
     actions = ['mark_as_solved', 'mark_as_unsolved', 'delete_solutions']
 
     def mark_as_solved(self, request, queryset):
-        for problem in queryset:
-            if problem.solutions.exists():
-                # Отмечаем первое решение как принятое
-                first_solution = problem.solutions.first()
-                problem.solutions.update(is_accepted=False)
-                first_solution.is_accepted = True
-                first_solution.save()
-        self.message_user(request, f"Отмечено {queryset.count()} проблем как решенные")
+        # Первое решение каждой проблемы (уже принятое или самое новое) — одним набором запросов
+        count = Solution.objects.filter(problem__in=queryset).accept()
+        self.message_user(request, f"Отмечено {count} проблем как решенные")
 
     mark_as_solved.short_description = "Отметить как решенные (первым решением)"
 
     def mark_as_unsolved(self, request, queryset):
-        for problem in queryset:
-            problem.solutions.update(is_accepted=False)
-        self.message_user(request, f"Отмечено {queryset.count()} проблем как нерешенные")
+        # У проблемы одно принятое решение, поэтому число снятых отметок — число проблем
+        count = Solution.objects.filter(problem__in=queryset).unaccept()
+        self.message_user(request, f"Отмечено {count} проблем как нерешенные")
 
     mark_as_unsolved.short_description = "Снять отметку о решении"
 
     def delete_solutions(self, request, queryset):
-        total = 0
-        for problem in queryset:
-            count = problem.solutions.count()
-            total += count
-            problem.solutions.all().delete()
+        total = Solution.objects.filter(problem__in=queryset.values('pk')).bulk_delete()
         self.message_user(request, f"Удалено {total} решений")
 
     delete_solutions.short_description = "Удалить все решения выбранных проблем"
@@ -231,6 +289,15 @@ class ProblemAdmin(admin.ModelAdmin):
             obj.author = request.user
         super().save_model(request, obj, form, change)
 
+    def delete_queryset(self, request, queryset):
+        # Действие «Удалить выбранные»: без загрузки и сигналов на каждую проблему
+        queryset.bulk_delete()
+
+    def save_related(self, request, form, formsets, change):
+        # Инлайны могли добавить или удалить файлы и решения
+        super().save_related(request, form, formsets, change)
+        form.instance.refresh_counters(touch=True)
+
 
 class SolutionFileInline(admin.TabularInline):
     model = SolutionFile
@@ -241,9 +308,10 @@ class SolutionFileInline(admin.TabularInline):
     def file_preview(self, obj):
         if obj.file:
             file_ext = obj.file.name.split('.')[-1].lower()
-            if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+            if obj.is_image():
+                # Маленькая миниатюра вместо полноразмерного оригинала
                 return format_html('<img src="{}" style="max-height: 50px; max-width: 50px; border-radius: 3px;" />',
-                                   obj.file.url)
+                                   obj.thumbnail_url('small'))
             else:
                 return format_html(
                     '<span style="background: #17a2b8; color: white; padding: 2px 8px; border-radius: 3px;">📎 {}</span>',
@@ -255,11 +323,15 @@ class SolutionFileInline(admin.TabularInline):
 
 @admin.register(Solution)
 class SolutionAdmin(admin.ModelAdmin):
+    show_full_result_count = False
     list_display = ['problem_link', 'author', 'created_at', 'is_accepted', 'files_count']
     list_filter = ['is_accepted', 'created_at', 'author']
     search_fields = ['description', 'problem__title', 'author__username']
     readonly_fields = ['author', 'created_at']
     list_per_page = 25
+    list_select_related = ['problem', 'author']
+    # Выпадающий список всех проблем строил бы str() (с автором) для каждой записи
+    autocomplete_fields = ['problem']
     inlines = [SolutionFileInline]
 
     fieldsets = (
@@ -272,6 +344,10 @@ class SolutionAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # select_related нужен и странице редактирования: там str(solution) обращается к problem и author
+        return super().get_queryset(request).select_related('problem', 'author').annotate(files_total=Count('files'))
+
     def problem_link(self, obj):
         return format_html('<a href="/admin/helpdesk/problem/{}/change/">{}</a>',
                            obj.problem.id, obj.problem.title)
@@ -279,32 +355,72 @@ class SolutionAdmin(admin.ModelAdmin):
     problem_link.short_description = 'Проблема'
 
     def files_count(self, obj):
-        count = obj.files.count()
+        count = obj.files_total
         return format_html(
             '<span style="background: #17a2b8; color: white; padding: 2px 8px; border-radius: 10px;">📎 {}</span>',
             count)
 
     files_count.short_description = 'Файлы'
+    files_count.admin_order_field = 'files_total'
 
     actions = ['accept_solutions', 'unaccept_solutions']
 
     def accept_solutions(self, request, queryset):
-        for solution in queryset:
-            # Снимаем отметку с других решений этой проблемы
-            solution.problem.solutions.exclude(id=solution.id).update(is_accepted=False)
-            solution.is_accepted = True
-            solution.save()
-        self.message_user(request, f"Отмечено {queryset.count()} решений как принятые")
+        # Принятым может быть только одно решение проблемы: из нескольких выбранных — самое новое
+        count = queryset.accept()
+        self.message_user(request, f"Отмечены принятые решения в {count} проблемах")
 
     accept_solutions.short_description = "Отметить как принятые решения"
 
     def unaccept_solutions(self, request, queryset):
-        queryset.update(is_accepted=False)
-        self.message_user(request, f"Снята отметка с {queryset.count()} решений")
+        count = queryset.unaccept()
+        self.message_user(request, f"Снята отметка с {count} решений")
 
     unaccept_solutions.short_description = "Снять отметку о принятии"
 
+    @transaction.atomic
     def save_model(self, request, obj, form, change):
         if not change:
             obj.author = request.user
+        if obj.is_accepted:
+            # Снимаем отметку с другого решения до сохранения, иначе сработает ограничение уникальности
+            Solution.objects.filter(problem_id=obj.problem_id, is_accepted=True).exclude(
+                pk=obj.pk).update(is_accepted=False)
         super().save_model(request, obj, form, change)
+        # Решение могли перенести в другую проблему — пересчитываем обе
+        problem_ids = {obj.problem_id, form.initial.get('problem')} - {None}
+        Problem.objects.filter(id__in=problem_ids).refresh_counters(touch=True)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        problem_id = obj.problem_id
+        super().delete_model(request, obj)
+        Problem.objects.filter(id=problem_id).refresh_counters(touch=True)
+
+    def delete_queryset(self, request, queryset):
+        # Действие «Удалить выбранные»: без загрузки и сигналов на каждое решение
+        queryset.bulk_delete()
+
+
+@admin.register(QueuedTask)
+class QueuedTaskAdmin(admin.ModelAdmin):
+    show_full_result_count = False
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name']
+    readonly_fields = ['name', 'args', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by',
+                       'locked_until', 'last_error', 'created_at', 'finished_at']
+    ordering = ['-id']
+    list_per_page = 50
+
+    actions = ['retry_tasks']
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_tasks(self, request, queryset):
+        count = queryset.exclude(status=QueuedTask.RUNNING).update(
+            status=QueuedTask.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None, last_error='')
+        self.message_user(request, f"Поставлено в очередь повторно: {count}")
+
+    retry_tasks.short_description = "Выполнить повторно"
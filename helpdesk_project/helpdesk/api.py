@@ -0,0 +1,232 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_safe
+
+from .cache import direction_scope, get_scope_version, SCOPE_ALL
+from .models import Problem, ProblemFile, Solution, SolutionFile
+
+# JSON API только для чтения: ленты и карточки проблем, решения, направления, вложения.
+#
+# Поля ответа выбирает клиент: ?fields=id,title для основного ресурса и
+# fields[solution]=..., fields[attachment]=... для вложенных. Связанные объекты
+# загружаются (prefetch) только если их поля запрошены. Валидаторы (ETag, Last-Modified)
+# считаются до сериализации — на условный запрос с совпавшим ETag отвечаем 304 без неё.
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _attachment_size(attachment):
+    return attachment.blob.size if attachment.blob_id else None
+
+
+def _thumbnail(attachment):
+    return attachment.thumbnail_url() if attachment.is_image() else None
+
+
+class Resource:
+    def __init__(self, name, fields, default):
+        self.name = name
+        self.fields = fields
+        self.default = default
+
+    def requested_fields(self, request, top_level=False, default=None):
+        raw = request.GET.get(f'fields[{self.name}]')
+        if raw is None and top_level:
+            raw = request.GET.get('fields')
+        if not raw:
+            return default or self.default
+        fields = [field.strip() for field in raw.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ApiError(f'Неизвестные поля {self.name}: {", ".join(unknown)}')
+        return fields
+
+    def serialize(self, obj, fields, request):
+        return {field: self.fields[field](obj, request) for field in fields}
+
+
+ATTACHMENT = Resource('attachment', {
+    'id': lambda obj, request: obj.pk,
+    'name': lambda obj, request: obj.filename(),
+    'size': lambda obj, request: _attachment_size(obj),
+    'uploaded_at': lambda obj, request: obj.uploaded_at,
+    'url': lambda obj, request: request.build_absolute_uri(obj.get_absolute_url()),
+    'thumbnail': lambda obj, request: _thumbnail(obj),
+}, ['id', 'name', 'size', 'url'])
+
+
+def _attachments(obj, request):
+    fields = ATTACHMENT.requested_fields(request)
+    return [ATTACHMENT.serialize(attachment, fields, request) for attachment in obj.files.all()]
+
+
+SOLUTION = Resource('solution', {
+    'id': lambda obj, request: obj.pk,
+    'problem': lambda obj, request: obj.problem_id,
+    'description': lambda obj, request: obj.description,
+    'author': lambda obj, request: obj.author.username,
+    'created_at': lambda obj, request: obj.created_at,
+    'is_accepted': lambda obj, request: obj.is_accepted,
+    'files': _attachments,
+}, ['id', 'description', 'author', 'created_at', 'is_accepted'])
+
+
+def _solutions(obj, request):
+    fields = SOLUTION.requested_fields(request)
+    return [SOLUTION.serialize(solution, fields, request) for solution in obj.solutions.all()]
+
+
+PROBLEM = Resource('problem', {
+    'id': lambda obj, request: obj.pk,
+    'title': lambda obj, request: obj.title,
+    'description': lambda obj, request: obj.description,
+    'direction': lambda obj, request: obj.direction_id,
+    'author': lambda obj, request: obj.author.username,
+    'created_at': lambda obj, request: obj.created_at,
+    'updated_at': lambda obj, request: obj.updated_at,
+    'last_activity_at': lambda obj, request: obj.last_activity_at,
+    'solutions_count': lambda obj, request: obj.solutions_count,
+    'files_count': lambda obj, request: obj.files_count,
+    'accepted_solution': lambda obj, request: obj.accepted_solution_id,
+    'is_solved': lambda obj, request: obj.is_solved,
+    'url': lambda obj, request: request.build_absolute_uri(reverse('problem_detail', args=[obj.pk])),
+    'files': _attachments,
+    'solutions': _solutions,
+}, ['id', 'title', 'direction', 'author', 'created_at', 'updated_at', 'solutions_count', 'is_solved'])
+
+# Карточка проблемы по умолчанию отдает то же, что страница problem_detail
+PROBLEM_DETAIL_FIELDS = PROBLEM.default + ['description', 'accepted_solution', 'files', 'solutions']
+
+
+DIRECTION = Resource('direction', {
+    'id': lambda obj, request: obj.pk,
+    'name': lambda obj, request: obj.name,
+    'display_name': lambda obj, request: obj.display_name,
+}, ['id', 'name', 'display_name'])
+
+
+def _files_prefetch(lookup, model):
+    return Prefetch(lookup, queryset=model.objects.select_related('blob').order_by('uploaded_at', 'id'))
+
+
+def prefetch_problems(problems, request, fields):
+    """Загружает решения и файлы проблем, только если их поля запрошены."""
+    lookups = []
+    if 'files' in fields:
+        lookups.append(_files_prefetch('files', ProblemFile))
+    if 'solutions' in fields:
+        lookups.append(Prefetch('solutions', queryset=Solution.objects.select_related('author')
+                                .order_by('-is_accepted', '-created_at', '-id')))
+        if 'files' in SOLUTION.requested_fields(request):
+            lookups.append(_files_prefetch('solutions__files', SolutionFile))
+    if lookups:
+        prefetch_related_objects(problems, *lookups)
+
+
+def prefetch_solutions(solutions, request, fields):
+    if 'files' in fields:
+        prefetch_related_objects(solutions, _files_prefetch('files', SolutionFile))
+
+
+def page_size(request):
+    try:
+        limit = int(request.GET.get('limit', settings.HELPDESK_API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('Некорректный limit')
+    return min(max(limit, 1), settings.HELPDESK_API_MAX_PAGE_SIZE)
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def list_etag(request, direction_id=None):
+    """
+    ETag ленты — отпечаток проблем из БД (ProblemQuerySet.change_marker, один запрос
+    агрегатов вместо сериализации), версия области кэша и параметры запроса.
+    """
+    problems = Problem.objects.all()
+    scope = SCOPE_ALL
+    if direction_id:
+        problems = problems.filter(direction_id=direction_id)
+        scope = direction_scope(direction_id)
+    return quote_etag(_digest(problems.change_marker(), get_scope_version(scope), request.get_full_path()))
+
+
+def rows_etag(request, rows):
+    """ETag небольшого списка, уже загруженного из БД (направления)."""
+    return quote_etag(_digest(rows, request.get_full_path()))
+
+
+def problem_etag(request, problem):
+    # Принятие, правка и удаление решений обновляют last_activity_at (refresh_counters(touch=True))
+    version = get_scope_version(direction_scope(problem.direction_id))
+    return quote_etag(_digest(problem.pk, problem.updated_at.isoformat(), problem.last_activity_at,
+                              version, request.get_full_path()))
+
+
+def problem_last_modified(problem):
+    return max(filter(None, [problem.updated_at, problem.last_activity_at]))
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Ответ можно хранить, но перед использованием клиент обязан его перепроверить
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """Ответ 304 на If-None-Match/If-Modified-Since или None, если нужно отдать данные."""
+    # Last-Modified передается с точностью до секунды — так же и сравниваем
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None)
+    if response is not None:
+        _set_validators(response, etag, last_modified)
+    return response
+
+
+def json_response(data, etag, last_modified=None):
+    return _set_validators(JsonResponse(data, json_dumps_params={'ensure_ascii': False}), etag, last_modified)
+
+
+def page_data(request, page, items):
+    """Тело ответа ленты: объекты и ссылки на соседние страницы по курсору."""
+    def link(cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return request.build_absolute_uri(f'{request.path}?{urlencode(list(params.lists()), doseq=True)}')
+
+    return {'results': items, 'next': link(page.next_cursor), 'previous': link(page.previous_cursor)}
+
+
+def api_view(view_func):
+    """Только GET/HEAD, сжатие gzip и ошибки в виде JSON."""
+    @gzip_page
+    @require_safe
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({'error': 'Не найдено'}, status=404)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=e.status, json_dumps_params={'ensure_ascii': False})
+    return wrapper
@@ -0,0 +1,442 @@
+import os
+import random
+import sqlite3
+import statistics
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.base import ContentFile
+from django.core.paginator import Paginator
+from django.db import OperationalError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.template import Engine, RequestContext
+from django.template.backends.django import get_installed_libraries
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .cache import get_cache
+from .forms import SearchForm
+from .models import Blob, Direction, Problem, ProblemFile, Solution, SolutionFile
+from .search import get_search_backend
+from .storage import blob_hash, select_storage
+
+# Синтетические данные и замеры представлений для поиска регрессий производительности.
+# Запускается командой manage.py benchmark на отдельной тестовой базе.
+
+BATCH_SIZE = 2000
+
+WORDS = [
+    'принтер', 'печать', 'сканер', 'драйвер', 'компьютер', 'монитор', 'клавиатура', 'мышь',
+    'сеть', 'интернет', 'почта', 'пароль', 'учетная', 'запись', 'обновление', 'ошибка',
+    'зарплата', 'отпуск', 'больничный', 'отчет', 'проводка', 'справочник', 'база', 'выгрузка',
+    'телефон', 'гарнитура', 'звонок', 'камера', 'запись', 'регистратор', 'диск', 'видео',
+    'не', 'работает', 'медленно', 'зависает', 'после', 'перезагрузки', 'в', 'кабинете',
+]
+
+
+def _sentence(rng, words, limit):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()[:limit]
+
+
+def _spread_dates(model, step_seconds):
+    """auto_now_add не дает задать дату в bulk_create — раздвигаем даты одним UPDATE по id."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"UPDATE {table} SET created_at = datetime(created_at, "
+                f"'-' || (((SELECT MAX(id) FROM {table}) - id) * %s) || ' seconds')", [step_seconds]
+            )
+        else:
+            cursor.execute(
+                f"UPDATE {table} SET created_at = created_at - ((SELECT MAX(id) FROM {table}) - id) "
+                f"* %s * interval '1 second'", [step_seconds]
+            )
+
+
+def _create_blobs():
+    storage = select_storage()
+    blobs = []
+    for filename, content in (('error.log', b'Traceback\n' * 200), ('settings.txt', b'key=value\n' * 50)):
+        name = storage.save(filename, ContentFile(content))
+        blob, _ = Blob.objects.get_or_create(sha256=blob_hash(name), defaults={'name': name, 'size': len(content)})
+        blobs.append((blob, filename))
+    return blobs
+
+
+def generate_data(problems=10000, directions=7, users=50, solutions=3, files=1, seed=0, stdout=None):
+    """
+    Создает справочник направлений, пользователей, problems проблем, в среднем
+    solutions решений и files файлов на проблему. Данные вставляются пачками
+    через bulk_create, счетчики и поисковый индекс пересчитываются в конце.
+    """
+    rng = random.Random(seed)
+
+    direction_objects = [
+        Direction.objects.get_or_create(name=name, defaults={'display_name': display_name})[0]
+        for name, display_name in Direction.DIRECTIONS[:directions]
+    ]
+
+    password = make_password('benchmark')
+    User.objects.bulk_create([
+        User(username=f'bench{i}', password=password, is_staff=i % 10 == 0, is_active=i % 20 != 0)
+        for i in range(users)
+    ], ignore_conflicts=True)
+    user_ids = list(User.objects.filter(username__startswith='bench').values_list('id', flat=True))
+    blobs = _create_blobs() if files else []
+    file_refs = {blob.pk: 0 for blob, _ in blobs}
+
+    created = 0
+    while created < problems:
+        size = min(BATCH_SIZE, problems - created)
+        with transaction.atomic():
+            batch = Problem.objects.bulk_create([
+                Problem(
+                    title=_sentence(rng, rng.randint(3, 7), 200),
+                    description=_sentence(rng, rng.randint(10, 30), 300),
+                    direction=rng.choice(direction_objects),
+                    author_id=rng.choice(user_ids),
+                )
+                for _ in range(size)
+            ])
+
+            solution_objects = []
+            for problem in batch:
+                count = rng.randint(0, solutions * 2)
+                accepted = rng.randrange(count) if count and rng.random() < 0.5 else None
+                solution_objects.extend(
+                    Solution(
+                        problem=problem,
+                        description=_sentence(rng, rng.randint(10, 60), 800),
+                        author_id=rng.choice(user_ids),
+                        is_accepted=index == accepted,
+                    )
+                    for index in range(count)
+                )
+            solution_objects = Solution.objects.bulk_create(solution_objects)
+
+            if blobs:
+                problem_files, solution_files = [], []
+                for problem in batch:
+                    for _ in range(rng.randint(0, files * 2)):
+                        blob, filename = rng.choice(blobs)
+                        problem_files.append(ProblemFile(problem=problem, file=blob.name, blob=blob,
+                                                         original_name=filename))
+                        file_refs[blob.pk] += 1
+                for solution in rng.sample(solution_objects, len(solution_objects) // 10):
+                    blob, filename = rng.choice(blobs)
+                    solution_files.append(SolutionFile(solution=solution, file=blob.name, blob=blob,
+                                                       original_name=filename))
+                    file_refs[blob.pk] += 1
+                ProblemFile.objects.bulk_create(problem_files)
+                SolutionFile.objects.bulk_create(solution_files)
+
+        created += size
+        if stdout:
+            stdout.write(f'  проблем: {created}/{problems}')
+
+    for blob_id, refs in file_refs.items():
+        Blob.objects.filter(pk=blob_id).update(ref_count=refs)
+
+    _spread_dates(Problem, 600)
+    _spread_dates(Solution, 200)
+    Problem.objects.refresh_counters()
+    get_search_backend().rebuild(Problem.objects.prefetch_related('solutions').iterator(chunk_size=500))
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def endpoints():
+    """(имя, URL) измеряемых страниц на текущих данных."""
+    problem = Problem.objects.order_by('-solutions_count', '-id').first()
+    direction = Direction.objects.first()
+    solution = Solution.objects.order_by('-id').first()
+    pages = max(1, Problem.objects.count() // 6)
+
+    result = [
+        ('problem_list', reverse('problem_list')),
+        ('problem_list_search', reverse('problem_list') + '?query=принтер+не+работает'),
+        ('problem_list_direction', f"{reverse('problem_list')}?direction={direction.pk}&status=unsolved"),
+        ('problem_list_deep_page', f"{reverse('problem_list')}?page={pages // 2 or 1}"),
+        ('employee_list', reverse('employee_list')),
+        ('admin_problem_changelist', reverse('admin:helpdesk_problem_changelist')),
+        ('admin_solution_changelist', reverse('admin:helpdesk_solution_changelist')),
+        ('admin_direction_changelist', reverse('admin:helpdesk_direction_changelist')),
+    ]
+    if problem is not None:
+        result += [
+            ('problem_detail', reverse('problem_detail', args=[problem.pk])),
+            ('admin_problem_change', reverse('admin:helpdesk_problem_change', args=[problem.pk])),
+        ]
+    if solution is not None:
+        result.append(('admin_solution_change', reverse('admin:helpdesk_solution_change', args=[solution.pk])))
+    return result
+
+
+def measure(client, url, repeat=20, warm_cache=False):
+    """Задержки по repeat запросам и отдельный проход для числа запросов к БД и пика памяти."""
+    cache = get_cache()
+    client.get(url)  # прогрев: импорт модулей, компиляция шаблонов
+
+    latencies = []
+    status = None
+    for _ in range(repeat):
+        if not warm_cache:
+            cache.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - started)
+        status = response.status_code
+
+    if not warm_cache:
+        cache.clear()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'url': url,
+        'status': status,
+        'repeat': repeat,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+        'queries': len(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(repeat=20, warm_cache=False, only=None):
+    user, _ = User.objects.get_or_create(username='bench_admin', defaults={'is_staff': True, 'is_superuser': True})
+    client = Client()
+    client.force_login(user)
+
+    results = {}
+    for name, url in endpoints():
+        if only and name not in only:
+            continue
+        results[name] = measure(client, url, repeat, warm_cache)
+    return results
+
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def _template_engine(cached_loader):
+    options = settings.TEMPLATES[0]
+    loaders = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)] if cached_loader else TEMPLATE_LOADERS
+    return Engine(dirs=options['DIRS'], loaders=loaders, libraries=get_installed_libraries(),
+                  context_processors=options['OPTIONS']['context_processors'])
+
+
+def render_benchmark(cards=(6, 50), repeat=30):
+    """
+    Время загрузки и рендеринга problem_list.html (p50, мс) на странице из cards карточек:
+    parse — шаблоны разбираются заново на каждый рендеринг, loader_cache — кэш
+    скомпилированных шаблонов, fragment_cache — кэш шаблонов и прогретый кэш карточек.
+    """
+    request = RequestFactory().get(reverse('problem_list'))
+    request.user = AnonymousUser()
+    card_timeout = settings.HELPDESK_CARD_CACHE_TIMEOUT or 3600
+    modes = {'parse': (False, 0), 'loader_cache': (True, 0), 'fragment_cache': (True, card_timeout)}
+    directions = list(Direction.objects.all())
+
+    results = {}
+    for count in cards:
+        problems = Problem.objects.select_related('author', 'direction').order_by('-created_at', '-id')
+        page = Paginator(problems, count).page(1)
+        page.object_list = list(page.object_list)
+        page.paginator.count  # COUNT(*) не должен попасть в замер
+
+        results[count] = {}
+        for mode, (cached_loader, timeout) in modes.items():
+            engine = _template_engine(cached_loader)
+            context = {
+                'problems': page,
+                'search_form': SearchForm(),
+                'directions': directions,
+                'params': '',
+                'card_cache': settings.HELPDESK_CACHE_ALIAS,
+                'card_cache_timeout': timeout,
+            }
+            get_cache().clear()
+
+            def render():
+                return engine.get_template('helpdesk/problem_list.html').render(RequestContext(request, context))
+
+            render()  # прогрев: кэш шаблонов и карточек
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                render()
+                timings.append(time.perf_counter() - started)
+            results[count][mode] = round(percentile(timings, 50) * 1000, 3)
+    return results
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE problem (id INTEGER PRIMARY KEY, title TEXT, created_at TEXT, solutions_count INTEGER);
+CREATE INDEX problem_feed ON problem (created_at DESC, id DESC);
+CREATE TABLE solution (id INTEGER PRIMARY KEY, problem_id INTEGER, description TEXT, created_at TEXT);
+CREATE INDEX solution_problem ON solution (problem_id, created_at DESC);
+CREATE TABLE session (session_key TEXT PRIMARY KEY, session_data TEXT, expire_date TEXT);
+"""
+
+
+def _sqlite_database(alias, path, tuned):
+    """
+    Настройки базы для замера: те же OPTIONS, что в продакшене (HELPDESK_SQLITE_OPTIONS —
+    init_command с прагмами и BEGIN IMMEDIATE), иначе — SQLite в Django по умолчанию.
+    """
+    # configure_settings дополняет словарь значениями по умолчанию (и требует 'default')
+    return connections.configure_settings({'default': {}, alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': dict(settings.HELPDESK_SQLITE_OPTIONS) if tuned else {},
+    }})[alias]
+
+
+def _sqlite_connect(alias, database):
+    # Соединение потока под временным alias: transaction.atomic(using=alias) работает как обычно
+    connections[alias] = load_backend(database['ENGINE']).DatabaseWrapper(database, alias)
+
+
+def _sqlite_disconnect(alias):
+    connections[alias].close()
+    del connections[alias]
+
+
+def _sqlite_prepare(path, problems, sessions):
+    # Схема и данные — не часть замера, создаем их прямым соединением
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript(SQLITE_SCHEMA)
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO problem VALUES (?, ?, datetime(\'now\', ? || \' minutes\'), 0)',
+                     [(i, f'Проблема {i}', -i) for i in range(1, problems + 1)])
+    conn.executemany('INSERT INTO session VALUES (?, ?, datetime(\'now\', \'+14 days\'))',
+                     [(f'key{i}', 'x' * 200) for i in range(sessions)])
+    conn.execute('COMMIT')
+    conn.close()
+
+
+def sqlite_concurrency(path, tuned, readers=8, writers=2, seconds=5.0, problems=5000, session_writes=True):
+    """
+    Смешанная нагрузка на файл SQLite: readers потоков читают ленту и решения проблемы
+    (и сохраняют сессию, как при SESSION_SAVE_EVERY_REQUEST), writers потоков добавляют
+    решения с обновлением счетчика. tuned — прагмы HELPDESK_SQLITE_PRAGMAS и BEGIN IMMEDIATE,
+    иначе режим SQLite по умолчанию. Соединения и транзакции — через бэкенд Django
+    (см. _sqlite_database). Возвращает пропускную способность и число ошибок блокировки.
+    """
+    _sqlite_prepare(path, problems, readers)
+    alias = f'sqlite_benchmark_{"tuned" if tuned else "default"}'
+    database = _sqlite_database(alias, path, tuned)
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+    totals = {'reads': 0, 'writes': 0, 'locked': 0}
+    write_latencies = []
+
+    def execute(statements):
+        with connections[alias].cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+
+    def atomic(statements):
+        # BEGIN или BEGIN IMMEDIATE выбирает transaction_mode из OPTIONS
+        with transaction.atomic(using=alias):
+            execute(statements)
+
+    def reader(number):
+        rng = random.Random(number)
+        _sqlite_connect(alias, database)
+        reads = locked = 0
+        while time.perf_counter() < deadline:
+            try:
+                execute([
+                    ('SELECT id, title, solutions_count FROM problem '
+                     'ORDER BY created_at DESC, id DESC LIMIT 6 OFFSET %s', [rng.randrange(problems // 6) * 6]),
+                    ('SELECT id, description FROM solution WHERE problem_id = %s '
+                     'ORDER BY created_at DESC', [rng.randint(1, problems)]),
+                ])
+                if session_writes:
+                    atomic([
+                        ('SELECT session_data FROM session WHERE session_key = %s', [f'key{number}']),
+                        ('UPDATE session SET expire_date = datetime(\'now\', \'+14 days\') '
+                         'WHERE session_key = %s', [f'key{number}']),
+                    ])
+                reads += 1
+            except OperationalError:
+                locked += 1
+        _sqlite_disconnect(alias)
+        with lock:
+            totals['reads'] += reads
+            totals['locked'] += locked
+
+    def writer(number):
+        rng = random.Random(-number - 1)
+        _sqlite_connect(alias, database)
+        writes = locked = 0
+        latencies = []
+        while time.perf_counter() < deadline:
+            problem_id = rng.randint(1, problems)
+            started = time.perf_counter()
+            try:
+                # Как при добавлении решения: чтение проблемы, вставка, пересчет счетчика
+                atomic([
+                    ('SELECT id FROM problem WHERE id = %s', [problem_id]),
+                    ('INSERT INTO solution (problem_id, description, created_at) '
+                     'VALUES (%s, %s, datetime(\'now\'))', [problem_id, 'Решение ' * 20]),
+                    ('UPDATE problem SET solutions_count = (SELECT COUNT(*) FROM solution '
+                     'WHERE problem_id = %s) WHERE id = %s', [problem_id, problem_id]),
+                ])
+                writes += 1
+                latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                locked += 1
+        _sqlite_disconnect(alias)
+        with lock:
+            totals['writes'] += writes
+            totals['locked'] += locked
+            write_latencies.extend(latencies)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    conn = sqlite3.connect(path)
+    journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    conn.close()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    return {
+        'journal_mode': journal_mode,
+        'reads': totals['reads'],
+        'writes': totals['writes'],
+        'locked_errors': totals['locked'],
+        'reads_per_s': round(totals['reads'] / elapsed, 1),
+        'writes_per_s': round(totals['writes'] / elapsed, 1),
+        'write_p99_ms': round(percentile(write_latencies, 99) * 1000, 3) if write_latencies else None,
+    }
@@ -0,0 +1,144 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from .instrumentation import record_cache
+from .pagination import CursorPage, aget_page as apaginate
+
+# Кэш результатов problem_list.
+#
+# Ключ страницы содержит версию "области": 'all' для ленты без фильтра по
+# направлению и 'direction:<id>' для ленты одного направления. Изменение
+# проблемы, решения, файла или направления меняет версию только затронутых
+# областей, старые ключи просто перестают читаться и вытесняются по таймауту.
+
+SCOPE_ALL = 'all'
+
+
+def get_cache():
+    return caches[settings.HELPDESK_CACHE_ALIAS]
+
+
+def direction_scope(direction_id):
+    return f'direction:{direction_id}'
+
+
+def _version_key(scope):
+    return f'problem_list:version:{scope}'
+
+
+def _new_version():
+    return str(time.time_ns())
+
+
+def get_scope_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        # Версия могла быть вытеснена — начинаем новую, чтобы не прочитать устаревшие страницы
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_scope_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        version = _new_version()
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def invalidate_directions(direction_ids):
+    """Сбрасывает ленту без фильтра и ленты указанных направлений."""
+    scopes = [SCOPE_ALL] + [direction_scope(pk) for pk in set(direction_ids) if pk is not None]
+    get_cache().set_many({_version_key(scope): _new_version() for scope in scopes}, None)
+
+
+def _list_scope(direction_id):
+    return direction_scope(direction_id) if direction_id else SCOPE_ALL
+
+
+def _list_digest(query, direction_id, status, position):
+    raw = '|'.join(str(part) for part in (query, direction_id, status, position))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def problem_list_key(kind, query, direction_id, status, position=''):
+    version = get_scope_version(_list_scope(direction_id))
+    return f'problem_list:{kind}:{version}:{_list_digest(query, direction_id, status, position)}'
+
+
+async def aproblem_list_key(kind, query, direction_id, status, position=''):
+    version = await aget_scope_version(_list_scope(direction_id))
+    return f'problem_list:{kind}:{version}:{_list_digest(query, direction_id, status, position)}'
+
+
+def _freeze(page):
+    if isinstance(page, CursorPage):
+        return {'objects': page.object_list, 'has_next': page._has_next, 'has_previous': page._has_previous}
+    return {'objects': list(page.object_list), 'number': page.number, 'count': page.paginator.count}
+
+
+def _thaw(paginator, data):
+    if 'number' not in data:
+        return CursorPage(data['objects'], paginator, data['has_next'], data['has_previous'])
+    # Подставляем сохраненное количество, чтобы Paginator не выполнял COUNT(*)
+    paginator.count = data['count']
+    return paginator._get_page(data['objects'], data['number'], paginator)
+
+
+def get_page(paginator, position, key):
+    """Страница из кэша или paginator.get_page(position) с сохранением в кэш."""
+    cache = get_cache()
+    data = cache.get(key)
+    record_cache(data is not None)
+    if data is not None:
+        return _thaw(paginator, data)
+    page = paginator.get_page(position)
+    cache.set(key, _freeze(page), settings.HELPDESK_CACHE_TIMEOUT)
+    return page
+
+
+async def aget_page(paginator, position, key):
+    cache = get_cache()
+    data = await cache.aget(key)
+    record_cache(data is not None)
+    if data is not None:
+        return _thaw(paginator, data)
+    page = await apaginate(paginator, position)
+    await cache.aset(key, _freeze(page), settings.HELPDESK_CACHE_TIMEOUT)
+    return page
+
+
+# Статистика сотрудников для employee_list: один агрегирующий запрос,
+# кэшируется ненадолго и сбрасывается при изменении пользователей (см. signals.py)
+
+EMPLOYEE_STATS_KEY = 'employee_stats'
+
+
+def get_employee_stats():
+    cache = get_cache()
+    stats = cache.get(EMPLOYEE_STATS_KEY)
+    if stats is None:
+        stats = User.objects.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(is_active=True)),
+            staff=Count('id', filter=Q(is_staff=True)),
+            superuser=Count('id', filter=Q(is_superuser=True)),
+        )
+        cache.set(EMPLOYEE_STATS_KEY, stats, settings.HELPDESK_EMPLOYEE_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_employee_stats():
+    get_cache().delete(EMPLOYEE_STATS_KEY)
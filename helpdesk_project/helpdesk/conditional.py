@@ -0,0 +1,101 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import SCOPE_ALL, aget_scope_version, direction_scope
+from .models import Problem
+
+# Условный GET для страниц problem_list и problem_detail.
+#
+# Валидаторы считаются до представления одним запросом к БД: для ленты — число проблем
+# и последние даты изменения и активности (ProblemQuerySet.change_marker), для страницы
+# проблемы — её updated_at и last_activity_at. Версии областей кэша хранятся в кэше
+# helpdesk и при locmem у каждого процесса свои, поэтому одни они в ETag не годятся.
+# Страница зависит от пользователя (кнопки, форма, CSRF), поэтому он входит в ETag.
+# Ответ 304 формирует django.views.decorators.http.condition.
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+async def _user_key(request):
+    """Часть ETag, зависящая от пользователя, или None, если страницу нельзя кэшировать."""
+    user = await request.auser()
+    # Страница с сообщениями (после перенаправления) показывается один раз
+    if len(get_messages(request)):
+        return None
+    if not user.is_authenticated:
+        return 'anonymous'
+    return user.pk, user.is_staff, user.is_superuser
+
+
+async def problem_list_validators(request):
+    key = await _user_key(request)
+    if key is None:
+        return None, None
+    direction_id = request.GET.get('direction', '')
+    problems = Problem.objects.all()
+    scope = SCOPE_ALL
+    if direction_id.isdigit():
+        problems = problems.filter(direction_id=direction_id)
+        scope = direction_scope(direction_id)
+    # Изменения проблем, решений и файлов видны по отпечатку из БД — в любом процессе.
+    # Версия области кэша (cache.py) добавляет изменения направлений в этом процессе
+    marker = await problems.achange_marker()
+    version = await aget_scope_version(scope)
+    return _digest(marker, version, request.get_full_path(), key), None
+
+
+async def problem_detail_validators(request, pk):
+    key = await _user_key(request)
+    if key is None:
+        return None, None
+    row = await Problem.objects.filter(pk=pk).values('updated_at', 'direction_id', 'last_activity_at').afirst()
+    if row is None:
+        return None, None
+    # Тот же источник, что у API (api.problem_last_modified): last_activity_at обновляется
+    # и при принятии, правке и удалении решений (refresh_counters(touch=True))
+    last_modified = max(filter(None, [row['updated_at'], row['last_activity_at']]))
+    version = await aget_scope_version(direction_scope(row['direction_id']))
+    return _digest(pk, row['updated_at'], row['last_activity_at'], version, key), last_modified
+
+
+def conditional_page(validators):
+    """
+    ETag и Last-Modified для асинхронного представления страницы.
+
+    validators(request, *args, **kwargs) — корутина, возвращающая (etag, last_modified);
+    None вместо значения отключает соответствующую проверку.
+    """
+    def decorator(view_func):
+        conditional_view = condition(
+            etag_func=lambda request, *args, **kwargs: request.page_validators[0],
+            last_modified_func=lambda request, *args, **kwargs: request.page_validators[1],
+        )(view_func)
+
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            request.page_validators = (None, None)
+            if request.method in ('GET', 'HEAD'):
+                request.page_validators = await validators(request, *args, **kwargs)
+            response = await conditional_view(request, *args, **kwargs)
+            if request.page_validators != (None, None):
+                patch_page_cache_control(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def patch_page_cache_control(response):
+    max_age = settings.HELPDESK_PRIVATE_CACHE_SECONDS
+    if max_age:
+        # Браузер пользователя может показывать страницу без проверки max_age секунд
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        # Хранить можно, но каждый раз с проверкой — изменения видны сразу, ответ обычно 304
+        patch_cache_control(response, no_cache=True)
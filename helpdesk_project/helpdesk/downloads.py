@@ -0,0 +1,134 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, http_date, parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Показываются в браузере только растровые изображения; остальное (в том числе HTML и SVG,
+# способные выполнить скрипт на домене приложения) — скачивается
+INLINE_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp'}
+
+
+class RangeFile:
+    """Отдает из файла только length байт, начиная с start (для ответа 206)."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def attachment_etag(attachment, stat):
+    # Для файлов в хранилище по содержимому хэш и есть идеальный ETag
+    if attachment.blob_id:
+        return quote_etag(attachment.blob.sha256)
+    return quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime):x}')
+
+
+def parse_range(header, size):
+    """(start, end) для одного диапазона, None — отдать весь файл, ValueError — 416."""
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 — последние 500 байт
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range Not Satisfiable')
+    return start, end
+
+
+def sendfile_response(path, content_type):
+    """Передает отправку файла веб-серверу (nginx или Apache/lighttpd)."""
+    backend = settings.HELPDESK_SENDFILE_BACKEND
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.HELPDESK_SENDFILE_URL + relative
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_attachment(request, attachment):
+    path = attachment.file.path
+    stat = os.stat(path)
+    return serve_file(request, path, stat, attachment.filename(), attachment_etag(attachment, stat),
+                      'private, max-age=3600')
+
+
+def serve_thumbnail(request, attachment, path, size):
+    stat = os.stat(path)
+    name = os.path.splitext(attachment.filename())[0]
+    # URL миниатюры содержит версию содержимого, поэтому её можно кэшировать навсегда
+    return serve_file(request, path, stat, f'{name}.{size}.jpg', quote_etag(f'{stat.st_size:x}-{size}-{int(stat.st_mtime):x}'),
+                      'private, max-age=31536000, immutable')
+
+
+def serve_file(request, path, stat, filename, etag, cache_control):
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    elif settings.HELPDESK_SENDFILE_BACKEND:
+        # Range, If-Range и т.п. обрабатывает веб-сервер
+        response = sendfile_response(path, content_type)
+    else:
+        response = file_response(request, path, stat, content_type, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    # Загруженный пользователем файл: браузер не угадывает тип и не дает ему выполнять скрипты
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = 'sandbox'
+    if response.status_code != 304:
+        as_attachment = content_type not in INLINE_CONTENT_TYPES
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+def file_response(request, path, stat, content_type, etag):
+    size = stat.st_size
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFile(open(path, 'rb'), start, length), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,288 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+# Замеры времени выполнения запросов.
+#
+# RequestMetricsMiddleware создает RequestStats на каждый запрос и кладет его
+# в contextvar; запросы к БД, рендеринг шаблонов и обращения к кэшу страниц
+# дописывают в него свои замеры. contextvar копируется в sync_to_async, поэтому
+# замеры работают и для асинхронных представлений. При выключенных метриках
+# middleware не попадает в цепочку, а остальные точки видят пустой contextvar.
+
+logger = logging.getLogger('helpdesk.requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('helpdesk_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('view', 'started', 'duration', 'view_seconds', 'queries', 'db_seconds',
+                 'template_seconds', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.view = None
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.view_seconds = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def record_cache(hit):
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def add_query_wrapper(wrapper):
+    """Подключает execute-wrapper ко всем соединениям с БД, включая будущие."""
+    def install(connection, **kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    # Соединения создаются в каждом потоке отдельно (в т.ч. в потоках sync_to_async)
+    connection_created.connect(install, weak=False, dispatch_uid=f'{wrapper.__module__}.{wrapper.__name__}')
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """Шаблонный движок Django, который учитывает время рендеринга в RequestStats."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+class InstrumentedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class MetricsRegistry:
+    """Счетчики в памяти процесса в формате Prometheus (каждый воркер отдает свои)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.durations = {}
+        self.queries = {}
+        self.db_seconds = {}
+        self.template_seconds = {}
+        self.cache = {}
+
+    def observe(self, stats, method, status):
+        view = stats.view
+        with self.lock:
+            key = (view, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            buckets, total, count = self.durations.get(view, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if stats.duration <= bound:
+                    buckets[index] += 1
+            self.durations[view] = (buckets, total + stats.duration, count + 1)
+
+            self.queries[view] = self.queries.get(view, 0) + stats.queries
+            self.db_seconds[view] = self.db_seconds.get(view, 0.0) + stats.db_seconds
+            self.template_seconds[view] = self.template_seconds.get(view, 0.0) + stats.template_seconds
+            for result, value in (('hit', stats.cache_hits), ('miss', stats.cache_misses)):
+                if value:
+                    self.cache[(view, result)] = self.cache.get((view, result), 0) + value
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f'{name}{{{label_text}}} {value}')
+
+        with self.lock:
+            metric('helpdesk_requests_total', 'counter', 'Обработано HTTP-запросов', [
+                ((('view', view), ('method', method), ('status', status)), value)
+                for (view, method, status), value in sorted(self.requests.items())
+            ])
+
+            name = 'helpdesk_request_duration_seconds'
+            lines.append(f'# HELP {name} Время обработки запроса')
+            lines.append(f'# TYPE {name} histogram')
+            for view, (buckets, total, count) in sorted(self.durations.items()):
+                for bound, value in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {value}')
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{view="{view}"}} {round(total, 6)}')
+                lines.append(f'{name}_count{{view="{view}"}} {count}')
+
+            for name, help_text, values in (
+                ('helpdesk_db_queries_total', 'Запросов к БД', self.queries),
+                ('helpdesk_db_duration_seconds_total', 'Время запросов к БД', self.db_seconds),
+                ('helpdesk_template_render_seconds_total', 'Время рендеринга шаблонов', self.template_seconds),
+            ):
+                metric(name, 'counter', help_text, [
+                    ((('view', view),), round(value, 6)) for view, value in sorted(values.items())
+                ])
+
+            metric('helpdesk_cache_requests_total', 'counter', 'Обращения к кэшу страниц', [
+                ((('view', view), ('result', result)), value)
+                for (view, result), value in sorted(self.cache.items())
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _view_name(request):
+    match = request.resolver_match
+    return (match.url_name or match.view_name) if match else 'unknown'
+
+
+def _finish(request, stats, response):
+    stats.duration = time.perf_counter() - stats.started
+    if stats.view is None:
+        stats.view = _view_name(request)
+    registry.observe(stats, request.method, response.status_code)
+
+    # Медленные запросы пишем всегда, остальные — выборочно
+    if stats.duration >= settings.HELPDESK_METRICS_SLOW_REQUEST or \
+            random.random() < settings.HELPDESK_METRICS_SAMPLE_RATE:
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': stats.view,
+            'status': response.status_code,
+            'duration_ms': round(stats.duration * 1000, 2),
+            'db_queries': stats.queries,
+            'db_ms': round(stats.db_seconds * 1000, 2),
+            'template_ms': round(stats.template_seconds * 1000, 2),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        }
+        if stats.view_seconds is not None:
+            record['view_ms'] = round(stats.view_seconds * 1000, 2)
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+class RequestMetricsMiddleware:
+    """Собирает RequestStats для каждого запроса. Подключается первым в MIDDLEWARE."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.HELPDESK_METRICS_ENABLED:
+            # Django исключит middleware из цепочки — никаких накладных расходов
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        add_query_wrapper(_record_query)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        _finish(request, stats, response)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        _finish(request, stats, response)
+        return response
+
+
+def instrument(view_func):
+    """
+    Помечает представление для метрик: имя представления становится меткой view,
+    а время самого представления (без middleware) попадает в лог как view_ms.
+    """
+    name = view_func.__name__
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            stats = _current.get()
+            if stats is None:
+                return await view_func(request, *args, **kwargs)
+            stats.view = name
+            started = time.perf_counter()
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                stats.view_seconds = time.perf_counter() - started
+    else:
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            stats = _current.get()
+            if stats is None:
+                return view_func(request, *args, **kwargs)
+            stats.view = name
+            started = time.perf_counter()
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                stats.view_seconds = time.perf_counter() - started
+    return wrapper
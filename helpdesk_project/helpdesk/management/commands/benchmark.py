@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from helpdesk.benchmark import generate_data, render_benchmark, run_benchmarks
+from helpdesk.models import Problem
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетические данные в отдельной тестовой базе и измеряет задержки, '
+            'число запросов к БД и память для основных страниц')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--problems', type=int, default=10000, help='Количество проблем (10k–1M)')
+        parser.add_argument('--directions', type=int, default=7)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--solutions', type=int, default=3, help='В среднем решений на проблему')
+        parser.add_argument('--files', type=int, default=1, help='В среднем файлов на проблему')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20, help='Запросов на каждую страницу')
+        parser.add_argument('--warm-cache', action='store_true', help='Не очищать кэш страниц между запросами')
+        parser.add_argument('--only', nargs='*', help='Измерить только указанные страницы')
+        parser.add_argument('--render', action='store_true',
+                            help='Также измерить рендеринг ленты на 6 и 50 карточек (кэш шаблонов и карточек)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу и не генерировать данные повторно')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='helpdesk-bench-')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'],
+                                                      serialize=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, HELPDESK_TASKS_BACKEND='immediate',
+                                   HELPDESK_METRICS_ENABLED=False, HELPDESK_READ_REPLICA=None):
+                if Problem.objects.count() < options['problems']:
+                    self.stdout.write(f"Генерация данных: {options['problems']} проблем")
+                    generate_data(
+                        problems=options['problems'] - Problem.objects.count(),
+                        directions=options['directions'],
+                        users=options['users'],
+                        solutions=options['solutions'],
+                        files=options['files'],
+                        seed=options['seed'],
+                        stdout=self.stdout,
+                    )
+                results = run_benchmarks(options['repeat'], options['warm_cache'], options['only'])
+                render = render_benchmark(repeat=options['repeat']) if options['render'] else None
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'commit': git_commit(),
+            'date': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'scale': {key: options[key] for key in ('problems', 'directions', 'users', 'solutions', 'files')},
+            'repeat': options['repeat'],
+            'warm_cache': options['warm_cache'],
+            'results': results,
+        }
+        if render is not None:
+            report['render'] = render
+
+        previous = {}
+        if options['compare'] and os.path.exists(options['compare']):
+            with open(options['compare'], encoding='utf-8') as source:
+                previous = json.load(source).get('results', {})
+
+        self.stdout.write(f"{'страница':<28} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'запросы':>8} {'память, КБ':>11}")
+        for name, result in results.items():
+            line = (f"{name:<28} {result['p50_ms']:>9.1f} {result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                    f"{result['queries']:>8} {result['peak_memory_kb']:>11.0f}")
+            if name in previous:
+                old = previous[name]
+                change = (result['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0
+                line += f"   p50 {change:+.0f}%, запросы {result['queries'] - old['queries']:+d}"
+            if result['status'] != 200:
+                line += f"   HTTP {result['status']}"
+            self.stdout.write(line)
+
+        if render is not None:
+            self.stdout.write(f"\n{'рендеринг ленты, p50 мс':<28} {'parse':>9} {'loader':>9} {'fragment':>9}")
+            for cards, result in render.items():
+                self.stdout.write(f"{f'{cards} карточек':<28} {result['parse']:>9.2f} "
+                                  f"{result['loader_cache']:>9.2f} {result['fragment_cache']:>9.2f}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as destination:
+                json.dump(report, destination, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен в {options['output']}"))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from helpdesk.models import ChunkedUpload
+from helpdesk.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = 'Удаляет незавершенные и неиспользованные загрузки файлов частями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Удалять загрузки старше указанного количества часов')
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(hours=options['hours'])
+        count = 0
+        for upload in ChunkedUpload.objects.filter(created_at__lt=threshold).iterator():
+            discard_upload(upload)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Удалено {count} загрузок'))
@@ -0,0 +1,64 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from helpdesk.models import Blob, ProblemFile, SolutionFile
+from helpdesk.storage import attachment_storage, blob_hash, content_hash
+
+
+class Command(BaseCommand):
+    help = 'Переносит существующие вложения в хранилище по содержимому (SHA-256) и удаляет дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, сколько места освободится')
+
+    def handle(self, *args, **options):
+        storage = attachment_storage
+        dry_run = options['dry_run']
+        hashes = {}
+        moved = missing = 0
+        old_names = set()
+        total_size = 0
+
+        for model in (ProblemFile, SolutionFile):
+            for attachment in model.objects.filter(blob__isnull=True).iterator():
+                old_name = attachment.file.name
+                if blob_hash(old_name) or not storage.exists(old_name):
+                    missing += 1
+                    continue
+
+                size = storage.size(old_name)
+                total_size += size
+                with storage.open(old_name, 'rb') as source:
+                    if dry_run:
+                        hashes.setdefault(content_hash(File(source)), size)
+                        moved += 1
+                        continue
+                    with transaction.atomic():
+                        new_name = storage.save(old_name, File(source, name=old_name))
+                        blob = Blob.acquire(new_name, size)
+                        hashes.setdefault(blob.sha256, size)
+                        model.objects.filter(pk=attachment.pk).update(
+                            file=new_name,
+                            blob=blob,
+                            original_name=attachment.original_name or os.path.basename(old_name),
+                        )
+                old_names.add(old_name)
+                moved += 1
+
+        if not dry_run:
+            # Старые копии удаляем, когда на них больше никто не ссылается
+            for name in old_names:
+                if not (ProblemFile.objects.filter(file=name).exists() or
+                        SolutionFile.objects.filter(file=name).exists()):
+                    storage.delete(name)
+
+        saved = total_size - sum(hashes.values())
+        verb = 'Можно перенести' if dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved} файлов в {len(hashes)} уникальных blob, '
+            f'освобождается {saved / 1024 / 1024:.1f} МБ. Пропущено: {missing}'
+        ))
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from helpdesk.models import Direction, Problem, ProblemFile, Solution
+from helpdesk.search import get_search_backend
+
+
+def hot_queries():
+    """(название, QuerySet) для запросов из views.py и admin.py, которым нужны индексы."""
+    problem = Problem.objects.order_by('-id').first()
+    problem_id = problem.pk if problem else 0
+    direction = Direction.objects.first()
+    direction_id = direction.pk if direction else 0
+    feed = Problem.objects.select_related('author', 'direction').order_by('-created_at', '-id')
+    now = timezone.now()
+
+    return [
+        ('Лента проблем', feed[:7]),
+        ('Лента направления', feed.filter(direction_id=direction_id)[:7]),
+        ('Решенные проблемы', feed.solved()[:7]),
+        ('Нерешенные проблемы', feed.unsolved()[:7]),
+        ('Следующая страница по курсору', feed.filter(
+            Q(created_at__lt=now) | Q(created_at=now, id__lt=problem_id)
+        )[:7]),
+        ('Следующая страница направления по курсору', feed.filter(direction_id=direction_id).filter(
+            Q(created_at__lt=now) | Q(created_at=now, id__lt=problem_id)
+        )[:7]),
+        ('Поиск', get_search_backend().search(feed, 'принтер не печатает')[:6]),
+        ('Решения проблемы', Solution.objects.filter(problem_id__in=[problem_id]).select_related('author')),
+        ('Файлы проблемы', ProblemFile.objects.filter(problem_id__in=[problem_id])),
+        ('Принятое решение проблемы', Solution.objects.filter(problem_id=problem_id, is_accepted=True)
+            .order_by()[:1]),
+        ('Последние проблемы направлений (админка)', Problem.objects.filter(direction_id__in=[direction_id])
+            .order_by('-created_at')),
+        ('Список решений (админка)', Solution.objects.select_related('problem', 'author')[:25]),
+        ('Сотрудники', User.objects.order_by('-date_joined')[:5]),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Печатает план выполнения (EXPLAIN QUERY PLAN / EXPLAIN) для основных запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sql', action='store_true', help='Печатать и сам SQL')
+
+    def handle(self, *args, **options):
+        for title, queryset in hot_queries():
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            if options['sql']:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
+        if connection.vendor == 'sqlite':
+            self.stdout.write('SCAN без USING INDEX означает полный просмотр таблицы, '
+                              'USE TEMP B-TREE FOR ORDER BY — сортировку без индекса.')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from helpdesk.models import ProblemFile, SolutionFile
+from helpdesk.thumbnails import SIZES, generate_thumbnail, is_image
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие миниатюры для уже загруженных изображений'
+
+    def handle(self, *args, **options):
+        created = failed = 0
+        names = set()
+        for model in (ProblemFile, SolutionFile):
+            names.update(model.objects.values_list('file', flat=True))
+
+        for name in sorted(names):
+            if not is_image(name):
+                continue
+            for size in SIZES:
+                if generate_thumbnail(name, size):
+                    created += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Миниатюр готово: {created}, ошибок: {failed}'))
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from helpdesk.benchmark import percentile
+
+
+async def fetch(host, port, path, slow):
+    """Один GET-запрос. slow — пауза посреди отправки заголовков (медленный клиент)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n'.encode()
+        if slow:
+            writer.write(request)
+            await writer.drain()
+            await asyncio.sleep(slow)
+        else:
+            writer.write(request)
+        writer.write(b'\r\n')
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запущенного сервера: много одновременных (в т.ч. медленных) клиентов. '
+            'Позволяет сравнить WSGI (runserver, gunicorn) и ASGI (uvicorn, daphne)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Например, http://127.0.0.1:8000/')
+        parser.add_argument('--concurrency', type=int, default=50, help='Одновременных соединений')
+        parser.add_argument('--requests', type=int, default=500, help='Всего запросов')
+        parser.add_argument('--slow', type=float, default=0.0,
+                            help='Сколько секунд каждый клиент "досылает" заголовки запроса')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Поддерживаются только URL вида http://host:port/path')
+        path = url.path or '/'
+        if url.query:
+            path += f'?{url.query}'
+
+        latencies, statuses, elapsed = asyncio.run(self.run(
+            url.hostname, url.port or 80, path,
+            options['concurrency'], options['requests'], options['slow'],
+        ))
+
+        errors = sum(1 for status in statuses if status is None or status >= 400)
+        report = {
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'slow': options['slow'],
+            'requests': len(statuses),
+            'errors': errors,
+            'seconds': round(elapsed, 3),
+            'rps': round(len(statuses) / elapsed, 1),
+        }
+        if latencies:
+            report.update({
+                f'{name}_ms': round(value * 1000, 1) for name, value in (
+                    ('mean', statistics.mean(latencies)),
+                    ('p50', percentile(latencies, 50)),
+                    ('p95', percentile(latencies, 95)),
+                    ('p99', percentile(latencies, 99)),
+                    ('max', max(latencies)),
+                )
+            })
+
+        self.stdout.write(f'Запросов: {len(statuses)}, ошибок: {errors}, время: {elapsed:.2f} с')
+        self.stdout.write(f"Запросов в секунду: {report['rps']}")
+        if latencies:
+            self.stdout.write('Задержка, мс: среднее {mean_ms}, p50 {p50_ms}, p95 {p95_ms}, p99 {p99_ms}, '
+                              'макс {max_ms}'.format(**report))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as destination:
+                json.dump(report, destination, ensure_ascii=False, indent=2)
+
+    async def run(self, host, port, path, concurrency, total, slow):
+        latencies, statuses = [], []
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def client():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    status = await fetch(host, port, path, slow)
+                except OSError:
+                    status = None
+                else:
+                    latencies.append(time.perf_counter() - started)
+                statuses.append(status)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return latencies, statuses, time.perf_counter() - started
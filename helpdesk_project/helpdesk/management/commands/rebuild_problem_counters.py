@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from helpdesk.models import Problem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает количество решений и файлов, принятое решение и дату последней активности проблем'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = Problem.objects.all().refresh_counters()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено {count} проблем'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from helpdesk.models import Problem
+from helpdesk.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс проблем и решений'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        problems = Problem.objects.prefetch_related('solutions').iterator(chunk_size=500)
+        count = backend.rebuild(problems)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано {count} проблем ({backend.__class__.__name__})'
+        ))
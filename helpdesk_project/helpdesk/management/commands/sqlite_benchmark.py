@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from helpdesk.benchmark import sqlite_concurrency
+from helpdesk.management.commands.benchmark import git_commit
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite при одновременном чтении и записи '
+            'в режиме по умолчанию и с HELPDESK_SQLITE_PRAGMAS + BEGIN IMMEDIATE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения ленты и проблемы')
+        parser.add_argument('--writers', type=int, default=2, help='Потоков добавления решений')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Длительность каждого прогона')
+        parser.add_argument('--problems', type=int, default=5000)
+        parser.add_argument('--no-session-writes', action='store_true',
+                            help='Не сохранять сессию при каждом чтении (SESSION_SAVE_EVERY_REQUEST)')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='helpdesk-sqlite-')
+        results = {}
+        try:
+            for mode, tuned in (('default', False), ('tuned', True)):
+                self.stdout.write(f'Прогон {mode}: {options["seconds"]} с')
+                results[mode] = sqlite_concurrency(
+                    os.path.join(directory, f'{mode}.sqlite3'), tuned,
+                    readers=options['readers'],
+                    writers=options['writers'],
+                    seconds=options['seconds'],
+                    problems=options['problems'],
+                    session_writes=not options['no_session_writes'],
+                )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.stdout.write(f"{'режим':<10} {'журнал':>8} {'чтений/с':>10} {'записей/с':>10} "
+                          f"{'p99 записи, мс':>15} {'locked':>7}")
+        for mode, result in results.items():
+            p99 = result['write_p99_ms']
+            self.stdout.write(
+                f"{mode:<10} {result['journal_mode']:>8} {result['reads_per_s']:>10.1f} "
+                f"{result['writes_per_s']:>10.1f} {p99 if p99 is not None else '-':>15} "
+                f"{result['locked_errors']:>7}"
+            )
+
+        if options['output']:
+            report = {
+                'commit': git_commit(),
+                'options': {key: options[key] for key in ('readers', 'writers', 'seconds', 'problems')},
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as destination:
+                json.dump(report, destination, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен в {options['output']}"))
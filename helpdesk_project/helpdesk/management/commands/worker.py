@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from helpdesk.tasks import run_worker, worker_name
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди в БД (HELPDESK_TASKS_BACKEND = "db"). '
+            'Можно запускать несколько воркеров одновременно')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=10, help='Сколько задач брать за раз')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Пауза при пустой очереди, секунд')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+
+    def handle(self, *args, **options):
+        stopping = []
+
+        def stop(signum, frame):
+            # Текущая задача доделывается, новые не берутся
+            self.stdout.write('Остановка после текущей задачи')
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        name = worker_name()
+        self.stdout.write(f'Воркер {name} запущен')
+        processed = run_worker(batch=options['batch'], sleep=options['sleep'], once=options['once'],
+                               should_stop=lambda: bool(stopping), worker_id=name)
+        self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {processed}'))
@@ -0,0 +1,201 @@
+import re
+from collections import defaultdict
+
+from django.db import migrations
+
+FTS_TABLE = 'helpdesk_problem_fts'
+
+# Замороженная копия helpdesk.stemmer на момент миграции: индекс существующих проблем
+# строится тем же стеммером, что и при поиске, но правка модуля стеммера не меняет
+# результат уже написанной миграции.
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+
+REFLEXIVE = ('ся', 'сь')
+
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено',
+    'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях',
+    'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом',
+    'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)
+
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _longest(word, endings):
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending):
+            return ending
+    return None
+
+
+def _remove(word, group_1, group_2=()):
+    """Удаляет окончание; окончания group_1 должны идти после 'а' или 'я'."""
+    candidates = []
+    ending = _longest(word, group_1)
+    if ending and word[:-len(ending)].endswith(('а', 'я')):
+        candidates.append(ending)
+    ending = _longest(word, group_2)
+    if ending:
+        candidates.append(ending)
+    if not candidates:
+        return word, False
+    ending = max(candidates, key=len)
+    return word[:-len(ending)], True
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not re.search('[а-я]', word):
+        return word
+
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    rv, removed = _remove(rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if not removed:
+        rv, _ = _remove(rv, (), REFLEXIVE)
+        ending = _longest(rv, ADJECTIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+            rv, _ = _remove(rv, PARTICIPLE_1, PARTICIPLE_2)
+        else:
+            rv, removed = _remove(rv, VERB_1, VERB_2)
+            if not removed:
+                rv, _ = _remove(rv, (), NOUN)
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3
+    r2 = (prefix + rv)[r2_start:]
+    ending = _longest(r2, DERIVATIONAL)
+    if ending:
+        rv = rv[:-len(ending)]
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        ending = _longest(rv, SUPERLATIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {FTS_TABLE} ("
+            f"problem_id bigint PRIMARY KEY REFERENCES helpdesk_problem(id) ON DELETE CASCADE, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {FTS_TABLE}_document_idx ON {FTS_TABLE} USING GIN (document)"
+        )
+    else:
+        return
+
+    # Уже существующие проблемы. В PostgreSQL нормализует сам to_tsvector — заполняем
+    # одним INSERT ... SELECT
+    Problem = apps.get_model('helpdesk', 'Problem')
+    Solution = apps.get_model('helpdesk', 'Solution')
+    if vendor == 'postgresql':
+        problem_table, solution_table = Problem._meta.db_table, Solution._meta.db_table
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (problem_id, document) "
+            f"SELECT p.id, setweight(to_tsvector('russian', p.title), 'A') || "
+            f"setweight(to_tsvector('russian', concat_ws(' ', p.description, ("
+            f"SELECT string_agg(s.description, ' ') FROM {solution_table} s WHERE s.problem_id = p.id"
+            f"))), 'D') FROM {problem_table} p"
+        )
+        return
+
+    # SQLite: текст нормализуется стеммером выше; решения читаем одним запросом
+    alias = schema_editor.connection.alias
+    solutions = defaultdict(list)
+    for problem_id, description in Solution.objects.using(alias).order_by('problem_id', 'pk').values_list(
+            'problem_id', 'description'):
+        solutions[problem_id].append(description)
+    rows = [
+        (pk, normalize(title), normalize(f"{description} {' '.join(solutions[pk])}"))
+        for pk, title, description in Problem.objects.using(alias).values_list('pk', 'title', 'description')
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helpdesk', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
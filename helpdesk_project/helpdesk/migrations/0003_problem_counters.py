@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def fill_counters(apps, schema_editor):
+    Problem = apps.get_model('helpdesk', 'Problem')
+    Solution = apps.get_model('helpdesk', 'Solution')
+    ProblemFile = apps.get_model('helpdesk', 'ProblemFile')
+
+    solutions = Solution.objects.filter(problem=OuterRef('pk')).order_by().values('problem')
+    files = ProblemFile.objects.filter(problem=OuterRef('pk')).order_by().values('problem')
+    accepted = Solution.objects.filter(problem=OuterRef('pk'), is_accepted=True).order_by('-created_at')
+    Problem.objects.update(
+        solutions_count=Coalesce(Subquery(solutions.annotate(c=Count('pk')).values('c')[:1]), 0),
+        files_count=Coalesce(Subquery(files.annotate(c=Count('pk')).values('c')[:1]), 0),
+        accepted_solution=Subquery(accepted.values('pk')[:1]),
+        last_activity_at=Greatest(
+            'created_at',
+            Coalesce(Subquery(solutions.annotate(m=Max('created_at')).values('m')[:1]), 'created_at'),
+            Coalesce(Subquery(files.annotate(m=Max('uploaded_at')).values('m')[:1]), 'created_at'),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helpdesk', '0002_problem_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='accepted_solution',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='helpdesk.solution', verbose_name='Принятое решение'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='files_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество файлов'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последняя активность'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='solutions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество решений'),
+        ),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['accepted_solution', '-created_at'], name='helpdesk_problem_solved_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
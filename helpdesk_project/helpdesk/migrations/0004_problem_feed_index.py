@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helpdesk', '0003_problem_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['-created_at', '-id'], name='helpdesk_problem_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:10
+
+import django.db.models.deletion
+import helpdesk.models
+import helpdesk.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helpdesk', '0005_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='problemfile',
+            name='original_name',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='solutionfile',
+            name='original_name',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='problemfile',
+            name='file',
+            field=models.FileField(max_length=255, storage=helpdesk.storage.select_storage, upload_to=helpdesk.models.problem_file_path),
+        ),
+        migrations.AlterField(
+            model_name='solutionfile',
+            name='file',
+            field=models.FileField(max_length=255, storage=helpdesk.storage.select_storage, upload_to=helpdesk.models.solution_file_path),
+        ),
+        migrations.AddField(
+            model_name='problemfile',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='helpdesk.blob'),
+        ),
+        migrations.AddField(
+            model_name='solutionfile',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='helpdesk.blob'),
+        ),
+    ]
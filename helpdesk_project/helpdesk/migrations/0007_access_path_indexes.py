@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helpdesk', '0006_blob_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['direction', '-created_at', '-id'], name='helpdesk_problem_dir_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(fields=['problem', '-is_accepted', '-created_at'], name='helpdesk_solution_problem_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(fields=['-is_accepted', '-created_at'], name='helpdesk_solution_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(condition=models.Q(('is_accepted', True)), fields=['problem', '-created_at'], name='helpdesk_solution_accepted_idx'),
+        ),
+    ]
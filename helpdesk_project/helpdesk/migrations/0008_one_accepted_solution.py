@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def keep_newest_accepted(apps, schema_editor):
+    # Раньше принятых решений могло быть несколько; проблема показывала самое новое из них
+    Solution = apps.get_model('helpdesk', 'Solution')
+    newest = Solution.objects.filter(problem=OuterRef('problem'), is_accepted=True).order_by('-created_at', '-id')
+    Solution.objects.filter(is_accepted=True).exclude(
+        pk=Subquery(newest.values('pk')[:1])
+    ).update(is_accepted=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('helpdesk', '0007_access_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_newest_accepted, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='solution',
+            name='helpdesk_solution_accepted_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='solution',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_accepted', True)), fields=('problem',), name='helpdesk_solution_one_accepted'),
+        ),
+    ]
@@ -1,15 +1,29 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Now
 from django.contrib.auth.models import User
 from django.core.validators import MaxLengthValidator, MinLengthValidator
+from django.urls import reverse
+from django.utils import timezone
 import os
 
+from .cache import invalidate_directions
+from .search import get_search_backend
+from .storage import blob_hash, select_storage
+from . import tasks, thumbnails
+
 
+# Итоговое имя файла определяет ContentAddressedStorage по его содержимому,
+# от этих путей остается только расширение
 def problem_file_path(instance, filename):
-    return f'problems/{instance.id}/{filename}'
+    return f'problems/{instance.problem_id}/{filename}'
 
 
 def solution_file_path(instance, filename):
-    return f'solutions/{instance.id}/{filename}'
+    return f'solutions/{instance.solution_id}/{filename}'
 
 
 class Direction(models.Model):
@@ -38,6 +52,78 @@ class Direction(models.Model):
         ordering = ['name']
 
 
+def _subquery(queryset, value):
+    return Subquery(queryset.values(value)[:1])
+
+
+class ProblemQuerySet(models.QuerySet):
+    def solved(self):
+        return self.filter(accepted_solution__isnull=False)
+
+    def unsolved(self):
+        return self.filter(accepted_solution__isnull=True)
+
+    def bulk_delete(self):
+        """
+        Удаляет проблемы вместе с решениями и файлами фиксированным числом запросов.
+        QuerySet.delete() загружает каждую строку и вызывает для нее обработчики post_delete
+        (счетчики Blob, поисковый индекс, кэш ленты) — здесь они выполняются сразу для всего набора.
+        Файлы, на которые больше нет ссылок, удаляются в фоне после фиксации транзакции.
+        """
+        with transaction.atomic(using=self.db):
+            problem_ids = list(self.values_list('pk', flat=True))
+            problems = Problem.objects.filter(pk__in=problem_ids)
+            direction_ids = list(problems.order_by().values_list('direction_id', flat=True).distinct())
+            Solution.objects.filter(problem__in=problems)._delete_rows()
+            _delete_attachments(ProblemFile.objects.filter(problem__in=problems))
+            count = _raw_delete(problems)
+            Blob.delete_orphans()
+            get_search_backend().remove_problems(problem_ids)
+            invalidate_directions(direction_ids)
+        return count
+
+    def _change_aggregates(self):
+        return self.order_by(), {
+            'count': Count('pk'), 'updated': Max('updated_at'), 'activity': Max('last_activity_at'),
+        }
+
+    def change_marker(self):
+        """
+        Отпечаток набора для ETag: число проблем и последние updated_at и last_activity_at.
+        Берется из БД, поэтому одинаков во всех процессах — версии области кэша (cache.py)
+        в locmem у каждого процесса свои.
+        """
+        queryset, aggregates = self._change_aggregates()
+        return tuple(queryset.aggregate(**aggregates).values())
+
+    async def achange_marker(self):
+        queryset, aggregates = self._change_aggregates()
+        return tuple((await queryset.aaggregate(**aggregates)).values())
+
+    def refresh_counters(self, touch=False):
+        """
+        Пересчитывает денормализованные поля одним UPDATE. touch=True — изменение, не
+        оставляющее своей даты (принятие, правка или удаление решения, удаление файла):
+        last_activity_at становится текущим временем, иначе Last-Modified страницы не изменится.
+        """
+        solutions = Solution.objects.filter(problem=OuterRef('pk')).order_by().values('problem')
+        files = ProblemFile.objects.filter(problem=OuterRef('pk')).order_by().values('problem')
+        # Принятое решение у проблемы одно (helpdesk_solution_one_accepted) — сортировка не нужна
+        accepted = Solution.objects.filter(problem=OuterRef('pk'), is_accepted=True).order_by()
+        # UPDATE не вызывает сигналы, поэтому кэш ленты сбрасываем здесь
+        invalidate_directions(self.order_by().values_list('direction_id', flat=True).distinct())
+        return self.update(
+            solutions_count=Coalesce(_subquery(solutions.annotate(c=Count('pk')), 'c'), 0),
+            files_count=Coalesce(_subquery(files.annotate(c=Count('pk')), 'c'), 0),
+            accepted_solution=_subquery(accepted, 'pk'),
+            last_activity_at=Now() if touch else Greatest(
+                'created_at',
+                Coalesce(_subquery(solutions.annotate(m=Max('created_at')), 'm'), 'created_at'),
+                Coalesce(_subquery(files.annotate(m=Max('uploaded_at')), 'm'), 'created_at'),
+            ),
+        )
+
+
 class Problem(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     description = models.TextField(
@@ -59,24 +145,236 @@ class Problem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Денормализованные поля, пересчитываются через Problem.objects.refresh_counters()
+    solutions_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество решений")
+    files_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество файлов")
+    accepted_solution = models.ForeignKey(
+        'Solution',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name="Принятое решение"
+    )
+    last_activity_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                            verbose_name="Последняя активность")
+
+    objects = ProblemQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} - {self.author.username}"
 
+    @property
+    def is_solved(self):
+        return self.accepted_solution_id is not None
+
+    def refresh_counters(self, touch=False):
+        Problem.objects.filter(pk=self.pk).refresh_counters(touch)
+        self.refresh_from_db(fields=['solutions_count', 'files_count', 'accepted_solution', 'last_activity_at'])
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['accepted_solution', '-created_at'], name='helpdesk_problem_solved_idx'),
+            # Для курсорной пагинации по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='helpdesk_problem_feed_idx'),
+            # Лента одного направления и последние проблемы направления в админке
+            models.Index(fields=['direction', '-created_at', '-id'], name='helpdesk_problem_dir_feed_idx'),
+        ]
+
+
+class Blob(models.Model):
+    """Содержимое файла, хранящееся один раз. ref_count — число ссылающихся вложений."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def acquire(cls, name, size):
+        blob, _ = cls.objects.get_or_create(sha256=blob_hash(name), defaults={'name': name, 'size': size})
+        cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob
+
+    @classmethod
+    def release(cls, blob_id):
+        cls.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+        blob = cls.objects.filter(pk=blob_id, ref_count__lte=0).first()
+        if blob is not None:
+            blob.delete()
+            # Файл удаляется фоновой задачей после фиксации транзакции
+            tasks.delete_files.enqueue([blob.name])
+
+    @classmethod
+    def delete_orphans(cls):
+        """Удаляет Blob без ссылок; файлы удаляет фоновая задача после фиксации транзакции."""
+        orphans = cls.objects.filter(ref_count__lte=0)
+        names = list(orphans.values_list('name', flat=True))
+        if names:
+            orphans.delete()
+            tasks.delete_files.enqueue(names)
+
+    @staticmethod
+    def delete_files(name):
+        select_storage().delete(name)
+        thumbnails.delete_thumbnails(name)
+
+    @classmethod
+    def delete_many_files(cls, names):
+        """
+        Удаляет файлы, на которые больше не ссылается ни один Blob. Пока задача ждала
+        в очереди, то же содержимое могли загрузить снова: хранилище вернуло уже лежащий
+        на диске файл, и для него создан новый Blob — такой файл оставляем.
+        """
+        # Проверка и удаление в одной транзакции: в SQLite (transaction_mode IMMEDIATE)
+        # она берет блокировку записи, и загрузка не создаст Blob между ними
+        with transaction.atomic():
+            used = set(cls.objects.select_for_update().filter(name__in=names).values_list('name', flat=True))
+            for name in names:
+                if name not in used:
+                    cls.delete_files(name)
+
+    def __str__(self):
+        return self.name
+
+
+class Attachment(models.Model):
+    """Общая часть ProblemFile и SolutionFile: ссылка на Blob и исходное имя файла."""
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+                             related_name='+')
+    original_name = models.CharField(max_length=255, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def get_absolute_url(self):
+        return reverse('attachment_download', args=[self.kind, self.pk])
+
+    def filename(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+    def is_image(self):
+        return thumbnails.is_image(self.filename())
+
+    def thumbnail_url(self, size='small'):
+        url = reverse('attachment_thumbnail', args=[self.kind, self.pk, size])
+        # Версия в URL позволяет кэшировать миниатюру навсегда; хэш берем из имени, без запроса к Blob
+        checksum = blob_hash(self.file.name)
+        version = checksum[:12] if checksum else int(self.uploaded_at.timestamp())
+        return f'{url}?v={version}'
 
+    def store_file(self, content, filename):
+        """Сохраняет содержимое в хранилище и увеличивает счетчик ссылок на Blob."""
+        self.original_name = os.path.basename(filename)
+        self.file.save(filename, content, save=False)
+        self.blob = Blob.acquire(self.file.name, self.file.size)
+        if settings.HELPDESK_VIRUS_SCAN_HOOK:
+            tasks.scan_file.enqueue(self.file.name)
+        if thumbnails.is_image(self.original_name):
+            tasks.generate_thumbnails.enqueue(self.file.name)
+
+    def save(self, *args, **kwargs):
+        replaced = self.pk is not None and not (self.file and self.file._committed)
+        previous_blob_id = None
+        if replaced:
+            previous_blob_id = type(self).objects.filter(pk=self.pk).values_list('blob_id', flat=True).first()
+        # Новый файл (например, из инлайна админки) сохраняем через store_file
+        if self.file and not self.file._committed:
+            self.store_file(self.file.file, self.file.name)
+        elif not self.file:
+            self.blob = None
+        super().save(*args, **kwargs)
+        # Файл заменен или очищен — прежний Blob теряет ссылку
+        if previous_blob_id and previous_blob_id != self.blob_id:
+            Blob.release(previous_blob_id)
+
+
+class ProblemFile(Attachment):
+    kind = 'problem'
 
-class ProblemFile(models.Model):
     problem = models.ForeignKey(
         Problem,
         on_delete=models.CASCADE,
         related_name='files'
     )
-    file = models.FileField(upload_to=problem_file_path)
+    file = models.FileField(upload_to=problem_file_path, storage=select_storage, max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
-    def filename(self):
-        return os.path.basename(self.file.name)
+
+def _raw_delete(queryset):
+    # Один DELETE без загрузки объектов, каскадов и сигналов — связанные строки
+    # и побочные эффекты обрабатывает вызывающий код
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_attachments(attachments):
+    """
+    Удаляет вложения и уменьшает счетчики ссылок их Blob одним UPDATE вместо release()
+    на каждый файл. Blob без ссылок затем удаляет Blob.delete_orphans().
+    """
+    references = attachments.filter(blob=OuterRef('pk')).order_by().values('blob').annotate(n=Count('pk'))
+    Blob.objects.filter(pk__in=attachments.values('blob')).update(
+        ref_count=F('ref_count') - _subquery(references, 'n')
+    )
+    return _raw_delete(attachments)
+
+
+class SolutionQuerySet(models.QuerySet):
+    def _lock_problems(self):
+        # Блокируем строки проблем (в PostgreSQL), чтобы одновременные запросы принимали
+        # решения одной проблемы по очереди; в SQLite запись и так последовательна
+        return list(
+            Problem.objects.select_for_update().filter(pk__in=self.values('problem_id'))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def accept(self):
+        """
+        Делает принятым по одному решению из queryset на каждую проблему — первое в порядке
+        вывода (уже принятое, иначе самое новое) — и снимает отметку с остальных решений
+        этих проблем. Число запросов не зависит от количества решений.
+        Возвращает количество затронутых проблем.
+        """
+        selected = Solution.objects.filter(pk__in=self.values('pk'))
+        first = selected.filter(problem_id=OuterRef('problem_id')).order_by('-is_accepted', '-created_at', '-id')
+        chosen = selected.filter(pk=Subquery(first.values('pk')[:1])).values('pk')
+        with transaction.atomic(using=self.db):
+            problem_ids = self._lock_problems()
+            # Уникальность принятого решения проверяется для каждой строки сразу, поэтому
+            # сначала снимаем старую отметку, затем ставим новую (одним UPDATE нельзя)
+            Solution.objects.filter(problem_id__in=problem_ids, is_accepted=True).exclude(
+                pk__in=chosen).update(is_accepted=False)
+            Solution.objects.filter(pk__in=chosen, is_accepted=False).update(is_accepted=True)
+            Problem.objects.filter(pk__in=problem_ids).refresh_counters(touch=True)
+        return len(problem_ids)
+
+    def _delete_rows(self):
+        _delete_attachments(SolutionFile.objects.filter(solution__in=self))
+        Problem.objects.filter(accepted_solution__in=self).update(accepted_solution=None)
+        return _raw_delete(self)
+
+    def bulk_delete(self):
+        """
+        Удаляет решения с файлами фиксированным числом запросов (см. ProblemQuerySet.bulk_delete),
+        пересчитывает счетчики и переиндексирует затронутые проблемы.
+        """
+        with transaction.atomic(using=self.db):
+            problems = Problem.objects.filter(pk__in=list(self.order_by().values_list('problem_id', flat=True).distinct()))
+            count = Solution.objects.filter(pk__in=self.values('pk'))._delete_rows()
+            Blob.delete_orphans()
+            problems.refresh_counters(touch=True)
+            get_search_backend().index_problems(problems.prefetch_related('solutions'))
+        return count
+
+    def unaccept(self):
+        """Снимает отметку о принятии с решений queryset. Возвращает количество решений."""
+        with transaction.atomic(using=self.db):
+            problem_ids = self._lock_problems()
+            count = Solution.objects.filter(pk__in=self.values('pk'), is_accepted=True).update(is_accepted=False)
+            Problem.objects.filter(pk__in=problem_ids).refresh_counters(touch=True)
+        return count
 
 
 class Solution(models.Model):
@@ -99,21 +397,100 @@ class Solution(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_accepted = models.BooleanField(default=False, verbose_name="Принятое решение")
 
+    objects = SolutionQuerySet.as_manager()
+
+    def validate_constraints(self, exclude=None):
+        # Формы админки принимают новое решение вместо прежнего (SolutionAdmin.save_model,
+        # SolutionInlineFormSet), поэтому одно принятое решение проверяет сама БД, а не форма
+        super().validate_constraints(exclude={*(exclude or ()), 'is_accepted'})
+
     def __str__(self):
         return f"Решение к {self.problem.title} от {self.author.username}"
 
     class Meta:
         ordering = ['-is_accepted', '-created_at']
+        indexes = [
+            # Решения проблемы в порядке вывода (страница проблемы, инлайн в админке)
+            models.Index(fields=['problem', '-is_accepted', '-created_at'], name='helpdesk_solution_problem_idx'),
+            # Список решений в админке
+            models.Index(fields=['-is_accepted', '-created_at'], name='helpdesk_solution_feed_idx'),
+        ]
+        constraints = [
+            # Не больше одного принятого решения на проблему. Частичный индекс по принятым
+            # заодно обслуживает поиск принятого решения (accept_solution, refresh_counters)
+            models.UniqueConstraint(fields=['problem'], condition=models.Q(is_accepted=True),
+                                    name='helpdesk_solution_one_accepted'),
+        ]
 
 
-class SolutionFile(models.Model):
+class SolutionFile(Attachment):
+    kind = 'solution'
+
     solution = models.ForeignKey(
         Solution,
         on_delete=models.CASCADE,
         related_name='files'
     )
-    file = models.FileField(upload_to=solution_file_path)
+    file = models.FileField(upload_to=solution_file_path, storage=select_storage, max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
-    def filename(self):
-        return os.path.basename(self.file.name)
\ No newline at end of file
+
+class ChunkedUpload(models.Model):
+    """Файл, загружаемый частями до отправки формы проблемы или решения."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.HELPDESK_UPLOAD_TEMP_DIR, f'{self.id.hex}.part')
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+class QueuedTask(models.Model):
+    """Задача очереди HELPDESK_TASKS_BACKEND = 'db', выполняется командой manage.py worker."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name="Задача")
+    args = models.JSONField(default=list, verbose_name="Аргументы")
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запуск не раньше")
+    # Воркер, взявший задачу, и срок, после которого она считается брошенной
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            # Выборка готовых к запуску задач воркером
+            models.Index(fields=['status', 'run_at'], name='helpdesk_task_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
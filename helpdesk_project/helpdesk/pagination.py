@@ -0,0 +1,150 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.cache import cache as default_cache
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(value, pk, direction):
+    raw = f'{direction}|{value.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (direction, value, pk) или None для испорченного токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, value, pk = raw.split('|')
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(value), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class CursorPaginator:
+    """
+    Keyset-пагинация по (field, id) в порядке убывания.
+
+    В отличие от Paginator не выполняет COUNT(*) и OFFSET: каждая страница —
+    это WHERE (field, id) < (курсор) ORDER BY field DESC, id DESC LIMIT n,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, queryset, per_page, field='created_at', count_cache_key=None, count_timeout=60,
+                 cache=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.count_cache_key = count_cache_key
+        self.count_timeout = count_timeout
+        self.cache = cache or default_cache
+
+    @cached_property
+    def count(self):
+        # Считается только если шаблон действительно выводит общее количество
+        if self.count_cache_key is None:
+            return self.queryset.count()
+        return self.cache.get_or_set(self.count_cache_key, self.queryset.count, self.count_timeout)
+
+    async def acount(self):
+        if 'count' not in self.__dict__:
+            if self.count_cache_key is None:
+                count = await self.queryset.acount()
+            else:
+                count = await self.cache.aget(self.count_cache_key)
+                if count is None:
+                    count = await self.queryset.acount()
+                    await self.cache.aset(self.count_cache_key, count, self.count_timeout)
+            self.__dict__['count'] = count
+        return self.count
+
+    def _page_queryset(self, token):
+        cursor = decode_cursor(token) if token else None
+        field = self.field
+
+        if cursor is None:
+            direction = 'next'
+            queryset = self.queryset.order_by(f'-{field}', '-id')
+        else:
+            direction, value, pk = cursor
+            if direction == 'next':
+                queryset = self.queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+                ).order_by(f'-{field}', '-id')
+            else:
+                queryset = self.queryset.filter(
+                    Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+                ).order_by(field, 'id')
+
+        # Берем на один объект больше, чтобы узнать, есть ли следующая страница
+        return queryset[:self.per_page + 1], direction, cursor is not None
+
+    def _make_page(self, items, direction, has_cursor):
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+
+        if direction == 'prev':
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, has_cursor
+
+        return CursorPage(items, self, has_next, has_previous)
+
+    def get_page(self, token=None):
+        queryset, direction, has_cursor = self._page_queryset(token)
+        return self._make_page(list(queryset), direction, has_cursor)
+
+    async def aget_page(self, token=None):
+        queryset, direction, has_cursor = self._page_queryset(token)
+        return self._make_page([obj async for obj in queryset], direction, has_cursor)
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _token(self, obj, direction):
+        return encode_cursor(getattr(obj, self.paginator.field), obj.pk, direction)
+
+    @property
+    def next_cursor(self):
+        return self._token(self.object_list[-1], 'next') if self.has_next() else None
+
+    @property
+    def previous_cursor(self):
+        return self._token(self.object_list[0], 'prev') if self.has_previous() else None
+
+
+async def aget_page(paginator, position):
+    """Асинхронный paginator.get_page() для Paginator и CursorPaginator."""
+    if isinstance(paginator, CursorPaginator):
+        return await paginator.aget_page(position)
+    # Paginator сам по себе синхронный: заранее считаем количество и загружаем страницу
+    paginator.count = await paginator.object_list.acount()
+    page = paginator.get_page(position)
+    page.object_list = [obj async for obj in page.object_list]
+    return page
@@ -0,0 +1,186 @@
+import logging
+import os
+import traceback
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import instrumentation, routers, staticfiles
+from .instrumentation import add_query_wrapper
+
+# Бюджет запросов к БД на представление.
+#
+# Бюджет задается декоратором @query_budget(n) или в HELPDESK_QUERY_BUDGETS по имени
+# URL ('problem_list', 'admin:helpdesk_problem_changelist'), числом для всех методов
+# или словарем {'GET': n, 'POST': m}. QueryBudgetMiddleware
+# запоминает каждый запрос вместе с местом в коде или шаблоне, откуда он выполнен,
+# и в режиме 'log' пишет отчет в лог helpdesk.queries, а в режиме 'raise' бросает
+# QueryBudgetExceeded — так регрессия ловится тестами, а не в продакшене.
+
+logger = logging.getLogger('helpdesk.queries')
+
+# Служебные команды транзакций не считаем повторами
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT')
+MAX_FRAMES = 4
+# Обертки запросов и сквозные middleware (только передают запрос дальше) не интересны в отчете
+SKIP_FILES = {__file__, instrumentation.__file__, routers.__file__, staticfiles.__file__}
+
+_current = ContextVar('helpdesk_query_log', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """
+    Задает бюджет запросов представления (число или словарь по HTTP-методу);
+    имеет приоритет над HELPDESK_QUERY_BUDGETS.
+    """
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def _location(filename, lineno, name):
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir) and 'site-packages' not in filename:
+        filename = os.path.relpath(filename, base_dir)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f'{filename}:{lineno} in {name}'
+
+
+def _source_frames():
+    """
+    Откуда выполнен запрос, самые глубокие места первыми: код, вызвавший ORM,
+    затем строки шаблонов и код проекта выше по стеку.
+    """
+    frames = []
+    base_dir = str(settings.BASE_DIR)
+    caller_found = False
+    for frame, lineno in traceback.walk_stack(None):
+        code = frame.f_code
+        filename = code.co_filename
+        if filename in SKIP_FILES:
+            continue
+        if code.co_name == 'render_annotated':
+            # Узел шаблона: показываем шаблон и строку, а не внутренности Django
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                location = f'{origin.template_name}:{token.lineno}'
+                if location not in frames:
+                    frames.append(location)
+        elif not caller_found:
+            # Первый кадр за пределами ORM — то, что запросило данные (даже если это код Django)
+            if f'django{os.sep}db{os.sep}' not in filename:
+                frames.append(_location(filename, lineno, code.co_name))
+                caller_found = True
+        elif filename.startswith(base_dir) and 'site-packages' not in filename:
+            frames.append(_location(filename, lineno, code.co_name))
+        if len(frames) >= MAX_FRAMES:
+            break
+    return frames
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, repr(params), _source_frames()))
+        return execute(sql, params, many, context)
+
+    def duplicates(self):
+        """Одинаковые запросы (SQL и параметры), выполненные больше одного раза."""
+        seen = {}
+        for sql, params, frames in self.queries:
+            if sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+                continue
+            seen.setdefault((sql, params), []).append(frames)
+        return [(sql, calls) for (sql, params), calls in seen.items() if len(calls) > 1]
+
+    def report(self, view_name, budget):
+        problems = []
+        if budget is not None and len(self.queries) > budget:
+            problems.append(f'{view_name}: {len(self.queries)} запросов при бюджете {budget}')
+            for sql, params, frames in self.queries:
+                problems.append(f'  {sql[:200]}')
+                problems.extend(f'      {frame}' for frame in frames)
+        for sql, calls in self.duplicates():
+            problems.append(f'{view_name}: запрос выполнен {len(calls)} раз: {sql[:200]}')
+            for frames in calls:
+                problems.append('    ' + ' <- '.join(frames or ['?']))
+        return '\n'.join(problems)
+
+
+def _record(execute, sql, params, many, context):
+    log = _current.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    return log(execute, sql, params, many, context)
+
+
+def budget_for(request):
+    match = request.resolver_match
+    if match is None:
+        return None, None
+    budget = getattr(match.func, 'query_budget', None)
+    if budget is None:
+        budget = settings.HELPDESK_QUERY_BUDGETS.get(match.view_name)
+    if isinstance(budget, dict):
+        # Отдельные бюджеты для чтения и записи: {'GET': 10, 'POST': 20}
+        budget = budget.get(request.method)
+    return match.view_name, budget
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.HELPDESK_QUERY_BUDGET_MODE not in ('log', 'raise'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        add_query_wrapper(_record)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        log = QueryLog()
+        token = _current.set(log)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.check(request, log)
+        return response
+
+    async def __acall__(self, request):
+        log = QueryLog()
+        token = _current.set(log)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.check(request, log)
+        return response
+
+    def check(self, request, log):
+        view_name, budget = budget_for(request)
+        if view_name is None:
+            return
+        report = log.report(view_name, budget)
+        if not report:
+            return
+        if settings.HELPDESK_QUERY_BUDGET_MODE == 'raise':
+            raise QueryBudgetExceeded(report)
+        logger.warning(report)
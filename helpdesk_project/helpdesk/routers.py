@@ -0,0 +1,108 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+# Чтение с реплики PostgreSQL.
+#
+# Представления, помеченные @read_replica (лента и страница проблемы), читают из базы
+# HELPDESK_READ_REPLICA, все записи идут в основную базу. Реплика отстает от основной,
+# поэтому после POST, PUT или DELETE PrimaryPinMiddleware ставит cookie, и следующие
+# HELPDESK_REPLICA_PIN_SECONDS секунд этот пользователь читает из основной базы —
+# иначе после добавления решения он мог бы не увидеть его на странице.
+
+PIN_COOKIE = 'helpdesk_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('helpdesk_use_replica', default=False)
+
+
+def replica_alias():
+    """Алиас реплики, если чтение с нее сейчас разрешено."""
+    if _use_replica.get():
+        return settings.HELPDESK_READ_REPLICA
+    return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        # Без явного ответа Django пишет в базу, из которой загружен объект, т.е. в реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, settings.HELPDESK_READ_REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит с основной базы через репликацию
+        if db != DEFAULT_DB_ALIAS and db == settings.HELPDESK_READ_REPLICA:
+            return False
+        return None
+
+
+def _replica_allowed(request):
+    return (settings.HELPDESK_READ_REPLICA is not None and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES)
+
+
+def read_replica(view_func):
+    """Читать данные представления с реплики (только безопасные методы)."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if not _replica_allowed(request):
+                return await view_func(request, *args, **kwargs)
+            # contextvar копируется в потоки sync_to_async, где выполняются запросы async ORM
+            token = _use_replica.set(True)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    else:
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _replica_allowed(request):
+                return view_func(request, *args, **kwargs)
+            token = _use_replica.set(True)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    return wrapper
+
+
+class PrimaryPinMiddleware:
+    """После записи временно направляет чтение пользователя в основную базу."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.HELPDESK_READ_REPLICA is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.HELPDESK_REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .stemmer import normalize, tokenize
+
+# Имя таблицы полнотекстового индекса (FTS5 в SQLite, tsvector в PostgreSQL).
+# rowid / problem_id совпадает с id проблемы.
+FTS_TABLE = 'helpdesk_problem_fts'
+
+
+def problem_document(problem):
+    """Текст проблемы и всех её решений для индексации."""
+    solutions = ' '.join(solution.description for solution in problem.solutions.all())
+    return problem.title, f'{problem.description} {solutions}'
+
+
+class BaseSearchBackend:
+    # Вес заголовка относительно описания и решений
+    title_weight = 10.0
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_problem(self, problem):
+        pass
+
+    def remove_problem(self, problem_id):
+        pass
+
+    def index_problems(self, problems):
+        """Индексирует набор проблем (решения лучше загрузить через prefetch_related)."""
+        for problem in problems:
+            self.index_problem(problem)
+
+    def remove_problems(self, problem_ids):
+        for problem_id in problem_ids:
+            self.remove_problem(problem_id)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def rebuild(self, problems):
+        self.clear()
+        count = 0
+        for problem in problems:
+            self.index_problem(problem)
+            count += 1
+        return count
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Поиск через icontains без индекса. Используется, если FTS недоступен."""
+
+    def search(self, queryset, query):
+        q_objects = Q()
+        for word in query.split():
+            # icontains ищет без учета регистра
+            q_objects |= Q(title__icontains=word) | Q(description__icontains=word)
+        return queryset.filter(q_objects)
+
+    def clear(self):
+        pass
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Индекс FTS5. Хранит уже стеммированный текст, т.к. FTS5 не умеет русскую морфологию."""
+
+    def match_expression(self, query):
+        # Каждое слово — префиксный запрос по основе, слова объединяются через OR
+        terms = ['"{}"*'.format(term.replace('"', '""')) for term in tokenize(query)]
+        return ' OR '.join(terms)
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        table = queryset.model._meta.db_table
+        # Соединение с индексом вместо коррелированного подзапроса: MATCH выполняется
+        # один раз на запрос, а не на каждую найденную строку.
+        # bm25 возвращает отрицательные значения: чем меньше, тем релевантнее
+        return queryset.extra(
+            select={'search_rank': f'bm25({FTS_TABLE}, %s, 1.0)'},
+            select_params=(self.title_weight,),
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = {table}.id'],
+            params=[match],
+        ).order_by('search_rank', '-id')
+
+    def index_problem(self, problem):
+        self.index_problems([problem])
+
+    def remove_problem(self, problem_id):
+        self.remove_problems([problem_id])
+
+    def index_problems(self, problems):
+        rows = [(problem.pk, *map(normalize, problem_document(problem))) for problem in problems]
+        self.remove_problems([pk for pk, title, body in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+    def remove_problems(self, problem_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in problem_ids])
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector с GIN-индексом и словарем russian."""
+
+    config = 'russian'
+
+    def search(self, queryset, query):
+        if not query.split():
+            return queryset
+        table = queryset.model._meta.db_table
+        tsquery = "websearch_to_tsquery(%s::regconfig, %s)"
+        or_query = ' or '.join(query.split())
+        rank = RawSQL(
+            f'SELECT ts_rank(document, {tsquery}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE}.problem_id = {table}.id',
+            (self.config, or_query),
+        )
+        matched = RawSQL(
+            f'SELECT problem_id FROM {FTS_TABLE} WHERE document @@ {tsquery}',
+            (self.config, or_query),
+        )
+        return queryset.filter(id__in=matched).annotate(search_rank=rank).order_by('-search_rank', '-id')
+
+    def index_problem(self, problem):
+        self.index_problems([problem])
+
+    def index_problems(self, problems):
+        rows = [(problem.pk, self.config, title, self.config, body)
+                for problem in problems for title, body in [problem_document(problem)]]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (problem_id, document) VALUES ('
+                f'%s, setweight(to_tsvector(%s::regconfig, %s), \'A\') || '
+                f'setweight(to_tsvector(%s::regconfig, %s), \'D\')) '
+                f'ON CONFLICT (problem_id) DO UPDATE SET document = EXCLUDED.document',
+                rows,
+            )
+
+    def remove_problem(self, problem_id):
+        self.remove_problems([problem_id])
+
+    def remove_problems(self, problem_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE problem_id = ANY(%s)', [list(problem_ids)])
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def fts_table_exists():
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Бэкенд из HELPDESK_SEARCH_BACKEND или выбранный по типу БД."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'HELPDESK_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor in BACKENDS and fts_table_exists():
+            _backend = BACKENDS[connection.vendor]()
+        else:
+            _backend = SimpleSearchBackend()
+    return _backend
+
+
+def reset_search_backend(**kwargs):
+    global _backend
+    _backend = None
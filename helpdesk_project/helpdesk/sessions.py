@@ -0,0 +1,38 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+# Продление сессий без записи на каждый запрос.
+#
+# Вместо SESSION_SAVE_EVERY_REQUEST сессия сохраняется (и продлевается на SESSION_COOKIE_AGE),
+# только когда до ее истечения остается меньше HELPDESK_SESSION_REFRESH_THRESHOLD секунд.
+# Время последнего продления хранится в самой сессии: Django не загружает expire_date
+# из таблицы, а для signed_cookies таблицы нет вовсе.
+
+REFRESHED_KEY = '_helpdesk_refreshed'
+
+
+def clear_expired_sessions():
+    """Удаляет истекшие сессии текущего SESSION_ENGINE (то же, что manage.py clearsessions)."""
+    engine = import_module(settings.SESSION_ENGINE)
+    engine.SessionStore.clear_expired()
+
+
+class SessionRefreshMiddleware(MiddlewareMixin):
+    """
+    Подключается после SessionMiddleware. Помечает сессию измененной, когда ее пора продлить.
+    Истекшие сессии удаляет не запрос пользователя, а воркер задач (см. tasks.run_worker)
+    или manage.py clearsessions.
+    """
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        # Сессию, которую запрос не читал, не загружаем ради проверки
+        if session is not None and session.accessed and not session.is_empty():
+            now = int(time.time())
+            remaining = settings.SESSION_COOKIE_AGE - (now - session.get(REFRESHED_KEY, 0))
+            if session.modified or remaining < settings.HELPDESK_SESSION_REFRESH_THRESHOLD:
+                session[REFRESHED_KEY] = now
+        return response
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_directions, invalidate_employee_stats
+from .models import Blob, Direction, Problem, ProblemFile, Solution, SolutionFile
+from .search import get_search_backend, reset_search_backend
+
+
+@receiver(post_save, sender=Problem)
+def index_problem(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index_problem(instance)
+
+
+@receiver(post_delete, sender=Problem)
+def unindex_problem(sender, instance, **kwargs):
+    get_search_backend().remove_problem(instance.pk)
+
+
+@receiver(post_save, sender=Solution)
+@receiver(post_delete, sender=Solution)
+def reindex_solution_problem(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # При каскадном удалении проблемы её строки уже может не быть
+    problem = Problem.objects.filter(pk=instance.problem_id).first()
+    if problem is not None:
+        get_search_backend().index_problem(problem)
+
+
+@receiver(setting_changed)
+def search_setting_changed(setting, **kwargs):
+    if setting == 'HELPDESK_SEARCH_BACKEND':
+        reset_search_backend()
+
+
+# Инвалидация кэша problem_list
+
+@receiver(pre_save, sender=Problem)
+def remember_problem_direction(sender, instance, raw=False, **kwargs):
+    # Проблему могли перенести в другое направление — запоминаем старое
+    instance._previous_direction_id = None
+    if instance.pk and not raw:
+        instance._previous_direction_id = Problem.objects.filter(
+            pk=instance.pk
+        ).values_list('direction_id', flat=True).first()
+
+
+@receiver(post_save, sender=Problem)
+@receiver(post_delete, sender=Problem)
+def invalidate_problem(sender, instance, **kwargs):
+    invalidate_directions([instance.direction_id, getattr(instance, '_previous_direction_id', None)])
+
+
+@receiver(post_save, sender=Solution)
+@receiver(post_delete, sender=Solution)
+@receiver(post_save, sender=ProblemFile)
+@receiver(post_delete, sender=ProblemFile)
+def invalidate_problem_child(sender, instance, **kwargs):
+    direction_id = Problem.objects.filter(pk=instance.problem_id).values_list('direction_id', flat=True).first()
+    invalidate_directions([direction_id])
+
+
+@receiver(post_save, sender=Direction)
+@receiver(post_delete, sender=Direction)
+def invalidate_direction(sender, instance, **kwargs):
+    invalidate_directions([instance.pk])
+
+
+@receiver(post_delete, sender=ProblemFile)
+@receiver(post_delete, sender=SolutionFile)
+def release_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        Blob.release(instance.blob_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_employees(sender, instance, update_fields=None, **kwargs):
+    # Вход в систему обновляет только last_login — на статистику это не влияет
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidate_employee_stats()
@@ -0,0 +1,211 @@
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Статические файлы в продакшене.
+#
+# collectstatic через CompressedManifestStaticFilesStorage сохраняет файлы с хэшем
+# содержимого в имени (style.css -> style.3f2a9c.css) и сжатые копии .gz и .br рядом
+# с ними. StaticFilesMiddleware отдает их из процесса Django без веб-сервера: выбирает
+# сжатую копию по Accept-Encoding, а файлы с хэшем в имени отдает с Cache-Control: immutable —
+# при повторном открытии страницы браузер не запрашивает их вовсе.
+
+# Не зависим от системной таблицы типов (на Windows реестр отдает text/plain для .js)
+CONTENT_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.mjs': 'text/javascript; charset=utf-8',
+    '.map': 'application/json',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.ttf': 'font/ttf',
+    '.txt': 'text/plain; charset=utf-8',
+    '.html': 'text/html; charset=utf-8',
+}
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.ico', '.ttf', '.txt', '.html', '.xml'}
+
+# Сжатая копия сохраняется, только если она заметно меньше оригинала
+MIN_RATIO = 0.95
+
+
+def _compressors():
+    yield 'gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield 'br', '.br', lambda data: brotli.compress(data, quality=11)
+
+
+ENCODINGS = {suffix: encoding for encoding, suffix, _ in _compressors()}
+
+
+def content_type(name):
+    extension = os.path.splitext(name)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def compress_file(path):
+    """Создает рядом с файлом сжатые копии .gz (и .br, если установлен brotli)."""
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE:
+        return []
+    with open(path, 'rb') as source:
+        data = source.read()
+    created = []
+    for encoding, suffix, compress in _compressors():
+        compressed = compress(data)
+        if len(compressed) < len(data) * MIN_RATIO:
+            with open(path + suffix, 'wb') as destination:
+                destination.write(compressed)
+            created.append(path + suffix)
+    return created
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который после collectstatic сжимает собранные файлы."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            for path in compress_file(self.path(name)):
+                yield name, os.path.relpath(path, self.location), True
+
+
+class StaticFile:
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = content_type(path)
+        self.last_modified = int(stat.st_mtime)
+        self.version = f'{stat.st_size:x}-{int(stat.st_mtime):x}'
+        self.immutable = immutable
+        # Сжатые копии: кодировка -> путь, лучшая (brotli) первой
+        self.variants = {
+            encoding: path + suffix
+            for suffix, encoding in sorted(ENCODINGS.items(), key=lambda item: item[1] != 'br')
+            if os.path.exists(path + suffix)
+        }
+
+    def etag(self, encoding):
+        # У каждой кодировки свое представление и свой ETag
+        return quote_etag(f'{self.version}-{encoding}' if encoding else self.version)
+
+
+def accepted_encodings(request):
+    header = request.headers.get('Accept-Encoding', '')
+    return {
+        token.split(';')[0].strip() for token in header.split(',')
+        if not re.search(r';\s*q=0(\.0*)?\s*$', token)
+    }
+
+
+class StaticFilesMiddleware:
+    """
+    Отдает STATIC_URL из процесса Django. В продакшене список файлов STATIC_ROOT
+    читается один раз при запуске, при HELPDESK_STATIC_USE_FINDERS (разработка) файлы
+    ищутся в исходных каталогах при каждом запросе и не кэшируются браузером.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        static_url = urlsplit(settings.STATIC_URL)
+        if not settings.HELPDESK_SERVE_STATIC or static_url.netloc:
+            # Статика на отдельном домене (CDN) — не наша забота
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.prefix = '/' + static_url.path.lstrip('/')
+        self.use_finders = settings.HELPDESK_STATIC_USE_FINDERS
+        self.files = {} if self.use_finders else self.scan(settings.STATIC_ROOT)
+
+    @staticmethod
+    def scan(root):
+        if not root or not os.path.isdir(root):
+            return {}
+        # Имена с хэшем из манифеста collectstatic никогда не меняют содержимое
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1] in ENCODINGS:
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[name] = StaticFile(path, name in hashed)
+        return files
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.serve(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        response = self.serve(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def find(self, name):
+        if not self.use_finders:
+            return self.files.get(name)
+        path = finders.find(name)
+        return StaticFile(path, False) if path and os.path.isfile(path) else None
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        static_file = self.find(request.path_info[len(self.prefix):])
+        if static_file is None:
+            return None
+
+        accepted = accepted_encodings(request)
+        encoding = next((encoding for encoding in static_file.variants if encoding in accepted), None)
+        etag = static_file.etag(encoding)
+        response = get_conditional_response(request, etag=etag, last_modified=static_file.last_modified)
+        if response is None:
+            path = static_file.variants[encoding] if encoding else static_file.path
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            del response['Content-Disposition']
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(static_file.last_modified)
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        if static_file.immutable:
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        elif self.use_finders:
+            response['Cache-Control'] = 'no-cache'
+        else:
+            response['Cache-Control'] = f'public, max-age={settings.HELPDESK_STATIC_MAX_AGE}'
+        return response
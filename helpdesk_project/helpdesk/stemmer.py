@@ -0,0 +1,132 @@
+import re
+
+# Упрощенная реализация стеммера Snowball (Портера) для русского языка.
+# Используется поисковым индексом, чтобы "принтер", "принтера" и "принтеры"
+# находились по одному и тому же запросу.
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+
+REFLEXIVE = ('ся', 'сь')
+
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено',
+    'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях',
+    'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом',
+    'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)
+
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _longest(word, endings):
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending):
+            return ending
+    return None
+
+
+def _remove(word, group_1, group_2=()):
+    """Удаляет окончание; окончания group_1 должны идти после 'а' или 'я'."""
+    candidates = []
+    ending = _longest(word, group_1)
+    if ending and word[:-len(ending)].endswith(('а', 'я')):
+        candidates.append(ending)
+    ending = _longest(word, group_2)
+    if ending:
+        candidates.append(ending)
+    if not candidates:
+        return word, False
+    ending = max(candidates, key=len)
+    return word[:-len(ending)], True
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not re.search('[а-я]', word):
+        return word
+
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    rv, removed = _remove(rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if not removed:
+        rv, _ = _remove(rv, (), REFLEXIVE)
+        ending = _longest(rv, ADJECTIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+            rv, _ = _remove(rv, PARTICIPLE_1, PARTICIPLE_2)
+        else:
+            rv, removed = _remove(rv, VERB_1, VERB_2)
+            if not removed:
+                rv, _ = _remove(rv, (), NOUN)
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3
+    r2 = (prefix + rv)[r2_start:]
+    ending = _longest(r2, DERIVATIONAL)
+    if ending:
+        rv = rv[:-len(ending)]
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        ending = _longest(rv, SUPERLATIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIR = 'blobs'
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    # Контрольная сумма могла быть посчитана заранее (см. uploads.finish_upload)
+    checksum = getattr(content, 'sha256', None)
+    if checksum:
+        return checksum
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_BLOCK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(checksum, filename):
+    """blobs/ab/cd/abcd...ef.jpg — два уровня каталогов, чтобы не складывать всё в один."""
+    ext = os.path.splitext(filename)[1].lower()[:16]
+    return f'{BLOB_DIR}/{checksum[:2]}/{checksum[2:4]}/{checksum}{ext}'
+
+
+def blob_hash(name):
+    """SHA-256 из имени, выданного ContentAddressedStorage, или None для старых путей."""
+    if not name or not name.startswith(f'{BLOB_DIR}/'):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранит каждое содержимое один раз под именем, производным от SHA-256.
+    Повторная загрузка того же файла не пишет на диск ничего нового.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save, переименовывать не нужно.
+        # Для blob-имени сюда попадаем, только если параллельный запрос успел
+        # записать тот же файл — содержимое совпадает, перезапись не нужна.
+        if blob_hash(name) and self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        name = blob_name(content_hash(content), name)
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            return name
+
+
+attachment_storage = ContentAddressedStorage()
+
+
+def select_storage():
+    return attachment_storage
@@ -0,0 +1,309 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import models, sessions, thumbnails
+from .storage import select_storage
+
+# Фоновые задачи: обработка файлов, уведомления, очистка.
+#
+# Функция, помеченная @task, ставится в очередь вызовом func.enqueue(*args) (аргументы —
+# JSON). HELPDESK_TASKS_BACKEND выбирает, где она выполнится:
+#   'thread'    — в пуле потоков процесса после фиксации транзакции (без повторов);
+#   'db'        — строка QueuedTask создается в текущей транзакции, выполняет её
+#                 manage.py worker, при ошибке — повтор с растущей паузой;
+#   'immediate' — сразу после фиксации транзакции (тесты, отладка).
+
+logger = logging.getLogger('helpdesk.tasks')
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 30
+# Наибольшая пауза воркера после ошибки БД, секунд
+MAX_BACKOFF = 60
+
+_executor = None
+_executor_lock = threading.Lock()
+_scheduler = None
+
+
+def task(max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY):
+    """Делает функцию уровня модуля фоновой задачей: добавляет func.enqueue(*args)."""
+    def decorator(func):
+        func.task_name = f'{func.__module__}.{func.__qualname__}'
+        func.max_attempts = max_attempts
+        func.retry_delay = retry_delay
+        func.enqueue = lambda *args, delay=0: enqueue(func, *args, delay=delay)
+        return func
+    return decorator
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.HELPDESK_TASK_THREADS, thread_name_prefix='tasks')
+    return _executor
+
+
+def _run_local(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Задача %s%r завершилась ошибкой', func.task_name, args)
+
+
+def enqueue(func, *args, delay=0):
+    backend = settings.HELPDESK_TASKS_BACKEND
+    if backend == 'db':
+        # Задача фиксируется вместе с данными: откат транзакции отменяет и её
+        return models.QueuedTask.objects.create(
+            name=func.task_name,
+            args=list(args),
+            max_attempts=func.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+    if backend == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_run_local, func, args))
+    else:
+        transaction.on_commit(lambda: _run_local(func, args))
+    return None
+
+
+# Очередь в БД
+
+def _abandoned(now):
+    # Взятые воркером, который упал, не завершив задачу (истек срок блокировки)
+    return Q(status=models.QueuedTask.RUNNING, locked_until__lt=now)
+
+
+def _ready(now):
+    # Готовые к запуску и брошенные, у которых остались попытки
+    return (Q(status=models.QueuedTask.QUEUED, run_at__lte=now)
+            | _abandoned(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def fail_abandoned(now=None):
+    """
+    Завершает ошибкой брошенные задачи, исчерпавшие попытки: задача, которая роняет
+    воркер (нехватка памяти, SIGKILL), не доходит до обработки исключения в run_task.
+    """
+    now = now or timezone.now()
+    count = models.QueuedTask.objects.filter(_abandoned(now), attempts__gte=F('max_attempts')).update(
+        status=models.QueuedTask.FAILED, finished_at=now, locked_by='', locked_until=None,
+        last_error='Воркер завершился, не выполнив задачу',
+    )
+    if count:
+        logger.error('Брошенных задач, исчерпавших попытки: %s', count)
+    return count
+
+
+def claim_tasks(worker_id, limit=10):
+    """
+    Берет до limit готовых задач. Каждая захватывается условным UPDATE, поэтому
+    несколько воркеров (в том числе на SQLite без SELECT FOR UPDATE) не возьмут одну задачу дважды.
+    """
+    now = timezone.now()
+    fail_abandoned(now)
+    candidates = models.QueuedTask.objects.filter(_ready(now)).order_by('run_at', 'id')
+    claimed = []
+    for pk in candidates.values_list('pk', flat=True)[:limit]:
+        if models.QueuedTask.objects.filter(_ready(now), pk=pk).update(
+            status=models.QueuedTask.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=settings.HELPDESK_TASK_LEASE),
+        ):
+            claimed.append(pk)
+    return list(models.QueuedTask.objects.filter(pk__in=claimed).order_by('run_at', 'id'))
+
+
+def run_task(queued):
+    """Выполняет захваченную задачу и записывает результат; возвращает True при успехе."""
+    tasks = models.QueuedTask.objects.filter(pk=queued.pk)
+    func = None
+    try:
+        func = import_string(queued.name)
+        with transaction.atomic():
+            func(*queued.args)
+    except Exception:
+        error = traceback.format_exc()
+        if queued.attempts < queued.max_attempts:
+            # Пауза растет вдвое с каждой попыткой: 30 с, 1 мин, 2 мин...
+            delay = getattr(func, 'retry_delay', DEFAULT_RETRY_DELAY) * 2 ** (queued.attempts - 1)
+            tasks.update(status=models.QueuedTask.QUEUED, run_at=timezone.now() + timedelta(seconds=delay),
+                         locked_by='', locked_until=None, last_error=error)
+            logger.warning('Задача %s (#%s), попытка %s: ошибка, повтор через %s с\n%s',
+                           queued.name, queued.pk, queued.attempts, delay, error)
+        else:
+            tasks.update(status=models.QueuedTask.FAILED, finished_at=timezone.now(),
+                         locked_by='', locked_until=None, last_error=error)
+            logger.error('Задача %s (#%s) не выполнена за %s попыток\n%s',
+                         queued.name, queued.pk, queued.attempts, error)
+        return False
+    tasks.update(status=models.QueuedTask.DONE, finished_at=timezone.now(), locked_by='', locked_until=None)
+    return True
+
+
+def purge_finished():
+    """Удаляет выполненные задачи старше HELPDESK_TASK_KEEP_DONE секунд."""
+    before = timezone.now() - timedelta(seconds=settings.HELPDESK_TASK_KEEP_DONE)
+    return models.QueuedTask.objects.filter(status=models.QueuedTask.DONE, finished_at__lt=before).delete()[0]
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def periodic_jobs():
+    """Обслуживание по расписанию: (интервал в секундах, функция)."""
+    jobs = [(3600, purge_finished)]
+    if settings.HELPDESK_SESSION_CLEANUP_INTERVAL:
+        jobs.append((settings.HELPDESK_SESSION_CLEANUP_INTERVAL, sessions.clear_expired_sessions))
+    return jobs
+
+
+def _close_old_connections():
+    # Как после запроса: закрываем соединения, ставшие непригодными или старше CONN_MAX_AGE.
+    # Внутри atomic (тесты) закрывать нельзя — транзакция была бы потеряна
+    if not transaction.get_connection().in_atomic_block:
+        close_old_connections()
+
+
+def _run_due_jobs(jobs, next_runs):
+    for i, (interval, job) in enumerate(jobs):
+        if time.monotonic() >= next_runs[i]:
+            job()
+            next_runs[i] = time.monotonic() + interval
+
+
+def run_scheduler(sleep=60.0, should_stop=lambda: False):
+    """
+    Выполняет periodic_jobs() без очереди задач: при бэкенде 'thread' воркера нет,
+    и обслуживание идет в фоновом потоке процесса сервера (см. start_scheduler).
+    """
+    jobs = periodic_jobs()
+    next_runs = [time.monotonic()] * len(jobs)
+    while not should_stop():
+        _close_old_connections()
+        try:
+            _run_due_jobs(jobs, next_runs)
+        except DatabaseError:
+            logger.exception('Ошибка БД при обслуживании по расписанию')
+        time.sleep(sleep)
+
+
+def start_scheduler():
+    """
+    Запускает run_scheduler в фоновом потоке, если задачи выполняются в процессе сервера
+    (HELPDESK_TASKS_BACKEND='thread'). Вызывается из wsgi.py и asgi.py один раз на процесс;
+    при бэкенде 'db' то же делает manage.py worker.
+    """
+    global _scheduler
+    with _executor_lock:
+        if settings.HELPDESK_TASKS_BACKEND != 'thread' or _scheduler is not None:
+            return None
+        _scheduler = threading.Thread(target=run_scheduler, name='tasks-scheduler', daemon=True)
+        _scheduler.start()
+    return _scheduler
+
+
+def run_worker(batch=10, sleep=1.0, once=False, should_stop=lambda: False, worker_id=None):
+    """
+    Цикл воркера: берет задачи пачками по batch, без задач ждет sleep секунд, между
+    пачками выполняет periodic_jobs(). once — выполнить все готовые задачи и выйти.
+    При ошибке БД (сервер перезапущен, соединение оборвано) воркер не падает, а повторяет
+    попытку с растущей паузой до MAX_BACKOFF секунд. Возвращает число выполненных задач.
+    """
+    worker_id = worker_id or worker_name()
+    processed = 0
+    failures = 0
+    jobs = periodic_jobs()
+    next_runs = [time.monotonic()] * len(jobs)
+    while not should_stop():
+        _close_old_connections()
+        try:
+            _run_due_jobs(jobs, next_runs)
+            claimed = claim_tasks(worker_id, batch)
+            for queued in claimed:
+                run_task(queued)
+                processed += 1
+                if should_stop():
+                    break
+        except DatabaseError:
+            if once:
+                raise
+            failures += 1
+            delay = min(sleep * 2 ** failures, MAX_BACKOFF)
+            logger.exception('Воркер %s: ошибка БД, повтор через %s с', worker_id, delay)
+            time.sleep(delay)
+            continue
+        failures = 0
+        if not claimed:
+            if once:
+                break
+            time.sleep(sleep)
+    return processed
+
+
+# Задачи приложения
+
+@task()
+def generate_thumbnails(name):
+    thumbnails.generate_thumbnails(name)
+
+
+@task()
+def delete_files(names):
+    """Удаляет файлы Blob и их миниатюры из хранилища."""
+    models.Blob.delete_many_files(names)
+
+
+@task()
+def scan_file(name):
+    """
+    Проверяет файл хранилища функцией HELPDESK_VIRUS_SCAN_HOOK(path). Хук возвращает None
+    для чистого файла или описание угрозы — тогда вложения с этим файлом удаляются.
+    """
+    if not settings.HELPDESK_VIRUS_SCAN_HOOK:
+        return
+    threat = import_string(settings.HELPDESK_VIRUS_SCAN_HOOK)(select_storage().path(name))
+    if not threat:
+        return
+    blobs = models.Blob.objects.filter(name=name)
+    problem_files = models.ProblemFile.objects.filter(blob__in=blobs)
+    solution_files = models.SolutionFile.objects.filter(blob__in=blobs)
+    problem_ids = set(problem_files.values_list('problem_id', flat=True))
+    problem_ids |= set(solution_files.values_list('solution__problem_id', flat=True))
+    models._delete_attachments(problem_files)
+    models._delete_attachments(solution_files)
+    models.Blob.delete_orphans()
+    models.Problem.objects.filter(pk__in=problem_ids).refresh_counters(touch=True)
+    logger.error('Файл %s заражен (%s), вложения удалены', name, threat)
+
+
+@task(max_attempts=5, retry_delay=60)
+def notify_problem_author(solution_id, url):
+    """Письмо автору проблемы о новом решении."""
+    solution = models.Solution.objects.select_related('problem__author', 'author').filter(pk=solution_id).first()
+    if solution is None or not solution.problem.author.email:
+        return
+    problem = solution.problem
+    send_mail(
+        f'Новое решение: {problem.title}',
+        f'Решение от {solution.author.username} к проблеме «{problem.title}»:\n\n'
+        f'{solution.description}\n\n{url}',
+        None,
+        [problem.author.email],
+    )
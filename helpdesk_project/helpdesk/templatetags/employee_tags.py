@@ -2,14 +2,20 @@ from django import template
 
 register = template.Library()
 
+# Фильтры работают с уже загруженными пользователями (страница, список),
+# а не строят новый QuerySet — иначе каждый вызов в шаблоне означал бы запрос к БД.
+
+
 @register.filter
 def active(users):
-    return users.filter(is_active=True)
+    return [user for user in users if user.is_active]
+
 
 @register.filter
 def staff(users):
-    return users.filter(is_staff=True)
+    return [user for user in users if user.is_staff]
+
 
 @register.filter
 def superuser(users):
-    return users.filter(is_superuser=True)
\ No newline at end of file
+    return [user for user in users if user.is_superuser]
@@ -1,3 +1,1563 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core import mail
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .benchmark import generate_data, render_benchmark, run_benchmarks, sqlite_concurrency
+from .cache import get_cache
+from .instrumentation import registry
+from .models import Blob, ChunkedUpload, Direction, Problem, ProblemFile, QueuedTask, Solution, SolutionFile
+from .storage import attachment_storage
+from .querybudget import QueryBudgetExceeded, QueryLog
+from .routers import PIN_COOKIE, ReplicaRouter, read_replica
+from .sessions import REFRESHED_KEY, SessionRefreshMiddleware
+from .pagination import CursorPaginator, decode_cursor
+from .search import PostgresSearchBackend, SQLiteFTSBackend, get_search_backend
+from .stemmer import stem
+from .thumbnails import thumbnail_name
+from . import tasks, uploads, views
+from .templatetags import employee_tags
+
+
+# Данные TestCase не закоммичены и через отдельное соединение реплики не видны
+@override_settings(HELPDESK_READ_REPLICA=None)
+class HelpdeskTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov', password='pass')
+        cls.direction = Direction.objects.create(name='OS')
+        cls.other_direction = Direction.objects.create(name='TEL')
+
+    def setUp(self):
+        get_cache().clear()
+
+    @classmethod
+    def create_problem(cls, title, description='', direction=None):
+        return Problem.objects.create(
+            title=title,
+            description=description or title,
+            direction=direction or cls.direction,
+            author=cls.user,
+        )
+
+
+class StemmerTests(TestCase):
+    def test_word_forms_share_stem(self):
+        self.assertEqual(stem('принтер'), stem('принтера'))
+        self.assertEqual(stem('принтеры'), stem('принтеров'))
+        self.assertEqual(stem('Ошибка'), stem('ошибкой'))
+
+    def test_non_cyrillic_words_are_lowercased(self):
+        self.assertEqual(stem('Windows'), 'windows')
+
+
+class SearchTests(HelpdeskTestCase):
+    def search(self, query, **params):
+        response = self.client.get(reverse('problem_list'), {'query': query, **params})
+        return list(response.context['problems'])
+
+    def test_backend_is_fts(self):
+        expected = {'sqlite': SQLiteFTSBackend, 'postgresql': PostgresSearchBackend}[connection.vendor]
+        self.assertIsInstance(get_search_backend(), expected)
+
+    def test_search_handles_morphology(self):
+        problem = self.create_problem('Не печатает принтер')
+        self.create_problem('Не работает телефон')
+        self.assertEqual(self.search('принтеры'), [problem])
+
+    def test_title_ranked_above_description(self):
+        in_description = self.create_problem('Сбой', 'После обновления сломалась камера')
+        in_title = self.create_problem('Камера не включается', 'Нет изображения')
+        self.assertEqual(self.search('камера'), [in_title, in_description])
+
+    def test_search_includes_solutions(self):
+        problem = self.create_problem('Не открывается программа')
+        Solution.objects.create(problem=problem, author=self.user, description='Переустановить драйвер')
+        self.assertEqual(self.search('драйвера'), [problem])
+
+    def test_search_combined_with_direction(self):
+        self.create_problem('Ошибка звонка')
+        problem = self.create_problem('Ошибка звонка', direction=self.other_direction)
+        self.assertEqual(self.search('ошибка', direction=self.other_direction.pk), [problem])
+
+    def test_index_follows_updates_and_deletes(self):
+        problem = self.create_problem('Медленный интернет', 'Страницы долго грузятся')
+        problem.title = 'Медленный компьютер'
+        problem.save()
+        self.assertEqual(self.search('интернет'), [])
+        self.assertEqual(self.search('компьютер'), [problem])
+        problem.delete()
+        self.assertEqual(self.search('компьютер'), [])
+
+
+class ProblemCountersTests(HelpdeskTestCase):
+    def test_solution_post_updates_counters(self):
+        problem = self.create_problem('Нет звука')
+        self.client.force_login(self.user)
+        self.client.post(reverse('problem_detail', args=[problem.pk]), {'description': 'Проверить кабель'})
+        problem.refresh_from_db()
+        self.assertEqual(problem.solutions_count, 1)
+        self.assertFalse(problem.is_solved)
+        self.assertEqual(problem.last_activity_at, problem.solutions.get().created_at)
+
+    def test_accept_solution_sets_accepted(self):
+        problem = self.create_problem('Нет звука')
+        solution = Solution.objects.create(problem=problem, author=self.user, description='Кабель')
+        self.client.force_login(self.user)
+        self.client.get(reverse('accept_solution', args=[problem.pk, solution.pk]))
+        problem.refresh_from_db()
+        self.assertEqual(problem.accepted_solution, solution)
+        self.assertQuerySetEqual(Problem.objects.solved(), [problem])
+
+    def test_refresh_counters_rebuilds_from_scratch(self):
+        problem = self.create_problem('Нет звука')
+        Solution.objects.create(problem=problem, author=self.user, description='Кабель', is_accepted=True)
+        Solution.objects.create(problem=problem, author=self.user, description='Драйвер')
+        Problem.objects.all().refresh_counters()
+        problem.refresh_from_db()
+        self.assertEqual(problem.solutions_count, 2)
+        self.assertEqual(problem.files_count, 0)
+        self.assertTrue(problem.is_solved)
+
+
+class AcceptSolutionTests(HelpdeskTestCase):
+    def add_solutions(self, problem, count):
+        return [Solution.objects.create(problem=problem, author=self.user, description=f'Решение {i}')
+                for i in range(count)]
+
+    def accepted(self):
+        return set(Solution.objects.filter(is_accepted=True).values_list('pk', flat=True))
+
+    def test_accept_replaces_previous(self):
+        problem = self.create_problem('Нет звука')
+        first, second = self.add_solutions(problem, 2)
+        Solution.objects.filter(pk=first.pk).accept()
+        self.assertEqual(Solution.objects.filter(pk=second.pk).accept(), 1)
+        self.assertEqual(self.accepted(), {second.pk})
+        problem.refresh_from_db()
+        self.assertEqual(problem.accepted_solution, second)
+
+        self.assertEqual(Solution.objects.filter(pk=second.pk).unaccept(), 1)
+        problem.refresh_from_db()
+        self.assertFalse(problem.is_solved)
+
+    def test_one_accepted_solution_per_problem(self):
+        problem = self.create_problem('Нет звука')
+        Solution.objects.create(problem=problem, author=self.user, description='Кабель', is_accepted=True)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Solution.objects.create(problem=problem, author=self.user, description='Драйвер', is_accepted=True)
+
+    def test_bulk_accept_cost_does_not_depend_on_selection(self):
+        def accept_all():
+            with CaptureQueriesContext(connection) as context:
+                Solution.objects.filter(problem__in=Problem.objects.all()).accept()
+            return len(context)
+
+        for i in range(2):
+            self.add_solutions(self.create_problem(f'Проблема {i}'), 2)
+        expected = accept_all()
+        for i in range(10):
+            self.add_solutions(self.create_problem(f'Ещё {i}'), 3)
+        self.assertEqual(accept_all(), expected)
+        self.assertEqual(Problem.objects.solved().count(), 12)
+
+    def test_first_solution_is_chosen(self):
+        problem = self.create_problem('Нет звука')
+        old, middle, new = self.add_solutions(problem, 3)
+        # Из нескольких выбранных — самое новое
+        Solution.objects.filter(pk__in=[old.pk, middle.pk]).accept()
+        self.assertEqual(self.accepted(), {middle.pk})
+        # Уже принятое решение остается принятым
+        Solution.objects.filter(problem=problem).accept()
+        self.assertEqual(self.accepted(), {middle.pk})
+
+    def test_author_only_and_404_for_foreign_solution(self):
+        problem = self.create_problem('Нет звука')
+        other = self.create_problem('Нет сети')
+        solution, = self.add_solutions(other, 1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('accept_solution', args=[problem.pk, solution.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.accepted(), set())
+
+    def test_admin_switches_accepted_solution(self):
+        problem = self.create_problem('Нет звука')
+        first, second = self.add_solutions(problem, 2)
+        Solution.objects.filter(pk=first.pk).accept()
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+        response = self.client.post(reverse('admin:helpdesk_solution_change', args=[second.pk]), {
+            'problem': problem.pk,
+            'description': second.description,
+            'is_accepted': 'on',
+            'files-TOTAL_FORMS': 0,
+            'files-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.accepted(), {second.pk})
+        problem.refresh_from_db()
+        self.assertEqual(problem.accepted_solution, second)
+
+
+class AdminQueryCountTests(HelpdeskTestCase):
+    changelists = ['direction', 'problem', 'solution']
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin)
+
+    def add_problems(self, count):
+        for i in range(count):
+            problem = self.create_problem(f'Проблема {i}', direction=[self.direction, self.other_direction][i % 2])
+            ProblemFile.objects.create(problem=problem, file='problems/log.txt')
+            for j in range(2):
+                solution = Solution.objects.create(problem=problem, author=self.user, description=f'Решение {j}')
+                SolutionFile.objects.create(solution=solution, file='solutions/screen.png')
+            problem.refresh_counters()
+
+    def count_queries(self, url):
+        # Первый запрос прогревает кэши (ContentType и т.п.)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(context)
+
+    def test_changelists_cost_does_not_depend_on_page_size(self):
+        self.add_problems(1)
+        urls = [reverse(f'admin:helpdesk_{name}_changelist') for name in self.changelists]
+        expected = [self.count_queries(url) for url in urls]
+        self.add_problems(10)
+        for url, num in zip(urls, expected):
+            with self.subTest(url=url), self.assertNumQueries(num):
+                self.client.get(url)
+
+    def test_problem_change_page_cost_does_not_depend_on_solutions(self):
+        self.add_problems(1)
+        problem = Problem.objects.get()
+        url = reverse('admin:helpdesk_problem_change', args=[problem.pk])
+        expected = self.count_queries(url)
+        for i in range(5):
+            solution = Solution.objects.create(problem=problem, author=self.user, description=f'Ещё {i}')
+            SolutionFile.objects.create(solution=solution, file='solutions/screen.png')
+        with self.assertNumQueries(expected):
+            self.client.get(url)
+
+
+@override_settings(HELPDESK_CURSOR_PAGINATION=True)
+class CursorPaginationTests(HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.problems = [self.create_problem(f'Проблема {i}') for i in range(14)]
+        self.problems.reverse()
+
+    def get_page(self, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        return self.client.get(reverse('problem_list'), params).context['problems']
+
+    def test_walk_forward_and_back(self):
+        page = self.get_page()
+        seen = list(page)
+        while page.has_next():
+            page = self.get_page(page.next_cursor)
+            seen += list(page)
+        self.assertEqual(seen, self.problems)
+        self.assertEqual(len(page), 2)
+
+        page = self.get_page(page.previous_cursor)
+        self.assertEqual(list(page), self.problems[6:12])
+        self.assertTrue(page.has_next())
+
+    def test_deep_page_costs_same_as_first(self):
+        first = self.get_page()
+        second = self.get_page(first.next_cursor)
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as first_queries:
+            self.get_page()
+        get_cache().clear()
+        with self.assertNumQueries(len(first_queries)):
+            self.get_page(second.next_cursor)
+
+    def test_total_not_counted_by_default(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('problem_list'))
+        self.assertFalse(any(query['sql'].startswith('SELECT COUNT(*)') for query in context))
+        self.assertNotContains(response, 'Найдено')
+
+    @override_settings(HELPDESK_CURSOR_SHOW_TOTAL=True)
+    def test_total_is_opt_in(self):
+        response = self.client.get(reverse('problem_list'))
+        self.assertEqual(response.context['problems'].paginator.count, 14)
+        self.assertContains(response, 'Найдено')
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        Problem.objects.update(created_at=self.problems[0].created_at)
+        paginator = CursorPaginator(Problem.objects.all(), 5)
+        page = paginator.get_page()
+        ids = [p.pk for p in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            ids += [p.pk for p in page]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 14)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor('мусор'))
+        self.assertEqual(list(self.get_page('bm90LWEtY3Vyc29y')), self.problems[:6])
+
+
+class ProblemListCacheTests(HelpdeskTestCase):
+    def get(self, **params):
+        return self.client.get(reverse('problem_list'), params)
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            self.get(**params)
+        return [query['sql'] for query in context if 'helpdesk_problem' in query['sql']]
+
+    def test_page_is_served_from_cache(self):
+        self.create_problem('Нет звука')
+        self.assertTrue(self.count_queries())
+        # Остается только запрос агрегатов для ETag (ProblemQuerySet.change_marker)
+        queries = self.count_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('MAX(', queries[0])
+
+    def test_change_invalidates_only_affected_direction(self):
+        problem = self.create_problem('Нет звука')
+        self.create_problem('Нет гудка', direction=self.other_direction)
+        for params in ({}, {'direction': self.direction.pk}, {'direction': self.other_direction.pk}):
+            self.get(**params)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('problem_detail', args=[problem.pk]), {'description': 'Проверить кабель'})
+
+        self.assertEqual(self.count_queries(direction=self.other_direction.pk), [])
+        response = self.get(direction=self.direction.pk)
+        self.assertEqual(response.context['problems'][0].solutions_count, 1)
+        response = self.get()
+        self.assertEqual(response.context['problems'].paginator.count, 2)
+
+    def test_moving_problem_invalidates_old_direction(self):
+        problem = self.create_problem('Нет звука')
+        self.assertEqual(len(self.get(direction=self.direction.pk).context['problems']), 1)
+        problem.direction = self.other_direction
+        problem.save()
+        self.assertEqual(len(self.get(direction=self.direction.pk).context['problems']), 0)
+        self.assertEqual(len(self.get(direction=self.other_direction.pk).context['problems']), 1)
+
+
+class ConditionalPageTests(HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.problem = self.create_problem('Нет звука')
+        self.url = reverse('problem_detail', args=[self.problem.pk])
+        self.client.force_login(self.user)
+
+    def test_detail_not_modified_without_rendering(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+        response = self.client.get(self.url, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_update_validators(self):
+        etag = self.client.get(self.url)['ETag']
+        list_etag = self.client.get(reverse('problem_list'))['ETag']
+        solution = Solution.objects.create(problem=self.problem, author=self.user, description='Проверить кабель')
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertContains(response, 'Проверить кабель')
+        response = self.client.get(reverse('problem_list'), headers={'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 200)
+
+        # Принятие решения не меняет даты, но страница должна обновиться
+        etag = self.client.get(self.url)['ETag']
+        Solution.objects.filter(pk=solution.pk).accept()
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_accept_updates_last_modified(self):
+        solution = Solution.objects.create(problem=self.problem, author=self.user, description='Проверить кабель')
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Problem.objects.filter(pk=self.problem.pk).update(updated_at=hour_ago, last_activity_at=hour_ago)
+        Solution.objects.filter(pk=solution.pk).update(created_at=hour_ago)
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        # Клиент без If-None-Match не должен получить 304 после принятия решения
+        Solution.objects.filter(pk=solution.pk).accept()
+        response = self.client.get(self.url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+
+    def test_etag_depends_on_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_pending_messages_disable_validators(self):
+        self.client.post(self.url, {'description': 'Проверить кабель'})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Решение успешно добавлено')
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(HELPDESK_PRIVATE_CACHE_SECONDS=60)
+    def test_private_cache_policy(self):
+        response = self.client.get(reverse('problem_list'))
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+        self.assertIn('Cookie', response['Vary'])
+
+
+class ProblemCardCacheTests(HelpdeskTestCase):
+    def card_key(self, problem):
+        return make_template_fragment_key('problem_card', [
+            problem.pk, problem.updated_at, problem.solutions_count, problem.accepted_solution_id,
+            problem.direction.display_name, problem.author.username,
+        ])
+
+    def test_card_is_cached_and_refreshed_by_solutions(self):
+        problem = self.create_problem('Нет звука')
+        self.client.get(reverse('problem_list'))
+        self.assertIn('Нет звука', get_cache().get(self.card_key(problem)))
+
+        solution = Solution.objects.create(problem=problem, author=self.user, description='Проверить кабель')
+        problem.refresh_counters()
+        self.assertIsNone(get_cache().get(self.card_key(problem)))
+        self.assertContains(self.client.get(reverse('problem_list')), 'В процессе')
+
+        Solution.objects.filter(pk=solution.pk).accept()
+        self.assertContains(self.client.get(reverse('problem_list')), 'Решено')
+
+    @override_settings(HELPDESK_CARD_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        problem = self.create_problem('Нет звука')
+        self.assertContains(self.client.get(reverse('problem_list')), 'Нет звука')
+        self.assertIsNone(get_cache().get(self.card_key(problem)))
+
+
+class AsyncViewsTests(HelpdeskTestCase):
+    """Представления чтения работают под ASGI без обращений к БД из event loop."""
+
+    async def test_problem_list(self):
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(self.create_problem)('Нет звука')
+        response = await self.async_client.get(reverse('problem_list'), {'status': 'unsolved'})
+        self.assertContains(response, 'Нет звука')
+        self.assertContains(response, 'ivanov')
+
+    @override_settings(HELPDESK_CURSOR_PAGINATION=True)
+    async def test_problem_list_cursor(self):
+        for i in range(8):
+            await sync_to_async(self.create_problem)(f'Проблема {i}')
+        response = await self.async_client.get(reverse('problem_list'))
+        self.assertEqual(len(response.context['problems']), 6)
+        response = await self.async_client.get(
+            reverse('problem_list'), {'cursor': response.context['problems'].next_cursor}
+        )
+        self.assertEqual(len(response.context['problems']), 2)
+
+    async def test_search(self):
+        await sync_to_async(self.create_problem)('Не печатает принтер')
+        response = await self.async_client.get(reverse('problem_list'), {'query': 'принтеры'})
+        self.assertContains(response, 'Не печатает принтер')
+
+    async def test_problem_detail_and_solution(self):
+        problem = await sync_to_async(self.create_problem)('Нет звука')
+        url = reverse('problem_detail', args=[problem.pk])
+        self.assertContains(await self.async_client.get(url), 'Нет звука')
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(url, {'description': 'Проверить кабель'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        await problem.arefresh_from_db()
+        self.assertEqual(problem.solutions_count, 1)
+        self.assertContains(await self.async_client.get(url), 'Проверить кабель')
+
+    async def test_missing_problem(self):
+        response = await self.async_client.get(reverse('problem_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+def instrumented_templates():
+    templates = [dict(engine) for engine in settings.TEMPLATES]
+    templates[0]['BACKEND'] = 'helpdesk.instrumentation.InstrumentedTemplates'
+    return templates
+
+
+@override_settings(HELPDESK_METRICS_ENABLED=True, HELPDESK_METRICS_SAMPLE_RATE=1.0,
+                   TEMPLATES=instrumented_templates())
+class InstrumentationTests(HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def get_logged(self, url, **params):
+        with self.assertLogs('helpdesk.requests', 'INFO') as logs:
+            response = self.client.get(url, params)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_problem_list_record(self):
+        self.create_problem('Нет звука')
+        response, record = self.get_logged(reverse('problem_list'), query='звук')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(record['view'], 'problem_list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertIn('view_ms', record)
+        self.assertEqual((record['cache_hits'], record['cache_misses']), (0, 1))
+
+        _, record = self.get_logged(reverse('problem_list'), query='звук')
+        self.assertEqual((record['cache_hits'], record['cache_misses']), (1, 0))
+
+    def test_sampling(self):
+        with override_settings(HELPDESK_METRICS_SAMPLE_RATE=0.0):
+            with self.assertNoLogs('helpdesk.requests', 'INFO'):
+                self.client.get(reverse('problem_list'))
+
+    @override_settings(HELPDESK_METRICS_SAMPLE_RATE=0.0)
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('problem_list'))
+        self.client.get(reverse('problem_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('helpdesk_requests_total{view="problem_list",method="GET",status="200"} 2', body)
+        self.assertIn('helpdesk_request_duration_seconds_count{view="problem_list"} 2', body)
+        self.assertIn('helpdesk_cache_requests_total{view="problem_list",result="hit"} 1', body)
+
+    @override_settings(HELPDESK_METRICS_SAMPLE_RATE=0.0)
+    def test_metrics_access(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.86.104')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(HELPDESK_METRICS_ENABLED=False)
+    def test_disabled(self):
+        with self.assertNoLogs('helpdesk.requests', 'INFO'):
+            self.client.get(reverse('problem_list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+@override_settings(HELPDESK_QUERY_BUDGET_MODE='raise')
+class QueryBudgetTests(HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(self.admin)
+        self.problem = self.create_problem('Нет звука')
+        for i in range(3):
+            self.solution = Solution.objects.create(problem=self.problem, author=self.user, description=f'Решение {i}')
+        self.problem.refresh_counters()
+
+    def budgeted_urls(self):
+        return {
+            'problem_list': reverse('problem_list'),
+            'problem_detail': reverse('problem_detail', args=[self.problem.pk]),
+            'problem_create': reverse('problem_create'),
+            'problem_edit': reverse('problem_edit', args=[self.problem.pk]),
+            'employee_list': reverse('employee_list'),
+            'employee_create': reverse('employee_create'),
+            'employee_edit': reverse('employee_edit', args=[self.user.pk]),
+            'admin:index': reverse('admin:index'),
+            'admin:helpdesk_problem_changelist': reverse('admin:helpdesk_problem_changelist'),
+            'admin:helpdesk_problem_change': reverse('admin:helpdesk_problem_change', args=[self.problem.pk]),
+            'admin:helpdesk_solution_changelist': reverse('admin:helpdesk_solution_changelist'),
+            'admin:helpdesk_solution_change': reverse('admin:helpdesk_solution_change', args=[self.solution.pk]),
+            'admin:helpdesk_direction_changelist': reverse('admin:helpdesk_direction_changelist'),
+            'admin:helpdesk_direction_change': reverse('admin:helpdesk_direction_change', args=[self.direction.pk]),
+            'api_problem_list': reverse('api_problem_list'),
+            'api_problem_detail': reverse('api_problem_detail', args=[self.problem.pk]),
+            'api_solution_list': reverse('api_solution_list', args=[self.problem.pk]),
+            'api_direction_list': reverse('api_direction_list'),
+        }
+
+    def test_views_stay_within_budget(self):
+        urls = self.budgeted_urls()
+        self.assertEqual(set(urls), set(settings.HELPDESK_QUERY_BUDGETS))
+        for name, url in urls.items():
+            with self.subTest(view=name):
+                # Первый запрос — с холодными кэшами (ContentType, кэш страниц)
+                get_cache().clear()
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(self.client.get(url, {'q': 'звук'}).status_code, 200)
+
+    def test_writes_stay_within_budget(self):
+        url = reverse('problem_detail', args=[self.problem.pk])
+        self.assertEqual(self.client.post(url, {'description': 'Проверить кабель'}).status_code, 302)
+
+    def test_over_budget_reports_source(self):
+        budgets = {**settings.HELPDESK_QUERY_BUDGETS, 'employee_list': 2}
+        with override_settings(HELPDESK_QUERY_BUDGETS=budgets):
+            with self.assertRaises(QueryBudgetExceeded) as context:
+                self.client.get(reverse('employee_list'))
+        report = str(context.exception)
+        self.assertIn('employee_list', report)
+        self.assertIn('при бюджете 2', report)
+        self.assertIn('helpdesk/views.py', report)
+        self.assertIn('helpdesk/employee_list.html', report)
+        # Сквозные middleware не засоряют отчет
+        self.assertNotIn('staticfiles.py', report)
+        self.assertNotIn('routers.py', report)
+
+    def test_duplicate_queries(self):
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            for _ in range(2):
+                list(Problem.objects.filter(pk=self.problem.pk))
+            list(Problem.objects.filter(pk=0))
+        duplicates = log.duplicates()
+        self.assertEqual(len(duplicates), 1)
+        sql, calls = duplicates[0]
+        self.assertIn('helpdesk_problem', sql)
+        self.assertEqual(len(calls), 2)
+        self.assertIn('helpdesk/tests.py', calls[0][0])
+
+    def test_per_method_and_decorator_budgets(self):
+        budgets = {**settings.HELPDESK_QUERY_BUDGETS, 'problem_list': {'GET': 1}}
+        with override_settings(HELPDESK_QUERY_BUDGETS=budgets):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('problem_list'))
+        self.assertEqual(views.attachment_download.query_budget, 8)
+
+
+class EmployeeListTests(HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='pass')
+        for i in range(7):
+            User.objects.create_user(f'user{i}', is_staff=i % 2 == 0, is_active=i != 3)
+
+    def get(self):
+        request = RequestFactory().get(reverse('employee_list'))
+        request.user = self.admin
+        return views.employee_list(request)
+
+    def test_stats_in_one_query(self):
+        # Одна агрегирующая статистика и одна выборка страницы
+        with self.assertNumQueries(2):
+            response = self.get()
+        self.assertContains(response, '<span class="stat-value">9</span>', html=True)
+        self.assertContains(response, '<span class="stat-value">8</span>', html=True)
+        self.assertContains(response, '<span class="stat-value">5</span>', html=True)
+        self.assertContains(response, '<span class="stat-value">1</span>', html=True)
+
+        # Статистика берется из кэша
+        with self.assertNumQueries(1):
+            self.get()
+
+    def test_stats_invalidated_on_user_change(self):
+        self.get()
+        User.objects.create_user('new')
+        with self.assertNumQueries(2):
+            self.assertContains(self.get(), '<span class="stat-value">10</span>', html=True)
+
+    def test_filters_use_fetched_users(self):
+        users = list(User.objects.order_by('username'))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(employee_tags.active(users)), 8)
+            self.assertEqual(len(employee_tags.staff(users)), 5)
+            self.assertEqual([user.username for user in employee_tags.superuser(users)], ['admin'])
+
+
+class ExplainQueriesTests(HelpdeskTestCase):
+    def test_hot_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('explain_queries', stdout=out)
+        plan = out.getvalue()
+        if connection.vendor == 'sqlite':
+            for index in ('helpdesk_problem_feed_idx', 'helpdesk_problem_dir_feed_idx',
+                          'helpdesk_solution_problem_idx', 'helpdesk_solution_one_accepted',
+                          'helpdesk_solution_feed_idx'):
+                self.assertIn(index, plan)
+
+
+@override_settings(HELPDESK_READ_REPLICA='replica')
+class ReplicaRouterTests(HelpdeskTestCase):
+    def route(self, request):
+        # Представление возвращает базу, которую роутер выберет для чтения и записи
+        router = ReplicaRouter()
+        view = read_replica(lambda request: (router.db_for_read(Problem), router.db_for_write(Problem)))
+        return view(request)
+
+    def test_safe_methods_read_from_replica(self):
+        factory = RequestFactory()
+        self.assertEqual(self.route(factory.get('/')), ('replica', 'default'))
+        self.assertEqual(self.route(factory.post('/')), (None, 'default'))
+        self.assertIsNone(ReplicaRouter().db_for_read(Problem))
+
+    def test_pinned_to_primary_after_write(self):
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.route(request), (None, 'default'))
+
+    def test_async_view(self):
+        router = ReplicaRouter()
+
+        @read_replica
+        async def view(request):
+            return await sync_to_async(router.db_for_read)(Problem)
+
+        self.assertEqual(async_to_sync(view)(RequestFactory().get('/')), 'replica')
+
+    def test_migrations_skip_replica(self):
+        router = ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'helpdesk'))
+        self.assertIsNone(router.allow_migrate('default', 'helpdesk'))
+
+    @override_settings(HELPDESK_READ_REPLICA='default')
+    def test_write_sets_pin_cookie(self):
+        problem = self.create_problem('Не печатает принтер')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('problem_detail', args=[problem.pk]), {'description': 'Переустановить драйвер'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.HELPDESK_REPLICA_PIN_SECONDS)
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('problem_detail', args=[problem.pk])).cookies)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+class SessionRefreshTests(HelpdeskTestCase):
+    def session_writes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return [query['sql'] for query in queries if 'django_session' in query['sql']
+                and not query['sql'].startswith('SELECT')]
+
+    def test_read_only_pages_do_not_write_session(self):
+        self.client.force_login(self.user)
+        url = reverse('problem_list')
+        self.assertTrue(self.session_writes(url))  # первое продление после входа
+        self.assertEqual(self.session_writes(url), [])
+        self.assertEqual(self.session_writes(url), [])
+
+    def test_refresh_below_threshold(self):
+        self.client.force_login(self.user)
+        session = self.client.session
+        stale = int(time.time()) - settings.SESSION_COOKIE_AGE + settings.HELPDESK_SESSION_REFRESH_THRESHOLD - 60
+        session[REFRESHED_KEY] = stale
+        session.save()
+
+        self.assertTrue(self.session_writes(reverse('problem_list')))
+        self.assertGreater(self.client.session[REFRESHED_KEY], stale)
+        self.assertGreater(Session.objects.get().expire_date,
+                           timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE - 60))
+
+    def test_anonymous_requests_do_not_create_sessions(self):
+        self.client.get(reverse('problem_list'))
+        self.assertFalse(Session.objects.exists())
+
+    def create_sessions(self):
+        Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(days=1))
+        Session.objects.create(session_key='active', session_data='', expire_date=timezone.now() + timedelta(days=1))
+
+    def test_requests_do_not_clear_sessions(self):
+        self.create_sessions()
+        SessionRefreshMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertEqual(Session.objects.count(), 2)
+
+    @override_settings(HELPDESK_SESSION_CLEANUP_INTERVAL=60)
+    def test_worker_clears_expired_sessions(self):
+        self.create_sessions()
+        tasks.run_worker(once=True)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['active'])
+
+    def test_scheduler_clears_expired_sessions(self):
+        # Бэкенд thread: воркера нет, сессии чистит фоновый поток сервера
+        self.create_sessions()
+        with mock.patch.object(tasks.time, 'sleep') as sleep:
+            tasks.run_scheduler(should_stop=iter([False, True]).__next__)
+        sleep.assert_called_once_with(60.0)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['active'])
+
+    @override_settings(HELPDESK_TASKS_BACKEND='db')
+    def test_scheduler_not_started_with_worker(self):
+        self.assertIsNone(tasks.start_scheduler())
+
+
+class TempMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, HELPDESK_UPLOAD_TEMP_DIR=f'{self.media_root}/tmp'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ChunkedUploadTests(TempMediaMixin, HelpdeskTestCase):
+    content = b'0123456789' * 1000
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def start(self, size=None):
+        response = self.client.post(reverse('upload_create'), {
+            'filename': 'log.txt', 'size': size or len(self.content)
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, start, end):
+        return self.client.put(
+            reverse('upload_chunk', args=[upload_id]), self.content[start:end],
+            content_type='application/octet-stream',
+            headers={'Content-Range': f'bytes {start}-{end - 1}/{len(self.content)}'},
+        )
+
+    def test_upload_in_chunks_and_attach(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, 4000).json()['offset'], 4000)
+        data = self.put(upload_id, 4000, len(self.content)).json()
+        self.assertTrue(data['complete'])
+        self.assertEqual(data['checksum'], hashlib.sha256(self.content).hexdigest())
+
+        self.client.post(reverse('problem_create'), {
+            'title': 'Ошибка 1С', 'description': 'Лог во вложении',
+            'direction': self.direction.pk, 'uploads': [upload_id],
+        })
+        problem = Problem.objects.get()
+        self.assertEqual(problem.files_count, 1)
+        with problem.files.get().file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_checksum_without_running_hash(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, 4000)
+        # Следующая часть пришла в другой процесс: хэш начала файла считается заново
+        uploads._running_hashes.clear()
+        data = self.put(upload_id, 4000, len(self.content)).json()
+        self.assertEqual(data['checksum'], hashlib.sha256(self.content).hexdigest())
+
+    def test_rolled_back_attach_keeps_upload(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, len(self.content))
+        upload = ChunkedUpload.objects.get()
+        problem = self.create_problem('Ошибка 1С')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            uploads.attach_uploads(self.user, [upload_id], ProblemFile, problem=problem)
+            raise IntegrityError
+        self.assertTrue(os.path.exists(upload.temp_path))
+        self.assertTrue(ChunkedUpload.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uploads.attach_uploads(self.user, [upload_id], ProblemFile, problem=problem)
+        self.assertFalse(os.path.exists(upload.temp_path))
+        with problem.files.get().file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_wrong_offset_reports_current_offset(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, 1000)
+        response = self.put(upload_id, 2000, 3000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+
+    def test_resume_after_interrupted_chunk(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, 1000)
+        self.assertEqual(self.client.get(reverse('upload_chunk', args=[upload_id])).json()['offset'], 1000)
+        self.assertTrue(self.put(upload_id, 1000, len(self.content)).json()['complete'])
+
+    def test_foreign_upload_is_not_accessible(self):
+        upload_id = self.start()
+        self.client.force_login(User.objects.create_user('petrov', password='pass'))
+        self.assertEqual(self.put(upload_id, 0, 1000).status_code, 404)
+
+    def test_oversized_upload_is_rejected(self):
+        with override_settings(HELPDESK_UPLOAD_MAX_SIZE=10):
+            response = self.client.post(reverse('upload_create'), {'filename': 'big.log', 'size': 11})
+        self.assertEqual(response.status_code, 413)
+
+
+@override_settings(HELPDESK_TASKS_BACKEND='immediate')
+class BlobStorageTests(TempMediaMixin, HelpdeskTestCase):
+    content = b'screenshot bytes'
+
+    def post_problem(self, filename):
+        self.client.post(reverse('problem_create'), {
+            'title': 'Ошибка', 'description': 'Скриншот во вложении', 'direction': self.direction.pk,
+            'files': [SimpleUploadedFile(filename, self.content)],
+        })
+        return Problem.objects.latest('id').files.get()
+
+    def test_same_content_is_stored_once(self):
+        self.client.force_login(self.user)
+        first = self.post_problem('error.png')
+        second = self.post_problem('ошибка.PNG')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith('blobs/'))
+        self.assertEqual(second.filename(), 'ошибка.PNG')
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(attachment_storage.exists(blob.name))
+
+    @override_settings(HELPDESK_TASKS_BACKEND='db')
+    def test_reupload_before_deferred_delete_keeps_file(self):
+        self.client.force_login(self.user)
+        first = self.post_problem('error.png')
+        name = first.file.name
+        first.delete()
+        self.assertFalse(Blob.objects.exists())
+
+        # Файл еще на диске, пока не выполнена задача delete_files
+        second = self.post_problem('error.png')
+        self.assertEqual(second.file.name, name)
+        tasks.run_worker(once=True)
+        self.assertTrue(attachment_storage.exists(name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_replaced_file_releases_blob(self):
+        self.client.force_login(self.user)
+        attachment = self.post_problem('error.png')
+        old_name = attachment.file.name
+
+        attachment.file = SimpleUploadedFile('fixed.png', b'other bytes')
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.save()
+        blob = Blob.objects.get()
+        self.assertEqual((blob.name, blob.ref_count), (attachment.file.name, 1))
+        self.assertEqual(attachment.original_name, 'fixed.png')
+        self.assertFalse(attachment_storage.exists(old_name))
+
+        attachment.file = None
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.save()
+        self.assertFalse(Blob.objects.exists())
+        self.assertIsNone(ProblemFile.objects.get().blob_id)
+
+    def test_dedupe_command_moves_legacy_files(self):
+        problem = self.create_problem('Старая проблема')
+        # Старые файлы лежат по обычным путям, создаем их в обход хранилища
+        os.makedirs(f'{self.media_root}/problems/None')
+        legacy = []
+        for name in ('problems/None/a.png', 'problems/None/b.png'):
+            with open(f'{self.media_root}/{name}', 'wb') as f:
+                f.write(b'legacy')
+            legacy.append(ProblemFile.objects.create(problem=problem, file=name))
+
+        call_command('dedupe_attachments', stdout=open('/dev/null', 'w'))
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        for attachment in legacy:
+            attachment.refresh_from_db()
+            self.assertEqual(attachment.file.name, blob.name)
+        self.assertEqual(legacy[1].filename(), 'b.png')
+        self.assertFalse(attachment_storage.exists('problems/None/a.png'))
+
+
+@override_settings(HELPDESK_TASKS_BACKEND='immediate')
+class BulkAdminActionsTests(TempMediaMixin, HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+
+    def attach(self, model, content, **kwargs):
+        attachment = model(**kwargs)
+        attachment.store_file(SimpleUploadedFile('log.txt', content), 'log.txt')
+        attachment.save()
+        return attachment
+
+    def add_problems(self, count, direction=None):
+        problems = []
+        for i in range(count):
+            problem = self.create_problem(f'Принтер {i}', direction=direction)
+            self.attach(ProblemFile, f'лог {i}'.encode(), problem=problem)
+            for j in range(2):
+                solution = Solution.objects.create(problem=problem, author=self.user, description=f'Драйвер {j}')
+                self.attach(SolutionFile, b'shared', solution=solution)
+            problem.refresh_counters()
+            problems.append(problem)
+        return problems
+
+    def action(self, model, action, objects):
+        url = reverse(f'admin:helpdesk_{model}_changelist')
+        with CaptureQueriesContext(connection) as context, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'action': action, '_selected_action': [obj.pk for obj in objects]})
+        self.assertEqual(response.status_code, 302)
+        # Строки удаляются в обход каскадов Django — внешние ключи должны остаться целыми
+        connection.check_constraints()
+        return len(context)
+
+    def test_clear_problems(self):
+        kept, = self.add_problems(1, direction=self.other_direction)
+        self.action('direction', 'clear_problems', [self.direction])  # прогрев ContentType и т.п.
+        self.add_problems(2)
+        expected = self.action('direction', 'clear_problems', [self.direction])
+        names = list(Blob.objects.values_list('name', flat=True))
+
+        self.add_problems(10)
+        self.assertEqual(self.action('direction', 'clear_problems', [self.direction]), expected)
+        self.assertEqual(list(Problem.objects.all()), [kept])
+        self.assertEqual(Solution.objects.count(), 2)
+        self.assertEqual(get_search_backend().search(Problem.objects.all(), 'принтер').count(), 1)
+
+        # Общий файл решений остался у оставшейся проблемы, файлы удаленных проблем стерты
+        shared = Blob.objects.get(name__in=names, ref_count=2)
+        self.assertEqual(Blob.objects.count(), 2)
+        for name in names:
+            self.assertEqual(attachment_storage.exists(name), name in Blob.objects.values_list('name', flat=True))
+        self.assertTrue(attachment_storage.exists(shared.name))
+
+    def test_delete_solutions(self):
+        problems = self.add_problems(3)
+        Solution.objects.filter(problem=problems[0]).accept()
+        self.action('problem', 'delete_solutions', problems[:2])
+
+        problems[0].refresh_from_db()
+        self.assertEqual((problems[0].solutions_count, problems[0].accepted_solution), (0, None))
+        self.assertEqual(Solution.objects.count(), 2)
+        self.assertEqual(Blob.objects.get(ref_count=2).name, SolutionFile.objects.first().file.name)
+        self.assertEqual(list(get_search_backend().search(Problem.objects.all(), 'драйвер')), [problems[2]])
+
+    def test_mark_as_unsolved(self):
+        problems = self.add_problems(3)
+        Solution.objects.filter(problem__in=problems[:2]).accept()
+        url = reverse('admin:helpdesk_problem_changelist')
+        response = self.client.post(url, {'action': 'mark_as_unsolved',
+                                          '_selected_action': [problem.pk for problem in problems]}, follow=True)
+        self.assertContains(response, 'Отмечено 2 проблем как нерешенные')
+        self.assertFalse(Problem.objects.solved().exists())
+
+    def test_delete_selected(self):
+        problems = self.add_problems(2)
+        response = self.client.post(reverse('admin:helpdesk_problem_changelist'), {
+            'action': 'delete_selected', '_selected_action': [problems[0].pk], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Problem.objects.all()), [problems[1]])
+        self.assertEqual(Blob.objects.get(name=SolutionFile.objects.first().file.name).ref_count, 2)
+
+    def test_duplicate_direction(self):
+        self.action('direction', 'duplicate_direction', [self.direction, self.other_direction])
+        self.action('direction', 'duplicate_direction', [self.direction])
+        copy = Direction.objects.get(name='OS_copy')
+        self.assertEqual(copy.display_name, f'{self.direction.display_name} (копия)')
+        self.assertEqual(Direction.objects.count(), 4)
+
+
+class AttachmentDownloadTests(TempMediaMixin, HelpdeskTestCase):
+    content = b'line\n' * 100
+
+    def setUp(self):
+        super().setUp()
+        problem = self.create_problem('Лог')
+        self.attachment = ProblemFile(problem=problem)
+        self.attachment.store_file(SimpleUploadedFile('app.log', self.content), 'app.log')
+        self.attachment.save()
+        self.url = self.attachment.get_absolute_url()
+        self.client.force_login(self.user)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{self.attachment.blob.sha256}"')
+        self.assertIn('app.log', response['Content-Disposition'])
+
+    def test_range_request(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=5-14'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 5-14/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[5:15])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-5'})
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+
+    @override_settings(HELPDESK_SENDFILE_BACKEND='nginx')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.attachment.file.name)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+    def test_active_content_is_downloaded(self):
+        for name in ('page.html', 'logo.svg'):
+            attachment = ProblemFile(problem=self.attachment.problem)
+            attachment.store_file(SimpleUploadedFile(name, b'<script>alert(1)</script>'), name)
+            attachment.save()
+            response = self.client.get(attachment.get_absolute_url())
+            self.assertTrue(response['Content-Disposition'].startswith('attachment'), name)
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+            self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_images_are_shown_inline(self):
+        attachment = ProblemFile(problem=self.attachment.problem)
+        attachment.store_file(SimpleUploadedFile('screen.png', b'png'), 'screen.png')
+        attachment.save()
+        response = self.client.get(attachment.get_absolute_url())
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+
+
+class ApiTests(TempMediaMixin, HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.problems = [self.create_problem(f'Проблема {i}') for i in range(5)]
+        self.problem = self.problems[-1]
+        attachment = ProblemFile(problem=self.problem)
+        attachment.store_file(SimpleUploadedFile('app.log', b'log' * 100), 'app.log')
+        attachment.save()
+        self.solution = Solution.objects.create(problem=self.problem, author=self.user, description='Перезагрузить')
+        self.problem.refresh_counters()
+        self.detail_url = reverse('api_problem_detail', args=[self.problem.pk])
+
+    def test_list_with_cursor_and_fields(self):
+        url = reverse('api_problem_list')
+        data = self.client.get(url, {'limit': 2, 'fields': 'id,title'}).json()
+        ids = [item['id'] for item in data['results']]
+        self.assertEqual(data['results'][0], {'id': self.problem.pk, 'title': self.problem.title})
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            ids += [item['id'] for item in data['results']]
+        self.assertEqual(ids, [problem.pk for problem in reversed(self.problems)])
+        self.assertIsNotNone(data['previous'])
+
+    def test_filters_and_errors(self):
+        url = reverse('api_problem_list')
+        data = self.client.get(url, {'status': 'unsolved', 'fields': 'id'}).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(self.client.get(url, {'direction': self.other_direction.pk}).json()['results'], [])
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('api_problem_detail', args=[0])).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_detail_includes_solutions_and_files(self):
+        data = self.client.get(self.detail_url).json()
+        self.assertEqual(data['solutions'][0]['description'], 'Перезагрузить')
+        self.assertEqual(data['files'][0]['name'], 'app.log')
+        self.assertEqual(data['files'][0]['size'], 300)
+
+        # Ненужные связи не загружаются
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(self.detail_url)
+        with CaptureQueriesContext(connection) as sparse:
+            data = self.client.get(self.detail_url, {'fields': 'id,title'}).json()
+        self.assertEqual(set(data), {'id', 'title'})
+        self.assertEqual(len(full) - len(sparse), 2)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.detail_url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        response = self.client.get(self.detail_url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        # Новое решение меняет ETag карточки и ленты
+        list_etag = self.client.get(reverse('api_problem_list'))['ETag']
+        Solution.objects.create(problem=self.problem, author=self.user, description='Обновить драйвер')
+        self.assertEqual(self.client.get(self.detail_url, headers={'If-None-Match': etag}).status_code, 200)
+        response = self.client.get(reverse('api_problem_list'), headers={'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_not_modified_with_one_query(self):
+        url = reverse('api_problem_list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_follows_database_not_cache(self):
+        # Изменение в другом процессе не сбрасывает версии в locmem этого процесса,
+        # но ETag все равно меняется: он строится по данным из БД
+        url = reverse('api_problem_list')
+        etag = self.client.get(url)['ETag']
+        page_etag = self.client.get(reverse('problem_list'))['ETag']
+        Problem.objects.filter(pk=self.problem.pk).update(last_activity_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+        response = self.client.get(reverse('problem_list'), headers={'If-None-Match': page_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_solutions_and_directions(self):
+        data = self.client.get(reverse('api_solution_list', args=[self.problem.pk]),
+                               {'fields[solution]': 'id,files'}).json()
+        self.assertEqual(data['results'], [{'id': self.solution.pk, 'files': []}])
+        names = [item['name'] for item in self.client.get(reverse('api_direction_list')).json()['results']]
+        self.assertEqual(names, ['OS', 'TEL'])
+
+    def test_gzip(self):
+        for i in range(20):
+            self.create_problem(f'Еще одна проблема с длинным заголовком {i}')
+        response = self.client.get(reverse('api_problem_list'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+
+@override_settings(HELPDESK_TASKS_BACKEND='immediate')
+class ThumbnailTests(TempMediaMixin, HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.problem = self.create_problem('Скриншот')
+        self.client.force_login(self.user)
+
+    def make_image(self, name='screen.png', size=(1600, 1200)):
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def store(self, upload):
+        attachment = ProblemFile(problem=self.problem)
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.store_file(upload, upload.name)
+            attachment.save()
+        return attachment
+
+    def test_generated_after_commit(self):
+        attachment = self.store(self.make_image())
+        for size, limit in (('small', 100), ('medium', 400)):
+            path = attachment_storage.path(thumbnail_name(attachment.file.name, size))
+            with Image.open(path) as image:
+                self.assertEqual(image.format, 'JPEG')
+                self.assertLessEqual(max(image.size), limit)
+
+    def test_served_with_immutable_cache(self):
+        attachment = self.store(self.make_image())
+        response = self.client.get(attachment.thumbnail_url('small'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (100, 75))
+
+    def test_generated_lazily(self):
+        attachment = ProblemFile(problem=self.problem)
+        attachment.store_file(self.make_image(), 'screen.png')
+        attachment.save()
+        self.assertFalse(attachment_storage.exists(thumbnail_name(attachment.file.name, 'small')))
+        self.assertEqual(self.client.get(attachment.thumbnail_url('small')).status_code, 200)
+
+    def test_exif_orientation_applied(self):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        Image.new('RGB', (200, 100), 'red').save(buffer, 'JPEG', exif=exif)
+        attachment = self.store(SimpleUploadedFile('photo.jfif', buffer.getvalue(), content_type='image/jpeg'))
+        self.assertTrue(attachment.is_image())
+        with Image.open(attachment_storage.path(thumbnail_name(attachment.file.name, 'small'))) as image:
+            self.assertEqual(image.size, (50, 100))
+
+    @override_settings(HELPDESK_THUMBNAIL_MAX_PIXELS=1000)
+    def test_oversized_image_skipped(self):
+        attachment = self.store(self.make_image())
+        self.assertFalse(attachment_storage.exists(thumbnail_name(attachment.file.name, 'small')))
+        self.assertEqual(self.client.get(attachment.thumbnail_url('small')).status_code, 404)
+
+    def test_not_an_image(self):
+        attachment = self.store(SimpleUploadedFile('notes.txt', b'text'))
+        self.assertFalse(attachment.is_image())
+        url = reverse('attachment_thumbnail', args=['problem', attachment.pk, 'small'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('attachment_thumbnail', args=['problem', attachment.pk, 'huge'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_deleted_with_blob(self):
+        attachment = self.store(self.make_image())
+        name = attachment.file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.delete()
+        self.assertFalse(attachment_storage.exists(name))
+        self.assertFalse(attachment_storage.exists(thumbnail_name(name, 'small')))
+
+
+# Задачи для TaskQueueTests: вызываются воркером по имени
+calls = []
+
+
+@tasks.task(max_attempts=2, retry_delay=10)
+def record_call(value):
+    calls.append(value)
+
+
+@tasks.task(max_attempts=2, retry_delay=10)
+def failing_task():
+    raise RuntimeError('сбой')
+
+
+def fake_scanner(path):
+    with open(path, 'rb') as f:
+        return 'EICAR' if b'EICAR' in f.read() else None
+
+
+@override_settings(HELPDESK_TASKS_BACKEND='db')
+class TaskQueueTests(TempMediaMixin, HelpdeskTestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def test_enqueued_task_is_run_by_worker(self):
+        record_call.enqueue('a')
+        queued = QueuedTask.objects.get()
+        self.assertEqual(queued.name, 'helpdesk.tests.record_call')
+        self.assertEqual(queued.args, ['a'])
+        self.assertEqual(calls, [])
+
+        self.assertEqual(tasks.run_worker(once=True), 1)
+        self.assertEqual(calls, ['a'])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, QueuedTask.DONE)
+        self.assertEqual(queued.attempts, 1)
+
+    def test_delayed_task_waits(self):
+        record_call.enqueue('a', delay=60)
+        self.assertEqual(tasks.run_worker(once=True), 0)
+        self.assertEqual(calls, [])
+
+    def test_rollback_discards_task(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            record_call.enqueue('a')
+            raise RuntimeError
+        self.assertFalse(QueuedTask.objects.exists())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        failing_task.enqueue()
+        with self.assertLogs('helpdesk.tasks', 'WARNING'):
+            tasks.run_worker(once=True)
+        queued = QueuedTask.objects.get()
+        self.assertEqual(queued.status, QueuedTask.QUEUED)
+        self.assertIn('RuntimeError', queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=5))
+
+        QueuedTask.objects.update(run_at=timezone.now())
+        with self.assertLogs('helpdesk.tasks', 'ERROR'):
+            tasks.run_worker(once=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, QueuedTask.FAILED)
+        self.assertEqual(queued.attempts, 2)
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_worker_survives_database_error(self):
+        record_call.enqueue('a')
+        claim_tasks = tasks.claim_tasks
+        attempts = []
+
+        def flaky_claim(worker_id, limit):
+            attempts.append(worker_id)
+            if len(attempts) == 1:
+                raise OperationalError('server closed the connection unexpectedly')
+            return claim_tasks(worker_id, limit)
+
+        with mock.patch.object(tasks, 'claim_tasks', flaky_claim), \
+                mock.patch.object(tasks.time, 'sleep') as sleep, \
+                self.assertLogs('helpdesk.tasks', 'ERROR') as logs:
+            processed = tasks.run_worker(sleep=1.0, should_stop=lambda: len(attempts) > 2, worker_id='w')
+        self.assertEqual(processed, 1)
+        self.assertEqual(calls, ['a'])
+        self.assertIn('OperationalError', logs.output[0])
+        self.assertEqual(sleep.call_args_list[0], mock.call(2.0))
+
+        with mock.patch.object(tasks, 'claim_tasks', side_effect=OperationalError), \
+                self.assertRaises(OperationalError):
+            tasks.run_worker(once=True)
+
+    def test_task_is_claimed_once(self):
+        record_call.enqueue('a')
+        self.assertEqual(len(tasks.claim_tasks('first')), 1)
+        self.assertEqual(tasks.claim_tasks('second'), [])
+
+    def test_abandoned_task_is_reclaimed(self):
+        record_call.enqueue('a')
+        tasks.claim_tasks('crashed')
+        QueuedTask.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        [queued] = tasks.claim_tasks('second')
+        self.assertEqual(queued.locked_by, 'second')
+        self.assertEqual(queued.attempts, 2)
+
+    def test_abandoned_task_fails_after_max_attempts(self):
+        record_call.enqueue('a')
+        for worker in ('first', 'second'):
+            self.assertEqual(len(tasks.claim_tasks(worker)), 1)
+            QueuedTask.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        with self.assertLogs('helpdesk.tasks', 'ERROR'):
+            self.assertEqual(tasks.claim_tasks('third'), [])
+        queued = QueuedTask.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (QueuedTask.FAILED, 2))
+        self.assertIsNotNone(queued.finished_at)
+        self.assertEqual(calls, [])
+
+    def test_purge_finished(self):
+        record_call.enqueue('old')
+        record_call.enqueue('new')
+        tasks.run_worker(once=True)
+        QueuedTask.objects.filter(args=['old']).update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(tasks.purge_finished(), 1)
+        self.assertEqual(list(QueuedTask.objects.values_list('args', flat=True)), [['new']])
+
+    @override_settings(HELPDESK_NOTIFY_AUTHORS=True)
+    def test_problem_author_is_notified(self):
+        self.user.email = 'ivanov@example.com'
+        self.user.save()
+        problem = self.create_problem('Нет звука')
+        self.client.force_login(User.objects.create_user('petrov', password='pass'))
+        self.client.post(reverse('problem_detail', args=[problem.pk]), {'description': 'Проверить кабель'})
+        self.assertEqual(mail.outbox, [])
+
+        tasks.run_worker(once=True)
+        [message] = mail.outbox
+        self.assertEqual(message.to, ['ivanov@example.com'])
+        self.assertIn('Проверить кабель', message.body)
+        self.assertIn(reverse('problem_detail', args=[problem.pk]), message.body)
+
+    @override_settings(HELPDESK_NOTIFY_AUTHORS=True)
+    def test_own_solution_is_not_notified(self):
+        problem = self.create_problem('Нет звука')
+        self.client.force_login(self.user)
+        self.client.post(reverse('problem_detail', args=[problem.pk]), {'description': 'Проверить кабель'})
+        self.assertFalse(QueuedTask.objects.exists())
+
+    @override_settings(HELPDESK_VIRUS_SCAN_HOOK='helpdesk.tests.fake_scanner')
+    def test_infected_attachment_is_removed(self):
+        problem = self.create_problem('Вложение')
+        attachment = ProblemFile(problem=problem)
+        attachment.store_file(SimpleUploadedFile('virus.txt', b'X5O EICAR test'), 'virus.txt')
+        attachment.save()
+        Problem.objects.filter(pk=problem.pk).refresh_counters()
+        name = attachment.file.name
+
+        with self.assertLogs('helpdesk.tasks', 'ERROR') as logs:
+            tasks.run_worker(once=True)
+        self.assertIn('EICAR', logs.output[0])
+        self.assertFalse(ProblemFile.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+        problem.refresh_from_db()
+        self.assertEqual(problem.files_count, 0)
+        # Файл удаляет следующая задача delete_files
+        tasks.run_worker(once=True)
+        self.assertFalse(attachment_storage.exists(name))
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        settings_override = override_settings(
+            STATIC_ROOT=self.static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'helpdesk.staticfiles.CompressedManifestStaticFilesStorage',
+            }},
+            HELPDESK_STATIC_USE_FINDERS=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.url = static('helpdesk/js/chunked_upload.js')
+
+    def test_collectstatic_hashes_and_compresses(self):
+        self.assertRegex(self.url, r'/static/helpdesk/js/chunked_upload\.[0-9a-f]{12}\.js$')
+        path = os.path.join(self.static_root, self.url.removeprefix('/static/'))
+        with open(path, 'rb') as original, open(path + '.gz', 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), original.read())
+
+    def test_hashed_file_is_immutable_and_compressed(self):
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/javascript; charset=utf-8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('Set-Cookie', response)
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'function', body)
+
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag'],
+                                                      'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 304)
+
+    def test_plain_and_unhashed_files(self):
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response)
+        response = self.client.get('/static/favicon.ico')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.HELPDESK_STATIC_MAX_AGE}')
+        self.assertEqual(self.client.get('/static/missing.js').status_code, 404)
+
+
+@override_settings(HELPDESK_READ_REPLICA=None)
+class BenchmarkTests(TempMediaMixin, TestCase):
+    def test_generate_and_measure(self):
+        generate_data(problems=30, directions=3, users=5, solutions=2, files=1)
+        self.assertEqual(Problem.objects.count(), 30)
+        self.assertEqual(Direction.objects.count(), 3)
+
+        problem = Problem.objects.order_by('-solutions_count').first()
+        self.assertEqual(problem.solutions_count, problem.solutions.count())
+        self.assertEqual(Blob.objects.get(name__endswith='.log').ref_count,
+                         ProblemFile.objects.filter(original_name='error.log').count() +
+                         SolutionFile.objects.filter(original_name='error.log').count())
+
+        results = run_benchmarks(repeat=2, only=['problem_list', 'problem_detail', 'admin_solution_change'])
+        self.assertEqual(set(results), {'problem_list', 'problem_detail', 'admin_solution_change'})
+        for result in results.values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+
+        render = render_benchmark(cards=(6,), repeat=2)
+        self.assertEqual(set(render[6]), {'parse', 'loader_cache', 'fragment_cache'})
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'замер только для SQLite')
+    def test_sqlite_concurrency(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        result = sqlite_concurrency(os.path.join(directory, 'tuned.sqlite3'), tuned=True,
+                                    readers=2, writers=1, seconds=0.3, problems=60)
+        self.assertEqual(result['journal_mode'], 'wal')
+        self.assertEqual(result['locked_errors'], 0)
+        self.assertGreater(result['reads'], 0)
+        self.assertGreater(result['writes'], 0)
+        self.assertEqual(os.listdir(directory), [])
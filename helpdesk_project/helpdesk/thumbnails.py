@@ -0,0 +1,68 @@
+import os
+import threading
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import select_storage
+
+# Фиксированные размеры миниатюр (максимальная сторона в пикселях)
+SIZES = {
+    'small': 100,
+    'medium': 400,
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.jfif', '.png', '.gif', '.bmp', '.webp'}
+
+
+def is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def thumbnail_name(name, size):
+    """Миниатюра лежит рядом с оригиналом: blobs/ab/cd/<hash>.small.jpg"""
+    return f'{os.path.splitext(name)[0]}.{size}.jpg'
+
+
+def generate_thumbnail(name, size):
+    """Создает миниатюру, если её ещё нет. Возвращает путь к ней или None."""
+    storage = select_storage()
+    path = storage.path(thumbnail_name(name, size))
+    if os.path.exists(path):
+        return path
+
+    # Пишем во временный файл и переименовываем, чтобы не отдать недописанную миниатюру
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            # Размер известен из заголовка до распаковки пикселей
+            if image.width * image.height > settings.HELPDESK_THUMBNAIL_MAX_PIXELS:
+                return None
+            # Снимки с телефона хранят поворот в EXIF — применяем его до уменьшения
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((SIZES[size], SIZES[size]))
+            if image.mode != 'RGB':
+                # JPEG не поддерживает прозрачность — подкладываем белый фон
+                background = Image.new('RGB', image.size, 'white')
+                image = image.convert('RGBA')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            image.save(tmp_path, 'JPEG', quality=85, optimize=True)
+        os.replace(tmp_path, path)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return path
+
+
+def generate_thumbnails(name):
+    for size in SIZES:
+        generate_thumbnail(name, size)
+
+
+def delete_thumbnails(name):
+    storage = select_storage()
+    for size in SIZES:
+        storage.delete(thumbnail_name(name, size))
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+# Размер блока, которым читается тело запроса и пишется на диск
+READ_BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Состояние SHA-256 незавершенных загрузок: upload.id -> (offset, hash). Объект hashlib
+# не сериализуется, поэтому хранится в памяти процесса; если часть пришла в другой
+# процесс или после перезапуска, хэш уже записанного начала файла считается заново
+MAX_RUNNING_HASHES = 1000
+_running_hashes = OrderedDict()
+_running_hashes_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class TemporaryFile(File):
+    """Файл на диске: FileSystemStorage перемещает его, а не копирует."""
+
+    def __init__(self, file, name=None, sha256=None):
+        super().__init__(file, name)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def parse_content_range(header):
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Некорректный заголовок Content-Range')
+    start, end, total = map(int, match.groups())
+    if end < start:
+        raise UploadError('Некорректный заголовок Content-Range')
+    return start, end - start + 1, total
+
+
+def start_upload(user, filename, size):
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('Не указано имя файла')
+    if size <= 0 or size > settings.HELPDESK_UPLOAD_MAX_SIZE:
+        raise UploadError('Недопустимый размер файла', status=413)
+
+    upload = ChunkedUpload.objects.create(user=user, filename=filename, size=size)
+    os.makedirs(settings.HELPDESK_UPLOAD_TEMP_DIR, exist_ok=True)
+    open(upload.temp_path, 'wb').close()
+    return upload
+
+
+def append_chunk(upload, stream, content_range):
+    """Дописывает часть файла из потока запроса, не загружая её в память целиком."""
+    start, length, total = parse_content_range(content_range)
+    if upload.is_complete:
+        raise UploadError('Загрузка уже завершена', status=409)
+    if total != upload.size or start + length > upload.size:
+        raise UploadError('Размер не совпадает с объявленным')
+    if start != upload.offset:
+        # Клиент должен продолжить с upload.offset
+        raise UploadError('Неверное смещение', status=409)
+
+    digest = _take_hash(upload, start)
+    remaining = length
+    with open(upload.temp_path, 'r+b') as destination:
+        destination.seek(start)
+        while remaining:
+            block = stream.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            destination.write(block)
+            digest.update(block)
+            remaining -= len(block)
+        # Отбрасываем хвост от прерванной ранее попытки
+        destination.truncate()
+
+    upload.offset = start + length - remaining
+    upload.save(update_fields=['offset'])
+    if upload.offset == upload.size:
+        finish_upload(upload, digest)
+    else:
+        _put_hash(upload, digest)
+    return upload
+
+
+def _file_hash(path, limit=None):
+    """SHA-256 первых limit байт файла (всего файла при None)."""
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as source:
+        while remaining is None or remaining > 0:
+            block = source.read(READ_BLOCK_SIZE if remaining is None else min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest
+
+
+def _take_hash(upload, offset):
+    """Хэш первых offset байт загрузки: из памяти, если предыдущая часть пришла сюда же."""
+    with _running_hashes_lock:
+        state = _running_hashes.pop(upload.pk, None)
+    if state is not None and state[0] == offset:
+        return state[1]
+    return _file_hash(upload.temp_path, offset)
+
+
+def _put_hash(upload, digest):
+    with _running_hashes_lock:
+        _running_hashes[upload.pk] = (upload.offset, digest)
+        while len(_running_hashes) > MAX_RUNNING_HASHES:
+            _running_hashes.popitem(last=False)
+
+
+def finish_upload(upload, digest):
+    upload.checksum = digest.hexdigest()
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['checksum', 'completed_at'])
+
+
+def _valid_ids(upload_ids):
+    result = []
+    for upload_id in upload_ids:
+        try:
+            result.append(uuid.UUID(str(upload_id)))
+        except ValueError:
+            pass
+    return result
+
+
+def attach_uploads(user, upload_ids, model, **fields):
+    """
+    Превращает завершенные загрузки пользователя в записи model
+    (ProblemFile/SolutionFile) одним bulk_create.
+    """
+    uploads = list(ChunkedUpload.objects.filter(
+        user=user, pk__in=_valid_ids(upload_ids), completed_at__isnull=False
+    ))
+    if not uploads:
+        return []
+
+    instances = []
+    for upload in uploads:
+        instance = model(**fields)
+        # Хранилище забирает вторую ссылку на файл, временный файл остается до фиксации
+        # транзакции: при откате загрузку можно прикрепить снова
+        link = _link(upload.temp_path)
+        try:
+            with open(link, 'rb') as source:
+                instance.store_file(TemporaryFile(source, upload.filename, upload.checksum), upload.filename)
+        finally:
+            # Ссылка не перемещена, если такое содержимое уже было в хранилище
+            _remove_files([link])
+        instances.append(instance)
+
+    model.objects.bulk_create(instances)
+    ChunkedUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).delete()
+    temp_paths = [upload.temp_path for upload in uploads]
+    transaction.on_commit(lambda: _remove_files(temp_paths))
+    return instances
+
+
+def _link(path):
+    """Жесткая ссылка на файл (без копирования данных), на другой файловой системе — копия."""
+    link = f'{path}.{uuid.uuid4().hex}'
+    try:
+        os.link(path, link)
+    except OSError:
+        shutil.copyfile(path, link)
+    return link
+
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_files(files, model, **fields):
+    """Сохраняет файлы, пришедшие обычной multipart-формой, одним INSERT."""
+    instances = []
+    for file in files:
+        instance = model(**fields)
+        instance.store_file(file, file.name)
+        instances.append(instance)
+    return model.objects.bulk_create(instances)
+
+
+def discard_upload(upload):
+    with _running_hashes_lock:
+        _running_hashes.pop(upload.pk, None)
+    _remove_files([upload.temp_path])
+    upload.delete()
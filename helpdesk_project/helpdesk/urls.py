@@ -13,6 +13,23 @@ urlpatterns = [
     path('problem/<int:problem_pk>/accept/<int:solution_pk>/',
          views.accept_solution, name='accept_solution'),
 
+    # Вложения
+    path('files/<str:kind>/<int:pk>/', views.attachment_download, name='attachment_download'),
+    path('files/<str:kind>/<int:pk>/thumb/<str:size>/', views.attachment_thumbnail, name='attachment_thumbnail'),
+
+    # Загрузка файлов частями
+    path('uploads/', views.upload_create, name='upload_create'),
+    path('uploads/<uuid:pk>/', views.upload_chunk, name='upload_chunk'),
+
+    # JSON API только для чтения
+    path('api/problems/', views.api_problem_list, name='api_problem_list'),
+    path('api/problems/<int:pk>/', views.api_problem_detail, name='api_problem_detail'),
+    path('api/problems/<int:pk>/solutions/', views.api_solution_list, name='api_solution_list'),
+    path('api/directions/', views.api_direction_list, name='api_direction_list'),
+
+    # Метрики для Prometheus
+    path('metrics', views.metrics, name='metrics'),
+
     # Маршруты для управления сотрудниками (только для админа)
     path('employees/', views.employee_list, name='employee_list'),
     path('employees/create/', views.employee_create, name='employee_create'),
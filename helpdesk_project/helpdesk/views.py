@@ -1,14 +1,29 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db import transaction
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
 from django.core.paginator import Paginator
-from .models import Problem, Direction, Solution, ProblemFile, SolutionFile
+from .models import Problem, Direction, Solution, ProblemFile, SolutionFile, ChunkedUpload
 from .forms import ProblemForm, SolutionForm, SearchForm, EmployeeCreationForm
+from .instrumentation import instrument, registry
+from .querybudget import query_budget
+from .routers import read_replica
+from .conditional import conditional_page, problem_detail_validators, problem_list_validators
+from .downloads import serve_attachment, serve_thumbnail
+from .cache import get_cache, get_employee_stats, aget_page as aget_cached_page, aproblem_list_key
+from .pagination import CursorPaginator
+from .search import get_search_backend
+from .uploads import UploadError, append_chunk, attach_uploads, save_files, start_upload
+from . import api, tasks, thumbnails
 
 
 # Проверка на администратора
@@ -31,50 +46,72 @@ def login_view(request):
     return render(request, 'helpdesk/login.html', {'form': form})
 
 
-def problem_list(request):
+async def _load_user(request):
+    # В async-представлении ленивый request.user не может обратиться к БД,
+    # поэтому загружаем пользователя заранее — шаблоны и контекст-процессоры получат готовый объект
+    request.user = await request.auser()
+    return request.user
+
+
+@instrument
+@read_replica
+@conditional_page(problem_list_validators)
+async def problem_list(request):
     # Получаем параметры напрямую из GET запроса
     query = request.GET.get('query', '')
     direction_id = request.GET.get('direction', '')
+    status = request.GET.get('status', '')
     page = request.GET.get('page', 1)
 
-    # Для отладки
-    print(f"GET parameters: {request.GET}")
-    print(f"Query: '{query}', Direction ID: '{direction_id}'")
+    await _load_user(request)
 
-    # Базовый queryset
-    problems = Problem.objects.all()
+    # Базовый queryset с сортировкой по умолчанию
+    problems = Problem.objects.order_by('-created_at')
 
     # Применяем фильтры
     if query:
-        # Разбиваем запрос на слова
-        words = query.split()
-        print(f"Search words: {words}")
-
-        q_objects = Q()
-        for word in words:
-            # icontains ищет без учета регистра
-            q_objects |= Q(title__icontains=word) | Q(description__icontains=word)
-
-        problems = problems.filter(q_objects)
-        print(f"Problems after search: {problems.count()}")
+        # Полнотекстовый поиск, результаты упорядочены по релевантности.
+        # При первом вызове выбор бэкенда проверяет наличие таблицы индекса
+        search_backend = await sync_to_async(get_search_backend)()
+        problems = search_backend.search(problems, query)
 
     if direction_id:
         try:
             direction_id = int(direction_id)
             problems = problems.filter(direction_id=direction_id)
-            print(f"Filtered by direction {direction_id}: {problems.count()}")
         except ValueError:
             pass
 
-    # Сортировка по умолчанию
-    problems = problems.order_by('-created_at')
+    if status == 'solved':
+        problems = problems.solved()
+    elif status == 'unsolved':
+        problems = problems.unsolved()
 
     # Оптимизация запросов
-    problems = problems.select_related('author', 'direction').prefetch_related('solutions')
-
-    # Пагинация
-    paginator = Paginator(problems, 6)  # 6 проблем на странице
-    problems_page = paginator.get_page(page)
+    problems = problems.select_related('author', 'direction')
+
+    # Пагинация: курсорная для ленты, постраничная для поиска (там сортировка по релевантности).
+    # Готовая страница берется из кэша, ключ зависит от версии направления
+    if settings.HELPDESK_CURSOR_PAGINATION and not query:
+        paginator = CursorPaginator(
+            problems, 6,
+            count_cache_key=await aproblem_list_key('count', query, direction_id, status),
+            count_timeout=settings.HELPDESK_CACHE_TIMEOUT,
+            cache=get_cache(),
+        )
+        position = request.GET.get('cursor')
+    else:
+        paginator = Paginator(problems, 6)  # 6 проблем на странице
+        position = page
+    problems_page = await aget_cached_page(
+        paginator, position,
+        await aproblem_list_key('page', query, direction_id, status, position or '')
+    )
+    # Постраничный Paginator уже посчитал строки; курсорный — только если это включено
+    show_total = not isinstance(paginator, CursorPaginator) or settings.HELPDESK_CURSOR_SHOW_TOTAL
+    if isinstance(paginator, CursorPaginator) and show_total:
+        # Считаем здесь, а не при рендеринге: шаблон синхронный
+        await paginator.acount()
 
     # Создаем форму для отображения
     form = SearchForm(initial={
@@ -88,38 +125,64 @@ def problem_list(request):
         params += f'&query={query}'
     if direction_id:
         params += f'&direction={direction_id}'
+    if status:
+        params += f'&status={status}'
 
     return render(request, 'helpdesk/problem_list.html', {
         'problems': problems_page,
         'search_form': form,
+        'directions': [direction async for direction in Direction.objects.all()],
         'params': params,
+        'show_total': show_total,
+        'card_cache': settings.HELPDESK_CACHE_ALIAS,
+        'card_cache_timeout': settings.HELPDESK_CARD_CACHE_TIMEOUT,
     })
 
 
-def problem_detail(request, pk):
-    problem = get_object_or_404(
-        Problem.objects.prefetch_related(
+def _add_solution(request, problem):
+    """Сохраняет решение из формы. Возвращает (форма, сохранено ли решение)."""
+    form = SolutionForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return form, False
+
+    with transaction.atomic():
+        solution = form.save(commit=False)
+        solution.problem = problem
+        solution.author = request.user
+        solution.save()
+
+        # Сохраняем файлы: загруженные частями заранее и пришедшие с формой
+        attach_uploads(request.user, request.POST.getlist('uploads'), SolutionFile, solution=solution)
+        save_files(request.FILES.getlist('files'), SolutionFile, solution=solution)
+
+        problem.refresh_counters()
+
+        if settings.HELPDESK_NOTIFY_AUTHORS and problem.author_id != request.user.pk:
+            url = request.build_absolute_uri(reverse('problem_detail', args=[problem.pk]))
+            tasks.notify_problem_author.enqueue(solution.pk, url)
+
+    messages.success(request, 'Решение успешно добавлено!')
+    return form, True
+
+
+@instrument
+@read_replica
+@conditional_page(problem_detail_validators)
+async def problem_detail(request, pk):
+    problem = await aget_object_or_404(
+        Problem.objects.select_related('author', 'direction').prefetch_related(
             'files',
             'solutions__files',
             'solutions__author'
         ),
         pk=pk
     )
+    user = await _load_user(request)
 
-    if request.method == 'POST' and request.user.is_authenticated:
-        form = SolutionForm(request.POST, request.FILES)
-        if form.is_valid():
-            solution = form.save(commit=False)
-            solution.problem = problem
-            solution.author = request.user
-            solution.save()
-
-            # Сохраняем файлы
-            files = request.FILES.getlist('files')
-            for file in files:
-                SolutionFile.objects.create(solution=solution, file=file)
-
-            messages.success(request, 'Решение успешно добавлено!')
+    if request.method == 'POST' and user.is_authenticated:
+        # Запись (транзакция, файлы, сигналы) выполняется синхронно в отдельном потоке
+        form, saved = await sync_to_async(_add_solution)(request, problem)
+        if saved:
             return redirect('problem_detail', pk=problem.pk)
     else:
         form = SolutionForm()
@@ -135,14 +198,16 @@ def problem_create(request):
     if request.method == 'POST':
         form = ProblemForm(request.POST, request.FILES)
         if form.is_valid():
-            problem = form.save(commit=False)
-            problem.author = request.user
-            problem.save()
+            with transaction.atomic():
+                problem = form.save(commit=False)
+                problem.author = request.user
+                problem.save()
+
+                # Сохраняем файлы: загруженные частями заранее и пришедшие с формой
+                attach_uploads(request.user, request.POST.getlist('uploads'), ProblemFile, problem=problem)
+                save_files(request.FILES.getlist('files'), ProblemFile, problem=problem)
 
-            # Сохраняем файлы
-            files = request.FILES.getlist('files')
-            for file in files:
-                ProblemFile.objects.create(problem=problem, file=file)
+                problem.refresh_counters()
 
             messages.success(request, 'Проблема успешно создана!')
             return redirect('problem_detail', pk=problem.pk)
@@ -162,12 +227,14 @@ def problem_edit(request, pk):
     if request.method == 'POST':
         form = ProblemForm(request.POST, request.FILES, instance=problem)
         if form.is_valid():
-            problem = form.save()
+            with transaction.atomic():
+                problem = form.save()
 
-            # Добавляем новые файлы
-            files = request.FILES.getlist('files')
-            for file in files:
-                ProblemFile.objects.create(problem=problem, file=file)
+                # Добавляем новые файлы
+                attach_uploads(request.user, request.POST.getlist('uploads'), ProblemFile, problem=problem)
+                save_files(request.FILES.getlist('files'), ProblemFile, problem=problem)
+
+                problem.refresh_counters()
 
             messages.success(request, 'Проблема успешно обновлена!')
             return redirect('problem_detail', pk=problem.pk)
@@ -185,44 +252,198 @@ def accept_solution(request, problem_pk, solution_pk):
     problem = get_object_or_404(Problem, pk=problem_pk)
 
     # Проверяем, что пользователь является автором проблемы
-    if request.user == problem.author:
-        solution = get_object_or_404(Solution, pk=solution_pk, problem=problem)
-
-        # Снимаем отметку с предыдущего принятого решения
-        Solution.objects.filter(problem=problem, is_accepted=True).update(is_accepted=False)
-
-        # Отмечаем новое решение как принятое
-        solution.is_accepted = True
-        solution.save()
+    if request.user.pk == problem.author_id:
+        # Снимает отметку с предыдущего принятого решения и отмечает новое в одной транзакции
+        if not Solution.objects.filter(pk=solution_pk, problem=problem).accept():
+            raise Http404
 
         messages.success(request, 'Решение отмечено как принятое!')
 
     return redirect('problem_detail', pk=problem_pk)
 
 
+ATTACHMENT_MODELS = {
+    'problem': ProblemFile,
+    'solution': SolutionFile,
+}
+
+
+@query_budget(8)
+@login_required
+def attachment_download(request, kind, pk):
+    # Права проверяет Django, саму передачу файла при возможности выполняет веб-сервер
+    model = ATTACHMENT_MODELS.get(kind)
+    if model is None:
+        raise Http404
+    attachment = get_object_or_404(model.objects.select_related('blob'), pk=pk)
+    if not attachment.file.storage.exists(attachment.file.name):
+        raise Http404
+    return serve_attachment(request, attachment)
+
+
+@query_budget(8)
+@login_required
+def attachment_thumbnail(request, kind, pk, size):
+    model = ATTACHMENT_MODELS.get(kind)
+    if model is None or size not in thumbnails.SIZES:
+        raise Http404
+    attachment = get_object_or_404(model.objects.select_related('blob'), pk=pk)
+    if not attachment.is_image():
+        raise Http404
+    # Обычно миниатюра уже готова; если фоновая генерация не успела — создаем сейчас
+    path = thumbnails.generate_thumbnail(attachment.file.name, size)
+    if path is None:
+        raise Http404
+    return serve_thumbnail(request, attachment, path, size)
+
+
+# JSON API для мониторинга и ботов (только чтение), см. api.py
+
+def _api_filters(request):
+    direction_id = request.GET.get('direction') or None
+    status = request.GET.get('status', '')
+    if direction_id is not None and not direction_id.isdigit():
+        raise api.ApiError('Некорректное направление')
+    if status not in ('', 'solved', 'unsolved'):
+        raise api.ApiError('status должен быть solved или unsolved')
+    return direction_id and int(direction_id), status
+
+
+@api.api_view
+@read_replica
+def api_problem_list(request):
+    direction_id, status = _api_filters(request)
+    etag = api.list_etag(request, direction_id)
+    response = api.not_modified(request, etag)
+    if response is not None:
+        return response
+
+    fields = api.PROBLEM.requested_fields(request, top_level=True)
+    problems = Problem.objects.select_related('author')
+    if direction_id:
+        problems = problems.filter(direction_id=direction_id)
+    if status == 'solved':
+        problems = problems.solved()
+    elif status == 'unsolved':
+        problems = problems.unsolved()
+
+    page = CursorPaginator(problems, api.page_size(request)).get_page(request.GET.get('cursor'))
+    api.prefetch_problems(page.object_list, request, fields)
+    items = [api.PROBLEM.serialize(problem, fields, request) for problem in page]
+    return api.json_response(api.page_data(request, page, items), etag)
+
+
+@api.api_view
+@read_replica
+def api_problem_detail(request, pk):
+    problem = get_object_or_404(Problem.objects.select_related('author'), pk=pk)
+    etag = api.problem_etag(request, problem)
+    last_modified = api.problem_last_modified(problem)
+    response = api.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    fields = api.PROBLEM.requested_fields(request, top_level=True, default=api.PROBLEM_DETAIL_FIELDS)
+    api.prefetch_problems([problem], request, fields)
+    return api.json_response(api.PROBLEM.serialize(problem, fields, request), etag, last_modified)
+
+
+@api.api_view
+@read_replica
+def api_solution_list(request, pk):
+    problem = get_object_or_404(Problem.objects.only('pk', 'direction_id', 'updated_at', 'last_activity_at'), pk=pk)
+    etag = api.problem_etag(request, problem)
+    last_modified = api.problem_last_modified(problem)
+    response = api.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    fields = api.SOLUTION.requested_fields(request, top_level=True)
+    solutions = problem.solutions.select_related('author')
+    page = CursorPaginator(solutions, api.page_size(request)).get_page(request.GET.get('cursor'))
+    api.prefetch_solutions(page.object_list, request, fields)
+    items = [api.SOLUTION.serialize(solution, fields, request) for solution in page]
+    return api.json_response(api.page_data(request, page, items), etag, last_modified)
+
+
+@api.api_view
+@read_replica
+def api_direction_list(request):
+    directions = list(Direction.objects.all())
+    etag = api.rows_etag(request, [(direction.pk, direction.name, direction.display_name) for direction in directions])
+    response = api.not_modified(request, etag)
+    if response is not None:
+        return response
+
+    fields = api.DIRECTION.requested_fields(request, top_level=True)
+    items = [api.DIRECTION.serialize(direction, fields, request) for direction in directions]
+    return api.json_response({'results': items}, etag)
+
+
+# Загрузка файлов частями (resumable upload).
+# Клиент создает загрузку, отправляет части через PUT с заголовком
+# Content-Range и передает id готовых загрузок в поле uploads формы.
+@login_required
+@require_POST
+def upload_create(request):
+    try:
+        size = int(request.POST.get('size', 0))
+        upload = start_upload(request.user, request.POST.get('filename'), size)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный размер файла'}, status=400)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    return JsonResponse({
+        'id': str(upload.id),
+        'offset': upload.offset,
+        'chunk_size': settings.HELPDESK_UPLOAD_CHUNK_SIZE,
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT'])
+def upload_chunk(request, pk):
+    upload = get_object_or_404(ChunkedUpload, pk=pk, user=request.user)
+
+    if request.method == 'PUT':
+        try:
+            # Тело читается потоком из request, а не через request.body
+            append_chunk(upload, request, request.headers.get('Content-Range'))
+        except UploadError as e:
+            return JsonResponse({'error': str(e), 'offset': upload.offset}, status=e.status)
+
+    return JsonResponse({
+        'id': str(upload.id),
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': upload.is_complete,
+        'checksum': upload.checksum,
+    })
+
+
 # Административные функции для управления сотрудниками
 @user_passes_test(is_admin)
 def employee_list(request):
     # Получаем всех сотрудников с сортировкой по дате регистрации (новые сверху)
     employees_list = User.objects.all().order_by('-date_joined')
 
-    # Пагинация - 10 сотрудников на странице
+    # Статистика для карточек — один агрегирующий запрос (или кэш)
+    stats = get_employee_stats()
+
+    # Пагинация - 5 сотрудников на странице.
+    # Общее количество уже есть в статистике, отдельный COUNT(*) не нужен
     paginator = Paginator(employees_list, 5)
+    paginator.count = stats['total']
     page_number = request.GET.get('page')
     employees = paginator.get_page(page_number)
 
-    # Подсчет статистики для карточек
-    total_count = User.objects.count()
-    active_count = User.objects.filter(is_active=True).count()
-    staff_count = User.objects.filter(is_staff=True).count()
-    superuser_count = User.objects.filter(is_superuser=True).count()
-
     return render(request, 'helpdesk/employee_list.html', {
         'employees': employees,
-        'total_count': total_count,
-        'active_count': active_count,
-        'staff_count': staff_count,
-        'superuser_count': superuser_count,
+        'total_count': stats['total'],
+        'active_count': stats['active'],
+        'staff_count': stats['staff'],
+        'superuser_count': stats['superuser'],
     })
 
 
@@ -304,3 +525,12 @@ def employee_toggle_active(request, pk):
     messages.success(request, f'Сотрудник {employee.username} {status}!')
 
     return redirect('employee_list')
+
+
+def metrics(request):
+    """Счетчики запросов в формате Prometheus."""
+    if not settings.HELPDESK_METRICS_ENABLED:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in settings.HELPDESK_METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
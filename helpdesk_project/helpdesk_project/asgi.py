@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'helpdesk_project.settings')
 
 application = get_asgi_application()
+
+# Удаление истекших сессий и прочее обслуживание по расписанию (при HELPDESK_TASKS_BACKEND=thread)
+from helpdesk.tasks import start_scheduler  # noqa: E402
+
+start_scheduler()
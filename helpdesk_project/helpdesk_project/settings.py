@@ -4,6 +4,7 @@ Django settings for helpdesk_project project.
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,8 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'helpdesk.instrumentation.RequestMetricsMiddleware',
+    'helpdesk.querybudget.QueryBudgetMiddleware',
+    'helpdesk.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'helpdesk.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'helpdesk.sessions.SessionRefreshMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -64,8 +70,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Скомпилированные шаблоны хранятся в памяти процесса и не разбираются заново
+            # на каждый запрос. При DEBUG автоперезагрузка сбрасывает кэш после правки шаблона
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -79,12 +92,79 @@ TEMPLATES = [
 WSGI_APPLICATION = 'helpdesk_project.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# По умолчанию SQLite. HELPDESK_DB=postgresql включает профиль для продакшена,
+# параметры подключения берутся из переменных окружения HELPDESK_DB_*
+HELPDESK_DB = os.environ.get('HELPDESK_DB', 'sqlite')
+
+if HELPDESK_DB == 'postgresql':
+    def postgres_database(host):
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('HELPDESK_DB_NAME', 'helpdesk'),
+            'USER': os.environ.get('HELPDESK_DB_USER', 'helpdesk'),
+            'PASSWORD': os.environ.get('HELPDESK_DB_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.environ.get('HELPDESK_DB_PORT', '5432'),
+            'OPTIONS': {},
+        }
+        if os.environ.get('HELPDESK_DB_POOL', '1') == '1':
+            # Пул соединений psycopg (pip install "psycopg[pool]"): соединения переиспользуются
+            # и в потоках async-представлений. С пулом CONN_MAX_AGE должен быть 0
+            database['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('HELPDESK_DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('HELPDESK_DB_POOL_MAX', 10)),
+                'timeout': int(os.environ.get('HELPDESK_DB_POOL_TIMEOUT', 10)),
+            }
+        else:
+            # Постоянные соединения на поток с проверкой перед повторным использованием
+            database['CONN_MAX_AGE'] = int(os.environ.get('HELPDESK_DB_CONN_MAX_AGE', 60))
+            database['CONN_HEALTH_CHECKS'] = True
+        return database
+
+    DATABASES = {
+        'default': postgres_database(os.environ.get('HELPDESK_DB_HOST', 'localhost')),
+    }
+    if os.environ.get('HELPDESK_DB_REPLICA_HOST'):
+        # Реплика для чтения; в тестах она указывает на тестовую основную базу
+        DATABASES['replica'] = {
+            **postgres_database(os.environ['HELPDESK_DB_REPLICA_HOST']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
+
+# Режим SQLite для нескольких одновременных пользователей (HELPDESK_SQLITE_TUNING=1):
+# WAL — чтение не блокируется записью, busy_timeout — ожидание блокировки вместо ошибки,
+# synchronous=NORMAL — fsync только при checkpoint, mmap и кэш страниц 64 МБ.
+# BEGIN IMMEDIATE берет блокировку записи в начале транзакции, и две транзакции
+# не упираются друг в друга при переходе от чтения к записи ("database is locked").
+# Сравнение с обычным режимом: manage.py sqlite_benchmark
+HELPDESK_SQLITE_PRAGMAS = [
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'busy_timeout=5000',
+    'mmap_size=268435456',
+    'cache_size=-65536',
+]
+HELPDESK_SQLITE_OPTIONS = {
+    'init_command': '; '.join(f'PRAGMA {pragma}' for pragma in HELPDESK_SQLITE_PRAGMAS),
+    'transaction_mode': 'IMMEDIATE',
 }
+HELPDESK_SQLITE_TUNING = os.environ.get('HELPDESK_SQLITE_TUNING') == '1'
+
+if HELPDESK_SQLITE_TUNING and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = dict(HELPDESK_SQLITE_OPTIONS)
+
+# Лента и страница проблемы читают с реплики (helpdesk.routers), записи идут в основную базу.
+# После записи пользователь читает из основной базы PIN_SECONDS секунд — пока реплика догоняет
+DATABASE_ROUTERS = ['helpdesk.routers.ReplicaRouter']
+HELPDESK_READ_REPLICA = 'replica' if 'replica' in DATABASES else None
+HELPDESK_REPLICA_PIN_SECONDS = 5
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,10 +195,89 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# В продакшене collectstatic сохраняет файлы с хэшем содержимого в имени и сжатые
+# копии .gz/.br (brotli — если установлен пакет brotli), а helpdesk.staticfiles.StaticFilesMiddleware
+# отдает их с Cache-Control: immutable. Перед запуском нужен python manage.py collectstatic
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'helpdesk.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+HELPDESK_SERVE_STATIC = os.environ.get('HELPDESK_SERVE_STATIC', '1') == '1'
+# При разработке файлы ищутся в STATICFILES_DIRS и каталогах приложений, collectstatic не нужен
+HELPDESK_STATIC_USE_FINDERS = DEBUG
+# Сколько секунд кэшируются файлы без хэша в имени
+HELPDESK_STATIC_MAX_AGE = 60
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Полнотекстовый поиск: путь к классу бэкенда из helpdesk.search.
+# None - выбирается автоматически по типу БД (FTS5 для SQLite, tsvector для PostgreSQL)
+HELPDESK_SEARCH_BACKEND = None
+
+# Кэш. Бэкенд для ленты проблем выбирается переменной окружения HELPDESK_CACHE_BACKEND:
+# locmem (по умолчанию), file, redis (REDIS_URL) или dummy (отключить кэш).
+# locmem — только для одного процесса: при нескольких воркерах изменение сбрасывает
+# кэш страниц лишь в том процессе, который его выполнил; нужен redis или file
+HELPDESK_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'helpdesk',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+    'dummy': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'helpdesk': {
+        **HELPDESK_CACHE_BACKENDS[os.environ.get('HELPDESK_CACHE_BACKEND', 'locmem')],
+        'KEY_PREFIX': 'helpdesk',
+        'VERSION': 1,
+    },
+}
+
+HELPDESK_CACHE_ALIAS = 'helpdesk'
+HELPDESK_CACHE_TIMEOUT = 300  # 5 минут
+
+# Кэш карточек в ленте проблем. Ключ содержит показанные в карточке поля
+# (updated_at, число решений, принятое решение), поэтому изменение проблемы или её
+# решений просто дает новый ключ. 0 — не кэшировать
+HELPDESK_CARD_CACHE_TIMEOUT = int(os.environ.get('HELPDESK_CARD_CACHE_TIMEOUT', 3600))
+
+# Курсорная (keyset) пагинация ленты проблем вместо COUNT(*) + OFFSET
+HELPDESK_CURSOR_PAGINATION = False
+# Показывать при курсорной пагинации общее число проблем — это снова COUNT(*)
+# (результат кэшируется на HELPDESK_CACHE_TIMEOUT)
+HELPDESK_CURSOR_SHOW_TOTAL = False
+
+# Страницы problem_list и problem_detail отдаются с ETag и отвечают 304 без рендеринга.
+# По умолчанию браузер проверяет страницу при каждом показе (Cache-Control: no-cache);
+# число секунд разрешает показывать её из личного кэша браузера без проверки
+HELPDESK_PRIVATE_CACHE_SECONDS = int(os.environ.get('HELPDESK_PRIVATE_CACHE_SECONDS', 0))
+
+# JSON API (/api/): размер страницы по умолчанию и максимальный ?limit=
+HELPDESK_API_PAGE_SIZE = 20
+HELPDESK_API_MAX_PAGE_SIZE = 100
+
+# Сколько секунд кэшируется статистика на странице сотрудников
+HELPDESK_EMPLOYEE_STATS_TIMEOUT = 30
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -150,23 +309,118 @@ CORS_ALLOWED_ORIGINS = [
 # CORS_ALLOW_ALL_ORIGINS = True  # Только для разработки!
 
 # Session settings
+# HELPDESK_SESSION_MODE: db — таблица django_session, cached_db — кэш helpdesk с записью
+# в БД (чтение сессии без запроса к БД; для нескольких процессов нужен общий кэш, redis),
+# signed_cookies — данные в подписанной cookie, без БД (выход не отзывает скопированную cookie)
+HELPDESK_SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = HELPDESK_SESSION_ENGINES[os.environ.get('HELPDESK_SESSION_MODE', 'db')]
+SESSION_CACHE_ALIAS = HELPDESK_CACHE_ALIAS
 SESSION_COOKIE_DOMAIN = None
 SESSION_COOKIE_AGE = 1209600  # 2 недели
-SESSION_SAVE_EVERY_REQUEST = True
+# Сессия сохраняется при изменении и продлевается helpdesk.sessions.SessionRefreshMiddleware,
+# когда до истечения остается меньше недели, — просмотр страниц не пишет в БД
+SESSION_SAVE_EVERY_REQUEST = False
+HELPDESK_SESSION_REFRESH_THRESHOLD = SESSION_COOKIE_AGE // 2
+# Интервал удаления истекших сессий, секунд. Их удаляет manage.py worker (бэкенд задач db)
+# или фоновый поток процесса сервера (thread, см. tasks.start_scheduler); запросы
+# пользователей сессии не чистят. None — только manage.py clearsessions по cron
+HELPDESK_SESSION_CLEANUP_INTERVAL = 3600
 
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB
 
+# Отдача вложений веб-сервером после проверки прав в Django:
+# None - файл отдает Django (с поддержкой Range), 'nginx' - X-Accel-Redirect,
+# 'apache' - X-Sendfile (Apache mod_xsendfile, lighttpd)
+HELPDESK_SENDFILE_BACKEND = os.environ.get('HELPDESK_SENDFILE_BACKEND') or None
+# internal-location nginx, указывающий на MEDIA_ROOT
+HELPDESK_SENDFILE_URL = '/protected-media/'
+
+# Загрузка файлов частями: временный каталог, максимальный размер файла и размер части
+HELPDESK_UPLOAD_TEMP_DIR = BASE_DIR / 'upload_tmp'
+HELPDESK_UPLOAD_MAX_SIZE = 500 * 1024 * 1024  # 500 MB
+HELPDESK_UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Миниатюры не строятся для изображений больше этого числа пикселей: маленький файл
+# может распаковываться в гигабайты памяти (decompression bomb)
+HELPDESK_THUMBNAIL_MAX_PIXELS = 40_000_000
+
+# Фоновые задачи (helpdesk.tasks): миниатюры, удаление файлов, проверка на вирусы, уведомления.
+# 'thread' — пул из HELPDESK_TASK_THREADS потоков в процессе сервера, 'db' — очередь в БД,
+# которую выполняет python manage.py worker (с повторами при ошибках),
+# 'immediate' — синхронно после фиксации транзакции
+HELPDESK_TASKS_BACKEND = os.environ.get('HELPDESK_TASKS_BACKEND', 'thread')
+HELPDESK_TASK_THREADS = int(os.environ.get('HELPDESK_TASK_THREADS', 2))
+# Через сколько секунд задача упавшего воркера снова берется в работу
+HELPDESK_TASK_LEASE = 300
+# Сколько секунд хранятся выполненные задачи очереди в БД
+HELPDESK_TASK_KEEP_DONE = 24 * 3600
+# Функция 'module.function'(path) проверки загруженных файлов: None — файл чистый,
+# иначе описание угрозы (вложения с файлом удаляются). None — не проверять
+HELPDESK_VIRUS_SCAN_HOOK = None
+# Письмо автору проблемы о новом решении (нужны настройки EMAIL_* для SMTP)
+HELPDESK_NOTIFY_AUTHORS = os.environ.get('HELPDESK_NOTIFY_AUTHORS') == '1'
+
+# Метрики запросов: время, запросы к БД, рендеринг шаблонов, кэш страниц.
+# Выключены — middleware не подключается и ничего не стоит.
+# Лог helpdesk.requests получает долю SAMPLE_RATE запросов и все запросы дольше SLOW_REQUEST секунд,
+# /metrics отдает счетчики в формате Prometheus для адресов из ALLOWED_IPS и персонала
+HELPDESK_METRICS_ENABLED = os.environ.get('HELPDESK_METRICS_ENABLED') == '1'
+HELPDESK_METRICS_SAMPLE_RATE = float(os.environ.get('HELPDESK_METRICS_SAMPLE_RATE', 0.01))
+HELPDESK_METRICS_SLOW_REQUEST = 1.0
+HELPDESK_METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+if HELPDESK_METRICS_ENABLED:
+    TEMPLATES[0]['BACKEND'] = 'helpdesk.instrumentation.InstrumentedTemplates'
+
+# Бюджет запросов к БД по имени URL (включая запросы сессии и пользователя).
+# 'log' — отчет о превышении и повторяющихся запросах в лог helpdesk.queries,
+# 'raise' — исключение QueryBudgetExceeded (используется в тестах), None — выключено
+HELPDESK_QUERY_BUDGETS = {
+    'problem_list': 10,
+    'problem_detail': {'GET': 12, 'POST': 22},
+    'problem_create': {'GET': 8, 'POST': 26},
+    'problem_edit': {'GET': 9, 'POST': 26},
+    'employee_list': 8,
+    'api_problem_list': 4,
+    'api_problem_detail': 6,
+    'api_solution_list': 4,
+    'api_direction_list': 2,
+    'employee_create': 7,
+    'employee_edit': 8,
+    'admin:index': 8,
+    'admin:helpdesk_problem_changelist': {'GET': 13, 'POST': 40},
+    'admin:helpdesk_problem_change': 14,
+    'admin:helpdesk_solution_changelist': {'GET': 10, 'POST': 30},
+    'admin:helpdesk_solution_change': {'GET': 11, 'POST': 24},
+    'admin:helpdesk_direction_changelist': {'GET': 10, 'POST': 24},
+    'admin:helpdesk_direction_change': 9,
+}
+# В manage.py test отчеты не пишутся: бюджеты проверяет QueryBudgetTests в режиме 'raise'
+TESTING = sys.argv[1:2] == ['test']
+HELPDESK_QUERY_BUDGET_MODE = 'log' if DEBUG and not TESTING else None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'helpdesk.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'helpdesk.queries': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'helpdesk.tasks': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 # Security settings for development
 SECURE_SSL_REDIRECT = False
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
 SECURE_BROWSER_XSS_FILTER = False
-SECURE_CONTENT_TYPE_NOSNIFF = False
-
-# Настройки для статических файлов в режиме разработки
-if DEBUG:
-    import mimetypes
-    mimetypes.add_type("application/javascript", ".js", True)
-    mimetypes.add_type("text/css", ".css", True)
\ No newline at end of file
+SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -1,13 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
+# MEDIA_URL не раздается: вложения доступны только через /files/ (проверка входа)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('helpdesk.urls')),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
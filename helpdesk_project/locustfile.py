@@ -0,0 +1,51 @@
+"""
+Нагрузочный сценарий для locust (pip install locust):
+
+    python manage.py runserver --noreload      # или gunicorn / uvicorn
+    locust -f locustfile.py --host http://127.0.0.1:8000 --headless -u 100 -r 10 -t 1m \
+        --json > locust.json
+
+Пользователь и пароль для входа — HELPDESK_BENCH_USER / HELPDESK_BENCH_PASSWORD
+(данные, созданные helpdesk.benchmark.generate_data, используют пароль benchmark).
+"""
+import os
+import random
+import re
+
+from locust import HttpUser, between, task
+
+SEARCH_QUERIES = ['принтер', 'не работает', 'зарплата отпуск', 'камера', 'пароль почта']
+PROBLEM_LINK_RE = re.compile(r'/problem/(\d+)/')
+
+
+class HelpdeskUser(HttpUser):
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.problem_ids = []
+        username = os.environ.get('HELPDESK_BENCH_USER')
+        if username:
+            self.client.get('/login/')
+            self.client.post('/login/', {
+                'username': username,
+                'password': os.environ.get('HELPDESK_BENCH_PASSWORD', 'benchmark'),
+                'csrfmiddlewaretoken': self.client.cookies.get('csrftoken', ''),
+            })
+
+    @task(5)
+    def problem_list(self):
+        response = self.client.get('/')
+        self.problem_ids = PROBLEM_LINK_RE.findall(response.text) or self.problem_ids
+
+    @task(2)
+    def search(self):
+        self.client.get('/', params={'query': random.choice(SEARCH_QUERIES)}, name='/?query=')
+
+    @task(1)
+    def filter_unsolved(self):
+        self.client.get('/', params={'status': 'unsolved'}, name='/?status=unsolved')
+
+    @task(3)
+    def problem_detail(self):
+        if self.problem_ids:
+            self.client.get(f'/problem/{random.choice(self.problem_ids)}/', name='/problem/[id]/')
@@ -0,0 +1,102 @@
+// Загрузка прикрепленных файлов частями до отправки формы.
+// Форма с атрибутом data-upload-url при отправке загружает файлы из
+// input[type=file] частями через PUT, добавляет скрытые поля uploads с id
+// загрузок и отправляет уже небольшую форму без файлов.
+(function() {
+    function getCsrfToken(form) {
+        const input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        return input ? input.value : '';
+    }
+
+    async function createUpload(form, file) {
+        const body = new FormData();
+        body.append('filename', file.name);
+        body.append('size', file.size);
+        const response = await fetch(form.dataset.uploadUrl, {
+            method: 'POST',
+            body: body,
+            headers: {'X-CSRFToken': getCsrfToken(form)},
+            credentials: 'same-origin'
+        });
+        if (!response.ok) throw new Error('Не удалось начать загрузку ' + file.name);
+        return response.json();
+    }
+
+    async function sendChunks(form, file, upload, onProgress) {
+        const url = form.dataset.uploadUrl + upload.id + '/';
+        let offset = upload.offset;
+        let attempts = 0;
+
+        while (offset < file.size) {
+            const end = Math.min(offset + upload.chunk_size, file.size);
+            let response;
+            try {
+                response = await fetch(url, {
+                    method: 'PUT',
+                    body: file.slice(offset, end),
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`,
+                        'X-CSRFToken': getCsrfToken(form)
+                    },
+                    credentials: 'same-origin'
+                });
+            } catch (e) {
+                response = null;
+            }
+
+            if (response && (response.ok || response.status === 409)) {
+                // При 409 сервер сообщает, с какого места продолжить
+                offset = (await response.json()).offset;
+                attempts = 0;
+                onProgress(offset / file.size);
+            } else if (++attempts > 5) {
+                throw new Error('Не удалось загрузить ' + file.name);
+            } else {
+                // Повторяем с текущего смещения на сервере
+                await new Promise(resolve => setTimeout(resolve, 1000 * attempts));
+                const status = await fetch(url, {credentials: 'same-origin'});
+                if (status.ok) offset = (await status.json()).offset;
+            }
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        document.querySelectorAll('form[data-upload-url]').forEach(function(form) {
+            const fileInput = form.querySelector('input[type="file"]');
+            if (!fileInput || !window.fetch) return;
+
+            form.addEventListener('submit', async function(e) {
+                if (!fileInput.files.length || form.dataset.uploading) return;
+                e.preventDefault();
+                form.dataset.uploading = '1';
+                const submitButton = form.querySelector('[type="submit"]');
+                if (submitButton) submitButton.disabled = true;
+
+                try {
+                    const files = Array.from(fileInput.files);
+                    for (const file of files) {
+                        const upload = await createUpload(form, file);
+                        await sendChunks(form, file, upload, function(progress) {
+                            if (submitButton) {
+                                submitButton.textContent = `Загрузка ${file.name}: ${Math.round(progress * 100)}%`;
+                            }
+                        });
+                        const hidden = document.createElement('input');
+                        hidden.type = 'hidden';
+                        hidden.name = 'uploads';
+                        hidden.value = upload.id;
+                        form.appendChild(hidden);
+                    }
+                    // Файлы уже на сервере — отправляем форму без них
+                    fileInput.value = '';
+                    form.submit();
+                } catch (error) {
+                    alert(error.message);
+                    delete form.dataset.uploading;
+                    if (submitButton) submitButton.disabled = false;
+                }
+            });
+        });
+    });
+})();